@@ -12,6 +12,12 @@ case ${2:-location} in
   fall)
     DATA='{"device_id":"DEV123","fall":true,"severity":"high"}'
     ;;
+  binary)
+    ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+    python3 "$ROOT/webapp/binary_ingest.py" --device DEV123 --rssi -45 --lat 37.7750 --lng -122.4195 \
+      | curl -sS -X POST "$URL" -H 'Content-Type: application/vnd.guardianlink.v1' --data-binary @- | jq || true
+    exit 0
+    ;;
   *)
     echo "Unknown type: $2"; exit 2
     ;;
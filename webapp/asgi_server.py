@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+GuardianLink async server
+Serves the same routes as server.py from one asyncio event loop
+
+The Flask server uses one OS thread per open /events stream. Here
+/events streams are coroutines fed by a single AsyncFanout, so an idle
+parent client costs a few kilobytes instead of a thread stack. /ingest,
+/api/status, /api/devices, /healthz and /metrics run on the same event
+loop as the BLE scanner. The remaining Flask routes (calibration, config,
+parent location, history, ...) run unchanged on a worker thread through a
+small WSGI bridge. State, business logic and background recorders are shared
+with server.py.
+
+Usage:
+    pip install -r requirements-async.txt
+    python asgi_server.py [--host 0.0.0.0] [--port 5001]
+    uvicorn asgi_server:app --port 5001
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+
+try:
+    from starlette.applications import Starlette
+    from starlette.datastructures import Headers, QueryParams
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+except ImportError as e:
+    raise ImportError("asgi_server.py needs the async extras: "
+                      "pip install -r requirements-async.txt") from e
+
+import server
+from broadcaster import AsyncFanout, FrameCompressor, parse_event_id
+import binary_ingest
+
+
+def json_response(body, status=200):
+    return Response(json.dumps(body, default=str), status_code=status,
+                    media_type="application/json")
+
+
+def request_mimetype(request):
+    return request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+
+
+# ============================================================================
+# NATIVE ROUTES (event loop)
+# ============================================================================
+
+class EventStream:
+    """
+    /events as a raw ASGI endpoint: one coroutine per client plus a small
+    task that notices the client disconnecting. Frames are bytes shared by
+    every client; a compressed stream (see server.sse_encoding) runs them
+    through its own FrameCompressor.
+    """
+
+    HEADERS = [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+        (b"vary", b"Accept-Encoding"),
+    ]
+
+    async def __call__(self, scope, receive, send):
+        fanout = scope["app"].state.fanout
+        headers = Headers(scope=scope)
+        encoding = server.sse_encoding(headers.get("accept-encoding"),
+                                       QueryParams(scope["query_string"]).get("compress"))
+        response_headers = self.HEADERS
+        if encoding is not None:
+            response_headers = response_headers + [(b"content-encoding", encoding.encode())]
+        sent = server.sse_bytes_total.labels(encoding or "identity")
+        last_event_id = parse_event_id(headers.get("last-event-id"))
+        client = fanout.add(server.broadcaster.resume(last_event_id))
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, client))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+            compress = FrameCompressor(encoding) if encoding is not None else None
+            async for frame in client.frames():
+                if compress is not None:
+                    frame = compress(frame)
+                sent.inc(len(frame))
+                await send({"type": "http.response.body", "body": frame, "more_body": True})
+        except OSError:
+            pass  # client went away mid-send
+        finally:
+            watcher.cancel()
+            fanout.remove(client)
+
+    @staticmethod
+    async def _watch_disconnect(receive, client):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        client.close()
+
+
+async def ingest(request):
+    """Same formats and responses as flask_routes.ingest()."""
+    body = await request.body()
+    result, status = server.ingest_response(request_mimetype(request), io.BytesIO(body))
+    return json_response(result, status)
+
+
+async def ingest_binary(request):
+    if request_mimetype(request) != binary_ingest.CONTENT_TYPE:
+        return json_response({
+            "ok": False,
+            "error": f"expected Content-Type {binary_ingest.CONTENT_TYPE}"
+        }, 415)
+    body = await request.body()
+    return json_response(server.ingest_batch(binary_ingest.iter_records(body)))
+
+
+async def get_status(request):
+    """Same as flask_routes.get_status(), but ?wait= long-polls without a thread."""
+    try:
+        wait = server.parse_status_wait(request.query_params.get("wait"))
+    except ValueError as e:
+        return json_response({"success": False, "error": str(e)}, 400)
+
+    key = request.query_params.get("device")
+    if_none_match = request.headers.get("if-none-match")
+    entry = server.cached_status(key)
+    if wait:
+        etag = if_none_match or entry.etag
+        clock = server.registry.clock
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            since = clock.version
+            entry = server.cached_status(key)
+            remaining = deadline - loop.time()
+            if entry.etag != etag or remaining <= 0:
+                break
+            await clock.wait_async(since, remaining)
+
+    status, headers, body = server.status_http(entry, if_none_match)
+    return Response(body, status_code=status, headers=headers)
+
+
+async def get_devices(request):
+    return json_response(server.devices_response(request.query_params.get("ids")))
+
+
+async def healthz(request):
+    return json_response(server.health_body())
+
+
+async def metrics_endpoint(request):
+    return Response(server.metrics.render(),
+                    headers={"Content-Type": server.METRICS_CONTENT_TYPE})
+
+
+# ============================================================================
+# WSGI BRIDGE (remaining Flask routes)
+# ============================================================================
+
+class WsgiBridge:
+    """
+    Minimal ASGI-to-WSGI adapter for the Flask routes that are not served
+    natively. Each request runs on the loop's default thread pool with
+    buffered request and response bodies (none of these routes stream).
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        environ = self._environ(scope, bytes(body))
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(None, self._run, environ)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    def _run(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return response["status"], response["headers"], content
+
+    @staticmethod
+    def _environ(scope, body):
+        server_name, server_port = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": "",
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server_name),
+            "SERVER_PORT": str(server_port),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = "HTTP_" + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+async def ble_scanner_task(stop_event):
+    """server.ble_scanner_loop, but on this server's event loop."""
+    print(f"BLE scanner started. Looking for device: {server.TARGET_DEVICE_NAME}")
+    make_scanner = server.ble_scanner_factory()
+    while not stop_event.is_set():
+        try:
+            await make_scanner().run(stop_event)
+        except Exception as e:
+            print(f"BLE scanner error: {e}")
+            server.ble_scanner_restarts.inc()
+            await asyncio.sleep(2.0)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    fanout = AsyncFanout(asyncio.get_running_loop(), server.SSE_BUFFER_SIZE,
+                         max_backlog=server.SSE_MAX_BACKLOG)
+    server.broadcaster.attach(fanout)
+    app.state.fanout = fanout
+
+    stop_event = server.start_background_threads(ble_thread=False)
+    scanner = None
+    if server.BLE_AVAILABLE or server.BLE_BACKEND == "fake":
+        scanner = asyncio.ensure_future(ble_scanner_task(stop_event))
+    try:
+        yield
+    finally:
+        stop_event.set()
+        if scanner is not None:
+            scanner.cancel()
+            await asyncio.gather(scanner, return_exceptions=True)
+        server.broadcaster.unsubscribe(fanout)
+
+
+app = Starlette(
+    routes=[
+        Route("/events", EventStream()),
+        Route("/ingest", ingest, methods=["POST"]),
+        Route("/ingest/binary", ingest_binary, methods=["POST"]),
+        Route("/api/status", get_status),
+        Route("/api/devices", get_devices),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics_endpoint),
+        Mount("", app=WsgiBridge(server.app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"],
+                           allow_headers=["*"], expose_headers=["ETag"])],
+    lifespan=lifespan,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GuardianLink async server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--backlog", type=int, default=4096,
+                        help="listen backlog (raise for connection bursts)")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    print("=" * 60)
+    print("GuardianLink Backend Server (async)")
+    print("=" * 60)
+    uvicorn.run(app, host=args.host, port=args.port, backlog=args.backlog,
+                log_level=args.log_level, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+GuardianLink automatic calibration
+Fits each bracelet's tx_power and path-loss exponent to (RSSI, true
+distance) points
+
+The log-distance model rssi = tx_power - 10 n log10(d) is a straight line
+in x = -10 log10(d): rssi = tx_power + n x. PathLossFit keeps weighted
+running sums of 1, x, y, x^2 and xy, so adding a point is O(1) and the
+weighted least-squares line is solved in closed form at any time. Points
+come from /api/calibrate (a measured distance) and from ground truth
+positions: the bracelet's own GPS fix, or a trilaterated fix, against the
+parent's fix.
+
+Until the points span enough distance to pin the slope (MIN_SPREAD), only
+tx_power is fitted and n stays at the configured exponent. A slope
+outside N_RANGE, e.g. from a few noisy ground-truth points, is handled
+the same way.
+
+Publishing a new fit resets the device's filter calibration and shifts its
+distances. AutoCalibration therefore rounds fitted values and only
+publishes when they moved by more than a tolerance, at most once per
+APPLY_INTERVAL per device.
+"""
+import json
+import math
+import os
+
+# Total point weight before a device gets a fitted profile (one
+# /api/calibrate point, or several ground-truth points)
+MIN_WEIGHT = 1.0
+
+# Weighted standard deviation of 10 log10(distance) in dB the points need
+# before the exponent is fitted too (3 dB ~ distances a factor of 2 apart)
+MIN_SPREAD = 3.0
+
+# Plausible path-loss exponents; a fitted slope outside is not used
+N_RANGE = (1.5, 6.0)
+
+# Published values are rounded (tx_power to 0.1 dB, n to 0.01) and only
+# republished once the fit moved by TX_TOLERANCE dB or N_TOLERANCE
+TX_TOLERANCE = 0.5
+N_TOLERANCE = 0.05
+
+# Seconds between two publications for one device (forced ones excepted)
+APPLY_INTERVAL = 5.0
+
+
+class PathLossFit:
+    """Running sums of one device's weighted (x, rssi) points."""
+
+    __slots__ = ("count", "w", "wx", "wy", "wxx", "wxy")
+
+    def __init__(self, count=0, w=0.0, wx=0.0, wy=0.0, wxx=0.0, wxy=0.0):
+        self.count = count
+        self.w = w
+        self.wx = wx
+        self.wy = wy
+        self.wxx = wxx
+        self.wxy = wxy
+
+    def add(self, rssi, distance, weight=1.0):
+        """Add one point: `rssi` measured at `distance` meters."""
+        if not distance > 0:
+            raise ValueError("distance must be > 0")
+        x = -10.0 * math.log10(distance)
+        self.count += 1
+        self.w += weight
+        self.wx += weight * x
+        self.wy += weight * rssi
+        self.wxx += weight * x * x
+        self.wxy += weight * x * rssi
+
+    def spread(self):
+        """Weighted standard deviation of x, in dB."""
+        if self.w <= 0:
+            return 0.0
+        mean_x = self.wx / self.w
+        return math.sqrt(max(0.0, self.wxx / self.w - mean_x * mean_x))
+
+    def solve(self, default_n):
+        """
+        Fitted (tx_power, path_loss_exponent), or None below MIN_WEIGHT.
+        The exponent is `default_n` unless the points pin it down.
+        """
+        if self.w < MIN_WEIGHT:
+            return None
+        mean_x = self.wx / self.w
+        mean_y = self.wy / self.w
+        variance = self.wxx / self.w - mean_x * mean_x
+        n = default_n
+        if variance >= MIN_SPREAD * MIN_SPREAD:
+            slope = (self.wxy / self.w - mean_x * mean_y) / variance
+            if N_RANGE[0] <= slope <= N_RANGE[1]:
+                n = slope
+        return mean_y - n * mean_x, n
+
+    def to_list(self):
+        return [self.count, self.w, self.wx, self.wy, self.wxx, self.wxy]
+
+
+class AutoCalibration:
+    """
+    Every device's PathLossFit and the parameters last published for it.
+    Not thread-safe; the server calls it under its state lock.
+    """
+
+    def __init__(self, apply_interval=APPLY_INTERVAL):
+        self.apply_interval = apply_interval
+        self.fits = {}  # device_id -> PathLossFit
+        self.published = {}  # device_id -> (tx_power, path_loss_exponent)
+        self._published_at = {}
+        self.dirty = False  # changed since loaded or last saved (the caller clears it)
+
+    def __len__(self):
+        return len(self.fits)
+
+    def add(self, device_id, rssi, distance, weight=1.0):
+        """Add a point to a device's fit and return the fit."""
+        fit = self.fits.get(device_id)
+        if fit is None:
+            fit = self.fits[device_id] = PathLossFit()
+        fit.add(rssi, distance, weight)
+        self.dirty = True
+        return fit
+
+    def update(self, device_id, default_n, now, force=False):
+        """
+        The device's fitted (tx_power, path_loss_exponent) if it should be
+        published now, else None. `force` skips the interval and
+        tolerance checks (an explicit calibration).
+        """
+        fit = self.fits.get(device_id)
+        params = fit.solve(default_n) if fit is not None else None
+        if params is None:
+            return None
+        tx_power, n = round(params[0], 1), round(params[1], 2)
+        current = self.published.get(device_id)
+        if not force and current is not None:
+            if now - self._published_at.get(device_id, 0.0) < self.apply_interval:
+                return None
+            if abs(tx_power - current[0]) < TX_TOLERANCE and abs(n - current[1]) < N_TOLERANCE:
+                return None
+        self.published[device_id] = (tx_power, n)
+        self._published_at[device_id] = now
+        self.dirty = True
+        return tx_power, n
+
+    def reset(self, device_id):
+        """Forget a device's points; True if it had any."""
+        self.published.pop(device_id, None)
+        self._published_at.pop(device_id, None)
+        if self.fits.pop(device_id, None) is None:
+            return False
+        self.dirty = True
+        return True
+
+    def describe(self, device_id):
+        """Fit summary for the API, or None for a device without points."""
+        fit = self.fits.get(device_id)
+        if fit is None:
+            return None
+        published = self.published.get(device_id)
+        return {
+            "points": fit.count,
+            "weight": round(fit.w, 2),
+            "spread_db": round(fit.spread(), 1),
+            "tx_power": published[0] if published else None,
+            "path_loss_exponent": published[1] if published else None,
+        }
+
+    def to_dict(self):
+        devices = {}
+        for device_id, fit in self.fits.items():
+            item = devices[device_id] = {"sums": fit.to_list()}
+            published = self.published.get(device_id)
+            if published is not None:
+                item["tx_power"], item["path_loss_exponent"] = published
+        return {"devices": devices}
+
+    def load(self, path):
+        """Replace the fits with those saved at `path` (missing file = none)."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        fits, published = {}, {}
+        for device_id, item in data.get("devices", {}).items():
+            fits[device_id] = PathLossFit(*item["sums"])
+            if "tx_power" in item:
+                published[device_id] = (float(item["tx_power"]), float(item["path_loss_exponent"]))
+        self.fits, self.published, self._published_at = fits, published, {}
+        self.dirty = False
+        return len(fits)
+
+    def save(self, path, data=None):
+        """
+        Write the fits to `path` atomically (temp file + rename). `data`
+        is a to_dict() taken earlier, so the caller can release its lock
+        before the write.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data if data is not None else self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
@@ -0,0 +1,154 @@
+"""
+GuardianLink batch ingest parsing
+Incremental readers for JSON-array and NDJSON request bodies
+"""
+import codecs
+import json
+
+# Bytes read from the request stream per chunk
+CHUNK_SIZE = 64 * 1024
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+_WHITESPACE = " \t\r\n"
+
+
+def iter_ndjson(stream):
+    """
+    Yield (record, error) pairs from a newline-delimited JSON stream.
+
+    Lines are decoded as they arrive, so a chunked upload is processed
+    before the client has finished sending. A bad line yields an error and
+    parsing continues with the next one.
+    """
+    for raw in _iter_lines(stream):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None, "invalid json"
+            continue
+        if not isinstance(record, dict):
+            yield None, "expected object"
+            continue
+        yield record, None
+
+
+def _iter_lines(stream):
+    # Always fixed-size reads split by hand: iterating a request stream
+    # (Werkzeug's LimitedStream) costs one readline() call per line
+    pending = b""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield (record, error) pairs from a top-level JSON array, decoding each
+    element as soon as it is complete instead of buffering the whole body.
+
+    A malformed element, or a comma out of place (leading, doubled,
+    trailing or missing), cannot be skipped reliably, so it yields an
+    error and ends the iteration.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    # What may come next: an element or "]" right after "[", "," or "]"
+    # after an element, and only an element after ","
+    after_element = False
+    after_comma = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+
+        if pos == len(buf):
+            if eof:
+                yield None, "unterminated array"
+                return
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            continue
+
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                yield None, "expected array"
+                return
+            started = True
+            pos += 1
+            continue
+        if ch == "]" and not after_comma:
+            return
+        if ch == "," and after_element:
+            after_element, after_comma = False, True
+            pos += 1
+            continue
+        if after_element or ch in ",]":
+            yield None, "invalid json"
+            return
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                yield None, "invalid json"
+                return
+            # Element is split across chunks; read more and retry
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            continue
+
+        pos = end
+        after_element, after_comma = True, False
+        if isinstance(record, dict):
+            yield record, None
+        else:
+            yield None, "expected object"
+
+
+class PrefixedStream:
+    """Read-only stream that replays `head` before continuing with `stream`."""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if self._head:
+            if size < 0 or size >= len(self._head):
+                data, self._head = self._head, b""
+                if size < 0:
+                    data += self._stream.read()
+                return data
+            data, self._head = self._head[:size], self._head[size:]
+            return data
+        return self._stream.read(size)
+
+
+def peek_stream(stream, chunk_size=CHUNK_SIZE):
+    """
+    Read the first chunk of `stream` and return (first_byte, stream) where
+    first_byte is the first non-whitespace byte (b"" for an empty body) and
+    stream still yields the whole body.
+    """
+    head = stream.read(chunk_size)
+    return head.lstrip()[:1], PrefixedStream(head, stream)
+
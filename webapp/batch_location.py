@@ -0,0 +1,93 @@
+"""
+GuardianLink batch location math
+NumPy versions of the scalar location/bearing helpers in server.py,
+for recomputing many devices or samples at once (calibration changes,
+parent moves, history replay).
+
+Each function mirrors its scalar counterpart formula for formula, including
+the final rounding, and accepts scalars or array-likes that broadcast
+against each other.
+"""
+# NumPy is optional: callers check numpy_available() and fall back to the
+# scalar functions one sample at a time. It is imported on that first
+# check rather than with this module, because it adds ~60 ms to startup
+# and is only needed once many devices are tracked.
+np = None
+_numpy_checked = False
+
+
+def numpy_available():
+    """Import NumPy on first use; False if it is not installed."""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except Exception:
+            np = None
+        _numpy_checked = True
+    return np is not None
+
+
+EARTH_RADIUS = 6371000  # meters
+
+DIRECTIONS = ('north', 'northeast', 'east', 'southeast',
+              'south', 'southwest', 'west', 'northwest')
+
+
+def calculate_child_location_batch(parent_lat, parent_lng, distance, bearing):
+    """
+    Vectorized calculate_child_location (destination point on a sphere).
+
+    Returns:
+        (child_lat, child_lng) float64 arrays rounded to 6 decimals
+    """
+    lat1 = np.radians(np.asarray(parent_lat, dtype=np.float64))
+    lng1 = np.radians(np.asarray(parent_lng, dtype=np.float64))
+    bearing_rad = np.radians(np.asarray(bearing, dtype=np.float64))
+    angular = np.asarray(distance, dtype=np.float64) / EARTH_RADIUS
+
+    sin_lat1 = np.sin(lat1)
+    cos_lat1 = np.cos(lat1)
+    sin_ang = np.sin(angular)
+    cos_ang = np.cos(angular)
+
+    lat2 = np.arcsin(sin_lat1 * cos_ang + cos_lat1 * sin_ang * np.cos(bearing_rad))
+    lng2 = lng1 + np.arctan2(
+        np.sin(bearing_rad) * sin_ang * cos_lat1,
+        cos_ang - sin_lat1 * np.sin(lat2)
+    )
+
+    return np.round(np.degrees(lat2), 6), np.round(np.degrees(lng2), 6)
+
+
+def calculate_bearing_batch(lat1, lng1, lat2, lng2):
+    """
+    Vectorized calculate_bearing.
+
+    Returns:
+        float64 array of bearings in degrees (0-360)
+    """
+    lat1_rad = np.radians(np.asarray(lat1, dtype=np.float64))
+    lat2_rad = np.radians(np.asarray(lat2, dtype=np.float64))
+    lng_diff = np.radians(np.asarray(lng2, dtype=np.float64) - np.asarray(lng1, dtype=np.float64))
+
+    x = np.sin(lng_diff) * np.cos(lat2_rad)
+    y = np.cos(lat1_rad) * np.sin(lat2_rad) - \
+        np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(lng_diff)
+
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def bearing_to_direction_batch(bearing):
+    """
+    Vectorized bearing_to_direction.
+
+    np.rint rounds half to even exactly like Python's round(), so sectors
+    match the scalar version on the 22.5 degree boundaries too.
+
+    Returns:
+        array of cardinal direction strings
+    """
+    index = np.rint(np.asarray(bearing, dtype=np.float64) / 45).astype(np.int64) % 8
+    return np.asarray(DIRECTIONS)[index]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Sharded server throughput benchmark
+Starts cluster.py with 1, 2, 4 ... workers and drives each with the same
+synthetic loadgen.py workload at full speed, then reports ingest
+throughput and latency per worker count.
+
+Usage:
+    python benchmarks/bench_cluster.py
+    python benchmarks/bench_cluster.py --workers 1 2 4 8 --devices 2000 --batch 100
+    python benchmarks/bench_cluster.py --json benchmarks/results/cluster.json
+
+The load generator runs on the same machine, so it competes with the
+workers for cores: run it on a host with more cores than the largest
+worker count, or the numbers measure the machine rather than the
+cluster. Every event and snapshot is relayed to every worker, so the
+bus cost per worker grows with the number of workers. The server runs
+with SIMULATOR=0, HISTORY_DB="", GEOFENCES_FILE="",
+CALIBRATION_PROFILES_FILE="" and TRACE_FILE="" unless those are set in
+the environment.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBAPP = os.path.join(HERE, "..")
+sys.path.insert(0, WEBAPP)
+
+import loadgen  # noqa: E402
+
+
+def cluster_env():
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    for name, value in (("SIMULATOR", "0"), ("HISTORY_DB", ""), ("GEOFENCES_FILE", ""),
+                        ("CALIBRATION_PROFILES_FILE", ""), ("TRACE_FILE", "")):
+        env.setdefault(name, value)
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def healthy(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        conn.request("GET", "/healthz")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def run_cluster(workers, items, args):
+    """loadgen results for one cluster of `workers` workers."""
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, "cluster.py", "--workers", str(workers),
+                             "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=WEBAPP, env=cluster_env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.perf_counter() + 30
+        while not healthy(port):
+            if proc.poll() is not None:
+                sys.exit(f"cluster.py exited with status {proc.returncode}")
+            if time.perf_counter() > deadline:
+                sys.exit("cluster.py did not answer /healthz within 30 s")
+            time.sleep(0.05)
+        # Give every worker time to connect to the bus and bind
+        time.sleep(0.5)
+        return loadgen.run_load(f"http://127.0.0.1:{port}", items, None, args.concurrency,
+                                args.batch, measure_sse=not args.no_sse)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cluster.py throughput by worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=20.0,
+                        help="seconds of synthetic traffic at 1 Hz per device")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel connections")
+    parser.add_argument("--batch", type=int, default=1, help="samples per request")
+    parser.add_argument("--no-sse", action="store_true", help="skip SSE latency measurement")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    items = loadgen.synthetic_workload(args.devices, 1.0, args.duration)
+    cores = os.cpu_count() or 1
+    print(f"{len(items)} samples, {args.devices} devices, concurrency={args.concurrency}, "
+          f"batch={args.batch}, {cores} cores")
+    if max(args.workers) >= cores:
+        print(f"warning: {max(args.workers)} workers plus the load generator on {cores} cores; "
+              "scaling is not measurable here", file=sys.stderr)
+
+    print(f"{'workers':>8}{'samples/s':>12}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    results = []
+    base = None
+    for workers in args.workers:
+        result = run_cluster(workers, items, args)
+        rate = result["samples_per_s"] or 0.0
+        base = base or rate
+        results.append(dict(result, workers=workers))
+        print(f"{workers:>8}{rate:>12,.0f}{rate / base if base else 0:>9.2f}"
+              f"{result['ingest_p50_ms']:>9}{result['ingest_p99_ms']:>9}{result['errors']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cores": cores, "python": platform.python_version(),
+                       "devices": args.devices, "concurrency": args.concurrency,
+                       "batch": args.batch, "runs": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+RSSI filter benchmark
+Per-sample update cost and proximity-zone flapping for each filter in
+rssi_filters.py, on a recorded trace or a synthetic walk.
+
+Usage:
+    python benchmarks/bench_rssi_filters.py
+    python benchmarks/bench_rssi_filters.py --trace trace.ndjson [--device DEV123]
+
+Trace files are NDJSON (one object per line with an "rssi" field and
+optionally "device_id", as written by trace_recorder.py) or CSV with an
+"rssi" column.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rssi_filters import make_filter  # noqa: E402
+from calibration import DEFAULT_ZONE_THRESHOLDS  # noqa: E402
+
+TX_POWER = -60
+PATH_LOSS_EXPONENT = 3.5
+
+# server.get_proximity_zone's default thresholds
+ZONE_THRESHOLDS = DEFAULT_ZONE_THRESHOLDS
+
+# Filter configurations compared by default
+CONFIGS = [
+    ("moving_average", {"window": 3}),
+    ("moving_average", {"window": 10}),
+    ("ema", {"alpha": 0.3}),
+    ("ema", {"alpha": 0.1}),
+    ("kalman", {"q": 0.002, "r": 16.0}),
+    ("kalman", {"q": 0.0005, "r": 16.0}),
+]
+
+
+def zone_index(rssi):
+    for i, threshold in enumerate(ZONE_THRESHOLDS):
+        if rssi > threshold:
+            return i
+    return len(ZONE_THRESHOLDS)
+
+
+def synthetic_trace(seconds=600, rate_hz=10, noise_db=4.0, seed=7):
+    """
+    A child wandering between 1 m and 25 m from the receiver, sampled at
+    `rate_hz`, with Gaussian shadowing noise on the log-distance model.
+
+    Returns:
+        (raw_rssi, true_rssi) lists
+    """
+    rng = random.Random(seed)
+    raw, truth = [], []
+    distance = 3.0
+    velocity = 0.0
+    for _ in range(seconds * rate_hz):
+        velocity = 0.95 * velocity + rng.gauss(0, 0.05)
+        distance = min(25.0, max(1.0, distance + velocity / rate_hz * 10))
+        clean = TX_POWER - 10 * PATH_LOSS_EXPONENT * math.log10(distance)
+        truth.append(clean)
+        raw.append(round(clean + rng.gauss(0, noise_db)))
+    return raw, truth
+
+
+def load_trace(path, device=None):
+    """Read raw RSSI values from an NDJSON or CSV trace file."""
+    values = []
+    with open(path) as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                row_device = row.get("device_id", row.get("device"))
+                if row.get("rssi") and (device is None or row_device == device):
+                    values.append(float(row["rssi"]))
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                if rec.get("rssi") is None:
+                    continue
+                if device is not None and rec.get("device_id", rec.get("device")) != device:
+                    continue
+                values.append(float(rec["rssi"]))
+    return values
+
+
+def update_cost_ns(name, params, samples, repeat=5):
+    """Best-of-`repeat` mean nanoseconds per update() call."""
+    best = float("inf")
+    for _ in range(repeat):
+        flt = make_filter(name, TX_POWER, PATH_LOSS_EXPONENT, **params)
+        update = flt.update
+        start = time.perf_counter_ns()
+        for rssi in samples:
+            update(rssi)
+        best = min(best, (time.perf_counter_ns() - start) / len(samples))
+    return best
+
+
+def evaluate(name, params, raw, truth, rate_hz):
+    """Zone changes per minute and, when ground truth is known, RMSE in dB."""
+    flt = make_filter(name, TX_POWER, PATH_LOSS_EXPONENT, **params)
+    changes = 0
+    previous = None
+    sq_err = 0.0
+    for i, rssi in enumerate(raw):
+        value = flt.update(rssi)
+        zone = zone_index(value)
+        if previous is not None and zone != previous:
+            changes += 1
+        previous = zone
+        if truth is not None:
+            sq_err += (value - truth[i]) ** 2
+    minutes = len(raw) / rate_hz / 60.0
+    rmse = math.sqrt(sq_err / len(raw)) if truth is not None else None
+    return changes / minutes, rmse
+
+
+def true_zone_changes(truth, rate_hz):
+    """Zone changes per minute of the noiseless synthetic signal."""
+    changes = sum(1 for a, b in zip(truth, truth[1:]) if zone_index(a) != zone_index(b))
+    return changes / (len(truth) / rate_hz / 60.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--trace", help="NDJSON/CSV trace file (default: synthetic walk)")
+    parser.add_argument("--device", help="only use samples from this device")
+    parser.add_argument("--rate", type=float, default=10.0, help="trace sample rate in Hz")
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    if args.trace:
+        raw, truth = load_trace(args.trace, args.device), None
+        source = args.trace
+    else:
+        raw, truth = synthetic_trace(rate_hz=int(args.rate))
+        source = "synthetic"
+    if not raw:
+        sys.exit("trace has no RSSI samples")
+
+    results = []
+    if truth is not None:
+        true_flaps = true_zone_changes(truth, args.rate)
+        print(f"trace: {source}, {len(raw)} samples, true zone changes/min: {true_flaps:.2f}")
+    else:
+        print(f"trace: {source}, {len(raw)} samples")
+    print(f"{'filter':<16}{'params':<24}{'ns/update':>10}{'zone chg/min':>14}{'rmse dB':>9}")
+    for name, params in CONFIGS:
+        cost = update_cost_ns(name, params, raw)
+        flaps, rmse = evaluate(name, params, raw, truth, args.rate)
+        results.append({"filter": name, "params": params, "ns_per_update": round(cost, 1),
+                        "zone_changes_per_min": round(flaps, 2),
+                        "rmse_db": round(rmse, 2) if rmse is not None else None})
+        print(f"{name:<16}{json.dumps(params):<24}{cost:>10.0f}{flaps:>14.2f}"
+              f"{(f'{rmse:.2f}' if rmse is not None else '-'):>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"trace": source, "samples": len(raw), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
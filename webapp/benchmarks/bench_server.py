@@ -0,0 +1,694 @@
+#!/usr/bin/env python3
+"""
+server.py benchmark suite
+Times the per-sample hot paths in isolation and end-to-end through the
+Flask test client, and saves the results as JSON for regression tracking.
+
+Usage:
+    python benchmarks/bench_server.py
+    python benchmarks/bench_server.py --filter ingest --quick
+    python benchmarks/bench_server.py --json results/v1.1.json --compare results/v1.0.json
+
+Each case reports the best and median time per operation over several
+repeats. The iteration count is calibrated so each repeat runs for at
+least --min-time seconds. --compare flags cases that got slower than the
+baseline by more than --threshold. With --fail-on-regression the exit
+status is 1 when any case regressed, so the suite can gate a release.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+# Keep the benchmark from writing history.db or fitted calibration
+# profiles next to the server
+os.environ.setdefault("HISTORY_DB", "")
+os.environ.setdefault("CALIBRATION_PROFILES_FILE", "")
+
+import server  # noqa: E402
+import binary_ingest  # noqa: E402
+from broadcaster import FrameCompressor, encode_frame  # noqa: E402
+from device_registry import DeviceRegistry  # noqa: E402
+from event_bus import BusHub, UnixSocketBus  # noqa: E402
+from geofence import CircleZone, GeofenceEngine  # noqa: E402
+import trilateration  # noqa: E402
+from trilateration import ObservationWindow  # noqa: E402
+
+PARENT = {"lat": 37.7749, "lng": -122.4194, "heading": 45.0}
+
+# Devices tracked when benchmarking the bulk endpoints
+FLEET_SIZE = 1000
+
+# Items per batch in the batch-ingest cases
+BATCH_SIZE = 100
+
+
+# ============================================================================
+# HARNESS
+# ============================================================================
+
+def reset_state(parent=True):
+    """Fresh registry and subscriber list; optionally a parent GPS fix."""
+    server.registry = server.snapshots = DeviceRegistry()
+    server.broadcaster = server.EventBroadcaster()
+    server.geofences = GeofenceEngine()
+    server.parent_location = dict(PARENT) if parent else {"lat": None, "lng": None, "heading": None}
+
+
+def discard_frames(subs):
+    """Empty never-read subscribers so they neither pin memory nor overflow."""
+    for sub in subs:
+        sub._statuses.clear()
+        sub._alerts.clear()
+
+
+def rssi_cycle(n=64):
+    """A repeating walk between -50 and -80 dBm."""
+    return [-50 - (i * 7) % 31 for i in range(n)]
+
+
+def measure(fn, min_time, repeat):
+    """
+    Run `fn(number)` (which performs `number` operations) until each
+    repeat takes at least `min_time`, and return seconds per operation
+    for every repeat.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        fn(number)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        fn(number)
+        timings.append((time.perf_counter() - start) / number)
+    return number, timings
+
+
+# ============================================================================
+# CASES
+# ============================================================================
+#
+# Each case is a setup function returning `run(number)`; `ops` is the
+# number of samples one operation stands for (batches count every item).
+
+CASES = []
+
+
+def case(name, ops=1):
+    def register(setup):
+        CASES.append((name, ops, setup))
+        return setup
+    return register
+
+
+@case("calibration distance[default profile]")
+def _calibration_distance():
+    # What update_device_state and recompute_devices run per device
+    values = rssi_cycle()
+    profile = server.config.calibration.profile(None)
+
+    def run(number):
+        distance = profile.distance
+        for i in range(number):
+            distance(values[i & 63])
+    return run
+
+
+@case("calibration lookup[distance + zone]")
+def _calibration_lookup():
+    values = rssi_cycle()
+    profile = server.config.calibration.default
+
+    def run(number):
+        lookup = profile.lookup
+        for i in range(number):
+            lookup(values[i & 63])
+    return run
+
+
+@case("calibration lookup[fitted, formula]")
+def _calibration_lookup_fitted():
+    from calibration import FittedProfile
+
+    values = rssi_cycle()
+    profile = FittedProfile(-58.3, 2.87)
+
+    def run(number):
+        lookup = profile.lookup
+        for i in range(number):
+            lookup(values[i & 63])
+    return run
+
+
+@case("calibration rebuild[tables]")
+def _calibration_rebuild():
+    from calibration import CalibrationProfile
+
+    def run(number):
+        for i in range(number):
+            CalibrationProfile(-60 + (i & 7), 3.5)
+    return run
+
+
+@case("add_calibration_point[fit + publish check]")
+def _add_calibration_point():
+    reset_state()
+    server.autocal = server.AutoCalibration()
+    server.add_calibration_point("BENCH", -60, 1.0, force=True)
+    values = rssi_cycle()
+    add = server.add_calibration_point
+
+    def run(number):
+        with server.state_lock:
+            for i in range(number):
+                add("BENCH", values[i & 63], 1.0 + (i & 31), 0.2, now=0.0)
+    return run
+
+
+@case("watchdog seen[100k devices]")
+def _watchdog_seen():
+    from watchdog import Watchdog
+    dog = Watchdog(5.0, 0.25, 0.0)
+    keys = [f"DEV{i}" for i in range(100_000)]
+    for key in keys:
+        dog.seen(key, 0.0)
+
+    def run(number):
+        seen = dog.seen
+        for i in range(number):
+            seen(keys[i % 100_000], 1.0)
+    return run
+
+
+@case("watchdog tick[100k armed devices]")
+def _watchdog_tick():
+    from watchdog import Watchdog
+    # Devices that keep reporting never fire; a tick only advances the
+    # wheel (and now and then cascades a slot), whatever the fleet size
+    dog = Watchdog(1e6, 0.25, 0.0)
+    for i in range(100_000):
+        dog.seen(f"DEV{i}", i * 10.0)
+    clock = [0.0]
+
+    def run(number):
+        expire = dog.expire
+        now = clock[0]
+        for _ in range(number):
+            now += 0.25
+            expire(now)
+        clock[0] = now
+    return run
+
+
+@case("smooth_rssi")
+def _smooth_rssi():
+    reset_state()
+    device = server.registry.get_or_create("BENCH")
+    values = rssi_cycle()
+    smooth = server.smooth_rssi
+
+    def run(number):
+        for i in range(number):
+            smooth(device, values[i & 63])
+    return run
+
+
+@case("detect_fall")
+def _detect_fall():
+    reset_state()
+    device = server.registry.get_or_create("BENCH")
+    values = rssi_cycle()
+    detect = server.detect_fall
+
+    def run(number):
+        for i in range(number):
+            detect(device, values[i & 63], i * 0.5)
+    return run
+
+
+@case("calculate_child_location")
+def _calculate_child_location():
+    distances = [0.5 + (i % 40) for i in range(64)]
+    calc = server.calculate_child_location
+
+    def run(number):
+        for i in range(number):
+            calc(PARENT["lat"], PARENT["lng"], distances[i & 63], PARENT["heading"])
+    return run
+
+
+@case("update_device_state")
+def _update_device_state():
+    reset_state()
+    values = rssi_cycle()
+    update = server.update_device_state
+
+    def run(number):
+        for i in range(number):
+            update(values[i & 63], "AA:BB:CC:DD:EE:FF")
+    return run
+
+
+@case("update_device_state[1k devices, 10 subscribers]")
+def _update_device_state_fleet():
+    reset_state()
+    subs = [server.broadcaster.subscribe() for _ in range(10)]
+    addresses = [f"AA:BB:CC:00:{i >> 8:02X}:{i & 255:02X}" for i in range(FLEET_SIZE)]
+    values = rssi_cycle()
+    update = server.update_device_state
+
+    def run(number):
+        for i in range(number):
+            update(values[i & 63], addresses[i % FLEET_SIZE])
+            if i & 255 == 255:
+                discard_frames(subs)
+        discard_frames(subs)
+    return run
+
+
+@case("geofence update[10k zones]")
+def _geofence_update():
+    engine = GeofenceEngine()
+    # 100 x 100 circles of 100 m on a ~300 m grid around the parent
+    engine.extend(CircleZone(None, "bench", PARENT["lat"] + (i // 100) * 0.003,
+                             PARENT["lng"] + (i % 100) * 0.003, 100) for i in range(10000))
+    points = [(PARENT["lat"] + (i * 7 % 64) * 0.0047, PARENT["lng"] + (i * 13 % 64) * 0.0047)
+              for i in range(64)]
+    update = engine.update
+
+    def run(number):
+        for i in range(number):
+            lat, lng = points[i & 63]
+            update(i & 1023, lat, lng)
+    return run
+
+
+@case("trilateration solve[4 observers]")
+def _trilateration_solve():
+    # Gateways on a ~44 m square, noisy distances to a child inside it
+    window = ObservationWindow()
+    corners = ((0, 0), (0.0004, 0), (0, 0.0005), (0.0004, 0.0005))
+    for k, ((dlat, dlng), distance) in enumerate(zip(corners, (19.0, 35.0, 32.0, 44.0))):
+        window.add(f"gw{k}", PARENT["lat"] + dlat, PARENT["lng"] + dlng, distance, 0.0)
+    solve = trilateration.solve
+
+    def run(number):
+        for _ in range(number):
+            solve(window, 1.0)
+    return run
+
+
+@case("observe_device[1k devices, 4 observers]")
+def _observe_device():
+    reset_state()
+    observers = [(f"gw{k}", PARENT["lat"] + dlat, PARENT["lng"] + dlng)
+                 for k, (dlat, dlng) in enumerate(((0, 0), (0.0004, 0), (0, 0.0005), (0.0004, 0.0005)))]
+    addresses = [f"AA:BB:CC:00:{i >> 8:02X}:{i & 255:02X}" for i in range(FLEET_SIZE)]
+    values = rssi_cycle()
+    observe = server.observe_device
+
+    def run(number):
+        for i in range(number):
+            observer, lat, lng = observers[i & 3]
+            observe(values[i & 63], addresses[(i >> 2) % FLEET_SIZE], observer, lat, lng)
+    return run
+
+
+@case("sse_encode[status_update]")
+def _sse_encode_status():
+    reset_state()
+    device = server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+    payload = server.status_event(device)
+
+    def run(number):
+        for _ in range(number):
+            encode_frame(payload)
+    return run
+
+
+@case("sse_encode[status_body]")
+def _sse_encode_full():
+    reset_state()
+    device = server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+
+    def run(number):
+        for _ in range(number):
+            encode_frame(server.status_body(device.snapshot, server.parent_location))
+    return run
+
+
+@case("sse_compress[status_update, gzip]")
+def _sse_compress_status():
+    reset_state()
+    device = server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+    frames = [encode_frame(dict(server.status_event(device), rssi=rssi), i)
+              for i, rssi in enumerate(rssi_cycle())]
+    compress = FrameCompressor("gzip")
+
+    def run(number):
+        for i in range(number):
+            compress(frames[i & 63])
+    return run
+
+
+@case("sse_publish[100 subscribers]")
+def _sse_publish():
+    reset_state()
+    subs = [server.broadcaster.subscribe() for _ in range(100)]
+    payload = {"type": "location", "device": "AA:BB:CC:DD:EE:FF", "rssi": -62}
+    publish = server.broadcaster.publish
+
+    def run(number):
+        for i in range(number):
+            publish(payload)
+            if i & 255 == 255:
+                discard_frames(subs)
+        discard_frames(subs)
+    return run
+
+
+@case("sse_publish_status[delta, 100 subscribers]")
+def _sse_publish_status():
+    reset_state()
+    subs = [server.broadcaster.subscribe() for _ in range(100)]
+    device = server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+    payloads = [dict(server.status_event(device), rssi=rssi) for rssi in rssi_cycle()]
+    publish_status = server.broadcaster.publish_status
+
+    def run(number):
+        for i in range(number):
+            publish_status(payloads[i & 63])
+        discard_frames(subs)
+    return run
+
+
+@case("event bus relay[unix socket, 2 workers]")
+def _event_bus_relay():
+    hub = BusHub(os.path.join(tempfile.mkdtemp(), "bus.sock"))
+    threading.Thread(target=hub.run, daemon=True).start()
+    received = threading.Semaphore(0)
+    buses = [UnixSocketBus(hub.path, shard) for shard in range(2)]
+    for bus in buses:
+        bus.subscribe(lambda topic, message, seq: received.release())
+    payload = {"type": "location", "device": "AA:BB:CC:DD:EE:FF", "rssi": -62}
+
+    def run(number):
+        for _ in range(number):
+            buses[0].publish("event", payload)
+        for _ in range(len(buses) * number):
+            received.acquire()
+    return run
+
+
+@case("e2e GET /events frame")
+def _e2e_events():
+    reset_state()
+    client = server.app.test_client()
+    response = client.get("/events", buffered=False)
+    frames = iter(response.response)
+    next(frames)  # opening keepalive
+    payload = {"type": "location", "device": "AA:BB:CC:DD:EE:FF", "rssi": -62}
+    publish = server.broadcaster.publish
+
+    def run(number):
+        for _ in range(number):
+            publish(payload)
+            next(frames)
+    return run
+
+
+@case("e2e GET /events frame[gzip]")
+def _e2e_events_gzip():
+    reset_state()
+    client = server.app.test_client()
+    response = client.get("/events?compress=1", headers={"Accept-Encoding": "gzip"},
+                          buffered=False)
+    frames = iter(response.response)
+    next(frames)  # opening keepalive
+    payload = {"type": "location", "device": "AA:BB:CC:DD:EE:FF", "rssi": -62}
+    publish = server.broadcaster.publish
+
+    def run(number):
+        for _ in range(number):
+            publish(payload)
+            next(frames)
+    return run
+
+
+@case("e2e POST /ingest rssi")
+def _e2e_ingest_rssi():
+    reset_state()
+    client = server.app.test_client()
+    bodies = [json.dumps({"device_id": "DEV1", "rssi": v}) for v in rssi_cycle()]
+
+    def run(number):
+        for i in range(number):
+            client.post("/ingest", data=bodies[i & 63], content_type="application/json")
+    return run
+
+
+@case("e2e POST /ingest location")
+def _e2e_ingest_location():
+    reset_state()
+    client = server.app.test_client()
+    bodies = [json.dumps({"device_id": "DEV1", "rssi": v, "lat": 37.77 + i * 1e-5, "lng": -122.41})
+              for i, v in enumerate(rssi_cycle())]
+
+    def run(number):
+        for i in range(number):
+            client.post("/ingest", data=bodies[i & 63], content_type="application/json")
+    return run
+
+
+def _batch_records():
+    return [{"device_id": f"DEV{i % 10}", "rssi": v}
+            for i, v in enumerate(rssi_cycle(BATCH_SIZE))]
+
+
+@case(f"e2e POST /ingest json array[{BATCH_SIZE}]", ops=BATCH_SIZE)
+def _e2e_ingest_array():
+    reset_state()
+    client = server.app.test_client()
+    body = json.dumps(_batch_records())
+
+    def run(number):
+        for _ in range(number):
+            client.post("/ingest", data=body, content_type="application/json")
+    return run
+
+
+@case(f"e2e POST /ingest ndjson[{BATCH_SIZE}]", ops=BATCH_SIZE)
+def _e2e_ingest_ndjson():
+    reset_state()
+    client = server.app.test_client()
+    body = "".join(json.dumps(r) + "\n" for r in _batch_records())
+
+    def run(number):
+        for _ in range(number):
+            client.post("/ingest", data=body, content_type="application/x-ndjson")
+    return run
+
+
+@case(f"e2e POST /ingest/binary[{BATCH_SIZE}]", ops=BATCH_SIZE)
+def _e2e_ingest_binary():
+    reset_state()
+    client = server.app.test_client()
+    body = binary_ingest.encode_records(_batch_records())
+
+    def run(number):
+        for _ in range(number):
+            client.post("/ingest/binary", data=body, content_type=binary_ingest.CONTENT_TYPE)
+    return run
+
+
+@case("e2e GET /api/status")
+def _e2e_status():
+    reset_state()
+    client = server.app.test_client()
+    server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+
+    def run(number):
+        for _ in range(number):
+            client.get("/api/status")
+    return run
+
+
+@case("e2e GET /api/status (304)")
+def _e2e_status_not_modified():
+    reset_state()
+    client = server.app.test_client()
+    server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+    headers = {"If-None-Match": client.get("/api/status").headers["ETag"]}
+
+    def run(number):
+        for _ in range(number):
+            client.get("/api/status", headers=headers)
+    return run
+
+
+@case("cached_status[hit]")
+def _cached_status_hit():
+    reset_state()
+    server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+
+    def run(number):
+        for _ in range(number):
+            server.cached_status()
+    return run
+
+
+@case("cached_status[miss]")
+def _cached_status_miss():
+    reset_state()
+    device = server.update_device_state(-62, "AA:BB:CC:DD:EE:FF")
+
+    def run(number):
+        for _ in range(number):
+            device.publish()
+            server.cached_status()
+    return run
+
+
+@case(f"e2e GET /api/devices[{FLEET_SIZE}]")
+def _e2e_devices():
+    reset_state()
+    client = server.app.test_client()
+    for i in range(FLEET_SIZE):
+        server.update_device_state(-50 - i % 40, f"AA:BB:CC:00:{i >> 8:02X}:{i & 255:02X}")
+
+    def run(number):
+        for _ in range(number):
+            client.get("/api/devices")
+    return run
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "numpy": server.numpy_available(),
+        "rssi_filter": server.config.rssi_filter,
+    }
+
+
+def load_baseline(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {r["name"]: r for r in data["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server.py hot paths")
+    parser.add_argument("--filter", help="only run cases whose name contains this string")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats per case (default 5)")
+    parser.add_argument("--quick", action="store_true", help="--min-time 0.05 --repeat 3")
+    parser.add_argument("--json", help="write results to this file "
+                        "(default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--no-save", action="store_true", help="do not write a results file")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown counted as a regression (default 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="exit with status 1 if any case regressed")
+    args = parser.parse_args()
+    if args.quick:
+        args.min_time, args.repeat = 0.05, 3
+
+    baseline = load_baseline(args.compare) if args.compare else {}
+    results = []
+    regressions = []
+
+    header = f"{'case':<48}{'best':>12}{'median':>12}{'samples/s':>14}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for name, ops, setup in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        run = setup()
+        number, timings = measure(run, args.min_time, args.repeat)
+        best = min(timings)
+        median = statistics.median(timings)
+        result = {
+            "name": name,
+            "ops_per_call": ops,
+            "iterations": number,
+            "repeat": len(timings),
+            "best_ns": round(best * 1e9, 1),
+            "median_ns": round(median * 1e9, 1),
+            "samples_per_s": round(ops / best, 1),
+        }
+        results.append(result)
+
+        line = f"{name:<48}{format_time(best):>12}{format_time(median):>12}{ops / best:>14,.0f}"
+        base = baseline.get(name)
+        if base:
+            ratio = result["best_ns"] / base["best_ns"]
+            result["baseline_ratio"] = round(ratio, 3)
+            mark = " !" if ratio > 1 + args.threshold else ""
+            if mark:
+                regressions.append(name)
+            line += f"{ratio:>9.2f}x{mark}"
+        print(line, flush=True)
+
+    reset_state(parent=False)
+
+    if not args.no_save:
+        path = args.json
+        if path is None:
+            os.makedirs(os.path.join(HERE, "results"), exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(HERE, "results", f"server-{stamp}.json")
+        with open(path, "w") as f:
+            json.dump({"environment": environment(), "min_time": args.min_time,
+                       "results": results}, f, indent=2)
+        print(f"\nResults written to {path}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than "
+              f"{args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+
+if __name__ == "__main__":
+    main()
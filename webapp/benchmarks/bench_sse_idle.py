@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Idle SSE connection benchmark
+Opens many idle /events streams against one server process, then reports
+the server's memory, threads and idle CPU, and how long one broadcast
+takes to reach every client.
+
+Usage:
+    python benchmarks/bench_sse_idle.py                      # asgi_server.py, 10k clients
+    python benchmarks/bench_sse_idle.py --server flask --connections 1000
+    python benchmarks/bench_sse_idle.py --url http://host:5001 --connections 2000
+
+Without --url the server is started as a subprocess on --port, so its
+/proc entry can be sampled (Linux). The broadcast is a POST to
+/api/test-fall; a client counts as reached when its fall_detected frame
+arrives.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBAPP = os.path.join(HERE, "..")
+
+FLASK_CMD = (
+    "import sys, server; "
+    "server.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+)
+
+
+def start_server(kind, port):
+    env = dict(os.environ, HISTORY_DB="", SIMULATOR="0", PYTHONUNBUFFERED="1")
+    if kind == "asgi":
+        cmd = [sys.executable, "asgi_server.py", "--host", "127.0.0.1", "--port", str(port),
+               "--backlog", "16384"]
+    else:
+        cmd = [sys.executable, "-c", FLASK_CMD, str(port)]
+    proc = subprocess.Popen(cmd, cwd=WEBAPP, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/api/config", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"{kind} server did not start on port {port}")
+
+
+def proc_stats(pid):
+    """RSS (MB), peak RSS (MB), threads and CPU seconds from /proc."""
+    if pid is None or not os.path.exists(f"/proc/{pid}/status"):
+        return {}
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                stats[key] = int(value.split()[0]) / 1024.0
+            elif key == "Threads":
+                stats["threads"] = int(value)
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    stats["cpu_s"] = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return stats
+
+
+class Client:
+    __slots__ = ("reader", "writer", "received")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.received = None
+
+
+async def open_client(host, port, path="/events"):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Accept: text/event-stream\r\n\r\n".encode())
+    # Headers plus the opening keepalive comment
+    await reader.readuntil(b": keepalive\n\n")
+    return Client(reader, writer)
+
+
+async def wait_for_event(client, marker):
+    await client.reader.readuntil(marker)
+    client.received = time.perf_counter()
+
+
+async def run(args, url, pid):
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    baseline = proc_stats(pid)
+
+    clients = []
+    limit = asyncio.Semaphore(args.parallel)
+    failures = 0
+
+    async def connect():
+        nonlocal failures
+        async with limit:
+            try:
+                clients.append(await asyncio.wait_for(open_client(host, port), 30))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connect() for _ in range(args.connections)))
+    connect_time = time.perf_counter() - start
+    print(f"connected {len(clients)}/{args.connections} clients in {connect_time:.1f}s"
+          f" ({failures} failed)", flush=True)
+
+    # Idle period: measure the server's own cost of holding the streams
+    before = proc_stats(pid)
+    await asyncio.sleep(args.idle)
+    held = proc_stats(pid)
+
+    # One broadcast to everybody
+    waiters = [asyncio.ensure_future(wait_for_event(c, b"fall_detected")) for c in clients]
+    loop = asyncio.get_running_loop()
+    sent = time.perf_counter()
+    await loop.run_in_executor(None, lambda: urllib.request.urlopen(
+        urllib.request.Request(url + "/api/test-fall", data=b"{}", method="POST",
+                               headers={"Content-Type": "application/json"}), timeout=60).read())
+    done, pending = await asyncio.wait(waiters, timeout=args.timeout)
+    for task in pending:
+        task.cancel()
+    latencies = sorted(c.received - sent for c in clients if c.received is not None)
+
+    for c in clients:
+        c.writer.close()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1) \
+            if latencies else None
+
+    result = {
+        "server": args.server if args.url is None else url,
+        "connections": len(clients),
+        "failed": failures,
+        "connect_s": round(connect_time, 2),
+        "broadcast_reached": len(latencies),
+        "broadcast_p50_ms": pct(50),
+        "broadcast_p99_ms": pct(99),
+        "broadcast_max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+    if held:
+        idle_cpu = (held["cpu_s"] - before["cpu_s"]) / args.idle
+        result.update({
+            "rss_mb_before": round(baseline["VmRSS"], 1),
+            "rss_mb_held": round(held["VmRSS"], 1),
+            "kb_per_connection": round((held["VmRSS"] - baseline["VmRSS"]) * 1024 / max(1, len(clients)), 2),
+            "threads_held": held["threads"],
+            "idle_cpu_pct": round(idle_cpu * 100, 1),
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idle SSE connection benchmark")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--server", choices=("asgi", "flask"), default="asgi",
+                        help="server to start when --url is not given")
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--port", type=int, default=5091)
+    parser.add_argument("--parallel", type=int, default=200, help="concurrent connection attempts")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds to hold the idle streams")
+    parser.add_argument("--timeout", type=float, default=30.0, help="broadcast delivery timeout")
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    # Each client is one socket in this process
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.connections + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = start_server(args.server, args.port)
+    try:
+        result = asyncio.run(run(args, url, proc.pid if proc else None))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(10)
+
+    print("=" * 60)
+    for key, value in result.items():
+        print(f"{key:<20} {value}")
+    print("=" * 60)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Server startup benchmark
+Starts server.py repeatedly and measures how long it takes to answer
+/healthz and to accept its first /ingest sample, then breaks `import
+server` down by module with -X importtime.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --top 20
+    python benchmarks/bench_startup.py --target 0.3    # exit 1 if slower
+
+Times are from spawning the interpreter, so they include its own startup
+(shown separately as `python -c pass`). The server runs with SIMULATOR=0,
+HISTORY_DB="", GEOFENCES_FILE="" and CALIBRATION_PROFILES_FILE="" unless
+those are set in the environment.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBAPP = os.path.join(HERE, "..")
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+SAMPLE = json.dumps({"device_id": "STARTUP", "rssi": -60}).encode()
+
+
+def server_env(port):
+    env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED="1")
+    for name, value in (("SIMULATOR", "0"), ("HISTORY_DB", ""), ("GEOFENCES_FILE", ""),
+                        ("CALIBRATION_PROFILES_FILE", "")):
+        env.setdefault(name, value)
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port, method, path, body=None):
+    """Status code of one request, or None while the server is not up."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        headers = {"Content-Type": "application/json"} if body else {}
+        conn.request(method, path, body=body, headers=headers)
+        return conn.getresponse().status
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def time_startup(timeout=30.0):
+    """(seconds to /healthz 200, seconds to first /ingest 200) for one start."""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "server.py"], cwd=WEBAPP, env=server_env(port),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while request(port, "GET", "/healthz") != 200:
+            if proc.poll() is not None:
+                sys.exit(f"server.py exited with status {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                sys.exit(f"server.py did not answer /healthz within {timeout:.0f} s")
+            time.sleep(0.002)
+        healthy = time.perf_counter() - started
+        if request(port, "POST", "/ingest", SAMPLE) != 200:
+            sys.exit("first /ingest sample was not accepted")
+        return healthy, time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def interpreter_startup(runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def import_breakdown():
+    """
+    -X importtime for `import server`: (total microseconds, [(cumulative
+    microseconds, module)] for the modules server.py imports directly).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                            cwd=WEBAPP, env=server_env(0), capture_output=True, text=True,
+                            check=True)
+    children = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 0:
+            if name == "server":
+                return int(cumulative), sorted(children, reverse=True)
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name))
+    sys.exit("no import time reported for server")
+
+
+def ms(seconds):
+    return f"{seconds * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server.py startup")
+    parser.add_argument("--runs", type=int, default=5, help="server starts to time (default 5)")
+    parser.add_argument("--top", type=int, default=15, help="imports to list (default 15)")
+    parser.add_argument("--target", type=float,
+                        help="exit with status 1 if the median time to /ingest exceeds this (seconds)")
+    args = parser.parse_args()
+
+    runs = [time_startup() for _ in range(args.runs)]
+    healthy = [run[0] for run in runs]
+    ingest = [run[1] for run in runs]
+    print(f"{'':<28}{'median':>11}{'best':>11}{'worst':>11}")
+    print(f"{'start -> /healthz 200':<28}{ms(statistics.median(healthy))}"
+          f"{ms(min(healthy))}{ms(max(healthy))}")
+    print(f"{'start -> first /ingest 200':<28}{ms(statistics.median(ingest))}"
+          f"{ms(min(ingest))}{ms(max(ingest))}")
+    print(f"{'python -c pass':<28}{ms(interpreter_startup(args.runs))}")
+
+    total, children = import_breakdown()
+    print(f"\nimport server: {total / 1000:.1f} ms; slowest direct imports (cumulative):")
+    for cumulative, name in children[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    if args.target is not None and statistics.median(ingest) > args.target:
+        print(f"\nslower than the {args.target * 1000:.0f} ms target")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+GuardianLink binary ingest format
+Fixed-layout records for bracelet/gateway uplinks, with encoder and decoder
+
+Record layout, version 1 (44 bytes, little-endian):
+
+  offset  size  type     field
+  0       1     uint8    version (= 1)
+  1       1     uint8    flags (see FLAG_*)
+  2       1     int8     rssi (dBm)
+  3       1     -        reserved
+  4       16    char[]   device_id (ASCII, NUL padded)
+  20      8     uint64   timestamp (ms since Unix epoch)
+  28      4     int32    lat (1e-7 degrees)
+  32      4     int32    lng (1e-7 degrees)
+  36      2     int16    yaw (milliradians)
+  38      2     -        reserved
+  40      4     uint32   steps
+
+A request body is a plain concatenation of records. Every record starts
+with its version byte, so newer layouts can be mixed into the same buffer.
+"""
+import argparse
+import struct
+import sys
+import time
+
+CONTENT_TYPE = "application/vnd.guardianlink.v1"
+
+VERSION_1 = 1
+RECORD_V1 = struct.Struct("<BBbx16sQiih2xI")
+
+# Record layouts by version byte
+LAYOUTS = {VERSION_1: RECORD_V1}
+
+FLAG_FALL = 0x01
+FLAG_LOCATION = 0x02
+FLAG_RSSI = 0x04
+FLAG_YAW = 0x08
+FLAG_STEPS = 0x10
+
+COORD_SCALE = 1e7
+YAW_SCALE = 1000.0
+
+
+def encode_record(device_id, rssi=None, lat=None, lng=None, fall=False,
+                  yaw=None, steps=None, ts=None):
+    """
+    Encode one sample as a version 1 record.
+
+    Args:
+        device_id: ASCII device id, at most 16 bytes
+        rssi: RSSI in dBm (-128..127)
+        lat, lng: Coordinates in degrees (both or neither)
+        fall: Hardware fall flag
+        yaw: Heading in radians
+        steps: Step counter
+        ts: Epoch seconds (defaults to now; 0 has the server stamp the
+            record on arrival)
+
+    Returns:
+        bytes of length RECORD_V1.size
+    """
+    raw_id = device_id.encode("ascii")
+    if len(raw_id) > 16:
+        raise ValueError("device_id longer than 16 bytes")
+
+    flags = 0
+    if fall:
+        flags |= FLAG_FALL
+    if lat is not None and lng is not None:
+        flags |= FLAG_LOCATION
+    if rssi is not None:
+        flags |= FLAG_RSSI
+    if yaw is not None:
+        flags |= FLAG_YAW
+    if steps is not None:
+        flags |= FLAG_STEPS
+
+    return RECORD_V1.pack(
+        VERSION_1,
+        flags,
+        int(round(rssi)) if rssi is not None else 0,
+        raw_id,
+        int((time.time() if ts is None else ts) * 1000),
+        int(round(lat * COORD_SCALE)) if flags & FLAG_LOCATION else 0,
+        int(round(lng * COORD_SCALE)) if flags & FLAG_LOCATION else 0,
+        int(round(yaw * YAW_SCALE)) if yaw is not None else 0,
+        steps or 0,
+    )
+
+
+def encode_records(samples):
+    """Encode an iterable of sample dicts (encode_record kwargs) into one buffer."""
+    return b"".join(encode_record(**sample) for sample in samples)
+
+
+def iter_records(buf):
+    """
+    Yield (record, error) pairs from a buffer of concatenated records.
+
+    Records are unpacked in place from a memoryview, so the buffer is never
+    copied or sliced into per-record bytes objects. Each record is returned
+    as a dict in the same shape as a JSON /ingest object. An unknown version
+    or a truncated tail yields an error and stops, since the record
+    boundary is lost.
+    """
+    view = memoryview(buf)
+    end = len(view)
+    offset = 0
+    while offset < end:
+        layout = LAYOUTS.get(view[offset])
+        if layout is None:
+            yield None, f"unsupported record version {view[offset]}"
+            return
+        if offset + layout.size > end:
+            yield None, "truncated record"
+            return
+        (_, flags, rssi, raw_id, ts_ms,
+         lat, lng, yaw, steps) = layout.unpack_from(view, offset)
+        offset += layout.size
+
+        record = {
+            "device_id": raw_id.rstrip(b"\0").decode("ascii", "replace"),
+            "ts": ts_ms / 1000.0,
+        }
+        if flags & FLAG_FALL:
+            record["fall"] = True
+        if flags & FLAG_RSSI:
+            record["rssi"] = rssi
+        if flags & FLAG_LOCATION:
+            record["lat"] = lat / COORD_SCALE
+            record["lng"] = lng / COORD_SCALE
+        if flags & FLAG_YAW:
+            record["yaw"] = yaw / YAW_SCALE
+        if flags & FLAG_STEPS:
+            record["steps"] = steps
+        yield record, None
+
+
+def decode_records(buf):
+    """Decode a whole buffer; raises ValueError on the first bad record."""
+    records = []
+    for record, error in iter_records(buf):
+        if error is not None:
+            raise ValueError(error)
+        records.append(record)
+    return records
+
+
+def main():
+    """Write one encoded record to stdout, e.g. for piping into curl."""
+    parser = argparse.ArgumentParser(description="Encode a GuardianLink binary ingest record")
+    parser.add_argument("--device", required=True)
+    parser.add_argument("--rssi", type=int)
+    parser.add_argument("--lat", type=float)
+    parser.add_argument("--lng", type=float)
+    parser.add_argument("--fall", action="store_true")
+    parser.add_argument("--yaw", type=float)
+    parser.add_argument("--steps", type=int)
+    parser.add_argument("--count", type=int, default=1, help="repeat the record N times")
+    args = parser.parse_args()
+
+    record = encode_record(args.device, rssi=args.rssi, lat=args.lat, lng=args.lng,
+                           fall=args.fall, yaw=args.yaw, steps=args.steps)
+    sys.stdout.buffer.write(record * args.count)
+
+
+if __name__ == "__main__":
+    main()
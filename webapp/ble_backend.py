@@ -0,0 +1,139 @@
+"""
+GuardianLink BLE backend
+Long-lived advertisement scanning behind a small source interface
+"""
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+
+
+class AdvertisementSource(ABC):
+    """
+    Interface for anything that produces BLE advertisements.
+
+    start() begins delivering advertisements by calling
+    callback(address, name, rssi) on the event loop thread, and keeps doing
+    so until stop() is awaited.
+    """
+
+    @abstractmethod
+    async def start(self, callback):
+        """Begin delivering advertisements to `callback`."""
+
+    @abstractmethod
+    async def stop(self):
+        """Stop delivering advertisements."""
+
+
+class BleakAdvertisementSource(AdvertisementSource):
+    """Passive scanning through bleak's detection callback."""
+
+    def __init__(self, scanner_cls=None):
+        if scanner_cls is None:
+            from bleak import BleakScanner as scanner_cls
+        self._scanner_cls = scanner_cls
+        self._scanner = None
+
+    async def start(self, callback):
+        def on_advertisement(device, advertisement_data):
+            name = device.name or advertisement_data.local_name or ""
+            callback(device.address, name, advertisement_data.rssi)
+
+        self._scanner = self._scanner_cls(detection_callback=on_advertisement)
+        await self._scanner.start()
+
+    async def stop(self):
+        if self._scanner is not None:
+            await self._scanner.stop()
+            self._scanner = None
+
+
+class FakeAdvertisementSource(AdvertisementSource):
+    """
+    Replays scripted advertisements, for machines without a Bluetooth adapter.
+
+    Args:
+        advertisements: iterable of (address, name, rssi) tuples
+        interval: seconds between advertisements
+        repeat: cycle through `advertisements` forever
+    """
+
+    def __init__(self, advertisements=(), interval=0.1, repeat=False):
+        self._advertisements = list(advertisements)
+        self._interval = interval
+        self._repeat = repeat
+        self._task = None
+        self._loop = None
+        self._callback = None
+
+    async def start(self, callback):
+        self._loop = asyncio.get_running_loop()
+        self._callback = callback
+        self._task = asyncio.ensure_future(self._replay())
+
+    async def _replay(self):
+        items = itertools.cycle(self._advertisements) if self._repeat else self._advertisements
+        for address, name, rssi in items:
+            await asyncio.sleep(self._interval)
+            self._callback(address, name, rssi)
+
+    def inject(self, address, name, rssi):
+        """Deliver one advertisement now; callable from any thread."""
+        self._loop.call_soon_threadsafe(self._callback, address, name, rssi)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class BleScanner:
+    """
+    Runs one advertisement source on one event loop for the life of the
+    process, forwarding every matching advertisement as it arrives.
+
+    Args:
+        source: AdvertisementSource to read from
+        on_sample: called as on_sample(rssi, address, name) per advertisement
+        name_filter: only advertisements whose name contains this
+            (case-insensitive) are forwarded
+        on_tick: optional housekeeping callback run every `tick_interval`
+            seconds on the scanner loop
+    """
+
+    def __init__(self, source, on_sample, name_filter="", on_tick=None, tick_interval=1.0):
+        self.source = source
+        self._on_sample = on_sample
+        self._name_filter = name_filter.lower()
+        self._on_tick = on_tick
+        self._tick_interval = tick_interval
+        self.loop = None
+
+    def _on_advertisement(self, address, name, rssi):
+        if self._name_filter and self._name_filter not in (name or "").lower():
+            return
+        try:
+            self._on_sample(rssi, address, name)
+        except Exception as e:
+            print(f"BLE sample error: {e}")
+
+    async def run(self, stop_event):
+        """Scan until `stop_event` (a threading.Event) is set."""
+        self.loop = asyncio.get_running_loop()
+        await self.source.start(self._on_advertisement)
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(self._tick_interval)
+                if self._on_tick is not None:
+                    self._on_tick()
+        finally:
+            await self.source.stop()
+
+    def run_forever(self, stop_event):
+        """Thread entry point: one event loop for the whole scan session."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.run(stop_event))
+        finally:
+            loop.close()
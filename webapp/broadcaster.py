@@ -0,0 +1,801 @@
+"""
+GuardianLink SSE broadcaster
+Fans each published event out to every connected /events subscriber
+
+Subscribers are thread-backed Subscriptions (one blocked generator per
+client, used by the Flask server) or an AsyncFanout that serves any
+number of coroutine clients on one event loop (used by asgi_server.py).
+
+Every frame carries an SSE event id, and the last frames are kept in a
+bounded replay buffer, so a client that reconnects with Last-Event-ID
+resumes where it left off. status_update events go through a coalescing
+stage: at most one per device per window, carrying only the fields that
+changed since the device's previous status_update. Alerts and every
+other event type are published immediately.
+
+Clients apply status_update deltas by merging them into the device's
+last known status. A new client, or one that resumes from an id that has
+left the replay buffer, first receives one `status_snapshot` event with
+the full status of every device.
+
+Backpressure: each client queues status deltas and alerts (every other
+frame) separately, and the client drains both in event-id order. The
+status queue is a ring of `buffer_size`. When it is full, queued deltas
+are merged per device first, and only then is the oldest delta dropped.
+Once its queue has drained, a client that lost deltas is sent a fresh
+status_snapshot, and older deltas still queued are skipped. Alerts are
+never dropped. A client whose alert backlog reaches `max_backlog` is
+disconnected instead, and its EventSource resumes from the replay buffer
+with Last-Event-ID. With a replay buffer at least `max_backlog` long, the
+oldest unsent alert is still in it at that point. Replayed frames do not
+count towards the backlog of the client that resumes. Status deltas are
+not encoded or queued at all while nobody is subscribed.
+
+Encoding: each event is serialized once, with orjson when it is
+installed (json otherwise), into one bytes frame referenced by every
+subscriber's queue, the replay buffer and every coroutine client. A
+client that negotiated Content-Encoding gzip or deflate runs the shared
+frames through its own FrameCompressor, a streaming compressor flushed
+after every frame. Each event still arrives as soon as it is published,
+and the keys repeated in every status_update compress against the
+earlier frames of the stream.
+"""
+import itertools
+import json
+import threading
+import time
+import zlib
+from collections import deque
+
+# Comment frame sent to idle subscribers so proxies keep the stream open
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+# Default number of status deltas a slow subscriber may lag behind
+# before the oldest ones are discarded
+DEFAULT_BUFFER_SIZE = 256
+
+# Alerts (never discarded) a subscriber may lag behind before it is
+# disconnected to resume from the replay buffer; no more than its size
+DEFAULT_MAX_BACKLOG = 1024
+
+# Seconds an idle subscriber blocks before emitting a keepalive
+DEFAULT_KEEPALIVE = 15.0
+
+# Default number of published frames kept for Last-Event-ID resume
+DEFAULT_REPLAY_SIZE = 1024
+
+# Payload keys that identify a status_update rather than describe the device
+STATUS_KEYS = ("type", "device", "ts")
+
+
+# /events Content-Encodings, preferred first, with their zlib wbits: a
+# 4 KB window (a dozen status deltas back) keeps the compressor at ~40 KB
+# per client; 16 + wbits selects the gzip container
+COMPRESS_WBITS = 12
+COMPRESS_ENCODINGS = {"gzip": 16 + COMPRESS_WBITS, "deflate": COMPRESS_WBITS}
+COMPRESS_LEVEL = 6
+COMPRESS_MEM_LEVEL = 5
+
+
+def _json_dumps(payload):
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _orjson_dumps(orjson):
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    orjson_dumps = orjson.dumps
+    error = orjson.JSONEncodeError
+
+    def dumps(payload):
+        try:
+            return orjson_dumps(payload, option=options)
+        except error:
+            # Types orjson rejects but json takes (e.g. ints over 64 bits)
+            return _json_dumps(payload)
+    return dumps
+
+
+def dumps(payload) -> bytes:
+    """
+    Compact UTF-8 JSON of `payload`. The first call imports orjson (kept
+    off the startup path) and replaces this function with orjson's
+    encoder, or with json's when orjson is not installed.
+    """
+    global dumps
+    try:
+        import orjson
+    except ImportError:
+        dumps = _json_dumps
+    else:
+        dumps = _orjson_dumps(orjson)
+    return dumps(payload)
+
+
+def encode_frame(payload: dict, event_id=None) -> bytes:
+    """Serialize an event payload into a complete SSE frame."""
+    if event_id is None:
+        return b"data: " + dumps(payload) + b"\n\n"
+    return b"id: %d\ndata: %s\n\n" % (event_id, dumps(payload))
+
+
+def parse_event_id(value):
+    """Last-Event-ID header value as an int, or None if absent/invalid."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    The first of COMPRESS_ENCODINGS an Accept-Encoding header value
+    allows (a q=0 refuses it), or None for an uncompressed stream.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip()] = q
+    for encoding in COMPRESS_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class FrameCompressor:
+    """
+    One client's streaming gzip or deflate compressor. Each call returns
+    the compressed bytes of one frame, sync-flushed so the client can
+    decode the frame right away; the stream is never ended.
+    """
+
+    __slots__ = ("encoding", "_compress", "_flush")
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, COMPRESS_ENCODINGS[encoding],
+                                      COMPRESS_MEM_LEVEL)
+        self._compress = compressor.compress
+        self._flush = compressor.flush
+
+    def __call__(self, frame):
+        return self._compress(frame) + self._flush(zlib.Z_SYNC_FLUSH)
+
+
+# Buffered items are (frame, event id, status payload) tuples. The status
+# payload is None except for status_update deltas, which are queued in
+# the client's status ring; everything else goes to its alert queue.
+
+def _compact(buffer):
+    """
+    Merge the status_update deltas queued in `buffer` per device (later
+    fields win), keeping each merged delta at its latest position and
+    event id.
+
+    Items are taken with popleft(), so a client draining the buffer on
+    another thread still sees each frame once and in order.
+    """
+    items = []
+    try:
+        while True:
+            items.append(buffer.popleft())
+    except IndexError:
+        pass
+    kept = []
+    position = {}  # device -> index in kept of its latest delta
+    for item in items:
+        payload = item[2]
+        if payload is not None:
+            device = payload["device"]
+            index = position.get(device)
+            if index is not None:
+                earlier = kept[index]
+                kept[index] = None
+                item = (None, item[1], {**earlier[2], **payload})
+            position[device] = len(kept)
+        kept.append(item)
+    for item in kept:
+        if item is None:
+            continue
+        if item[0] is None:
+            item = (encode_frame(item[2], item[1]), item[1], item[2])
+        buffer.append(item)
+
+
+def _make_room(client):
+    """
+    Free a slot in a full status ring: compact it, and let the append
+    evict the oldest delta if that did not help. A compaction that leaves
+    the ring more than 3/4 full is not retried for the next quarter of
+    pushes, so a ring of distinct devices costs O(1) per push on average.
+    """
+    buffer = client._statuses
+    if client._compact_skip:
+        client._compact_skip -= 1
+    else:
+        _compact(buffer)
+        if len(buffer) > buffer.maxlen * 3 // 4:
+            client._compact_skip = buffer.maxlen // 4
+    if len(buffer) == buffer.maxlen:
+        client.dropped += 1
+        client._stale = True
+
+
+def _enqueue(client, item):
+    """Shared push() of Subscription and AsyncClient; False if ignored."""
+    if client._closed:
+        return False
+    event_id = item[1]
+    if event_id is not None:
+        if event_id <= client.last_id:
+            return False  # already queued (replayed on subscribe)
+        client.last_id = event_id
+    if item[2] is None:
+        client._alerts.append(item)
+        if len(client._alerts) >= client.max_backlog:
+            client.overflowed = True
+            client.close()
+        return True
+    if len(client._statuses) == client._statuses.maxlen:
+        _make_room(client)
+    client._statuses.append(item)
+    return True
+
+
+def _prime(client, items, last_id):
+    """
+    Queue the frames a (re)connecting client resumes with. The limit is
+    raised by their number, so a client resuming a full backlog is not
+    disconnected again before it was sent anything.
+    """
+    client.max_backlog += len(items)
+    for item in items:
+        client.push(item)
+    client.last_id = last_id
+
+
+def _next_item(client):
+    """
+    Pop a client's next item in event-id order across its two queues;
+    None when both are empty. Deltas already covered by a resync snapshot
+    are skipped. Items without an id (snapshots, keepalives) go first.
+    """
+    statuses = client._statuses
+    alerts = client._alerts
+    while True:
+        try:
+            if alerts and (not statuses or (alerts[0][1] or 0) < statuses[0][1]):
+                return alerts.popleft()
+            item = statuses.popleft()
+        except IndexError:
+            # Empty, or a compaction on the publisher thread is refilling
+            # the ring; the publisher signals again when it is done
+            return None
+        if item[1] > client._covered:
+            return item
+
+
+def _resync_item(client):
+    """A fresh status_snapshot for a client that lost deltas, or None."""
+    client._stale = False
+    if client.resync is None:
+        return None
+    item, client._covered = client.resync()
+    return item
+
+
+class Subscription:
+    """
+    One connected SSE client.
+
+    Holds a bounded ring of pre-encoded status deltas and a queue of
+    alerts. The publisher appends and signals; the client's generator
+    blocks on the signal, so an idle client costs nothing until an event
+    or keepalive is due.
+    """
+
+    __slots__ = ("id", "_statuses", "_alerts", "_ready", "_closed", "dropped", "overflowed",
+                 "last_id", "max_backlog", "resync", "_stale", "_covered", "_compact_skip")
+
+    _ids = itertools.count(1)
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, max_backlog=DEFAULT_MAX_BACKLOG):
+        self.id = next(self._ids)
+        self._statuses = deque(maxlen=buffer_size)
+        self._alerts = deque()
+        self._ready = threading.Event()
+        self._closed = False
+        self.dropped = 0           # status deltas discarded
+        self.overflowed = False    # disconnected for lagging on alerts
+        self.last_id = 0           # event id of the newest frame queued
+        self.max_backlog = max_backlog
+        self.resync = None         # () -> (status_snapshot item, last id)
+        self._stale = False        # lost deltas; resync once drained
+        self._covered = 0          # deltas up to this id are in the resync
+        self._compact_skip = 0
+
+    def push(self, item):
+        """
+        Queue a (frame, event id, status payload) item. When the status
+        ring is full, queued deltas are merged first; only if that frees
+        nothing is the oldest delta evicted. Alerts are always queued.
+        """
+        if _enqueue(self, item):
+            self._ready.set()
+
+    def depth(self):
+        """Number of frames waiting to be sent."""
+        return len(self._statuses) + len(self._alerts)
+
+    def client_count(self):
+        return 1
+
+    def queue_depths(self):
+        return [(self.id, self.depth())]
+
+    def overflow_count(self):
+        return int(self.overflowed)
+
+    def close(self):
+        """Wake the client generator and make it stop."""
+        self._closed = True
+        self._ready.set()
+
+    def frames(self, keepalive=DEFAULT_KEEPALIVE):
+        """
+        Yield frames as they arrive, or a keepalive after `keepalive` idle
+        seconds. Runs until close() is called.
+        """
+        ready = self._ready
+        # Opening comment so the server flushes response headers right away
+        yield KEEPALIVE_FRAME
+        while not self._closed:
+            if not ready.wait(keepalive):
+                yield KEEPALIVE_FRAME
+                continue
+            # Clear before draining so a push racing with the drain re-arms
+            # the event instead of being lost
+            ready.clear()
+            while True:
+                item = _next_item(self)
+                if item is None:
+                    if not self._stale:
+                        break
+                    item = _resync_item(self)
+                    if item is None:
+                        continue
+                yield item[0]
+
+
+class EventBroadcaster:
+    """
+    Publish/subscribe hub for server-sent events.
+
+    Every publish is numbered, serialized exactly once, and the resulting
+    frame is shared by reference across all subscribers and the replay
+    buffer. Publishing holds a short lock so that every subscriber gets
+    event ids in order; the subscriber list is a copy-on-write tuple.
+
+    publish_status() is the coalescing stage for status_update events.
+    With coalesce_window > 0 it keeps the latest status per device and a
+    background thread publishes the deltas once per window; with 0 each
+    delta is published immediately.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, replay_size=DEFAULT_REPLAY_SIZE,
+                 coalesce_window=0.0, max_backlog=DEFAULT_MAX_BACKLOG):
+        self.buffer_size = buffer_size
+        self.max_backlog = max_backlog
+        self.coalesce_window = coalesce_window
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        # Deltas dropped by, and alert-backlog disconnects of, subscribers
+        # that have since gone away
+        self._dropped_closed = 0
+        self._overflowed_closed = 0
+        # Event ids, replay buffer and the last published status per device
+        self._publish_lock = threading.Lock()
+        self._last_id = 0
+        self._replay = deque(maxlen=replay_size)
+        self._statuses = {}
+        self._snapshot = None  # (last id, item) of the cached status_snapshot
+        # Last id before a status change that nobody was subscribed to see
+        # (and that is therefore not in the replay buffer)
+        self._unsent_after = -1
+        self._submitted = 0
+        self.status_published = 0
+        self._coalescer = StatusCoalescer(coalesce_window, self._publish_statuses)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a new subscriber and return its Subscription, primed
+        with resume(last_event_id).
+        """
+        sub = Subscription(self.buffer_size, self.max_backlog)
+        with self._publish_lock:
+            _prime(sub, *self._resume(last_event_id))
+            return self.attach(sub)
+
+    def attach(self, sub):
+        """Register an existing subscriber object (e.g. an AsyncFanout)."""
+        sub.resync = self.snapshot
+        with self._lock:
+            self._subscribers = self._subscribers + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        """Remove a subscriber; safe to call more than once."""
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers = tuple(s for s in self._subscribers if s is not sub)
+                self._dropped_closed += sub.dropped
+                self._overflowed_closed += sub.overflow_count()
+        sub.close()
+
+    def resume(self, last_event_id=None):
+        """
+        Items a (re)connecting client needs before live events, and the id
+        of the newest event they cover.
+
+        A client resuming from an id still in the replay buffer gets the
+        frames after it. Anyone else gets a status_snapshot, plus, when
+        resuming, the buffered events other than status updates.
+        """
+        with self._publish_lock:
+            return self._resume(last_event_id)
+
+    def _resume(self, last_event_id):
+        replay = self._replay
+        last_id = self._last_id
+        oldest = replay[0][1] if replay else last_id + 1
+        oldest = max(oldest, self._unsent_after + 2)
+        if last_event_id is not None and oldest - 1 <= last_event_id <= last_id:
+            return [item for item in replay if item[1] > last_event_id], last_id
+        items = [self._snapshot_item()] if self._statuses else []
+        if last_event_id is not None:
+            # Ids ahead of ours come from before a server restart
+            after = last_event_id if last_event_id <= last_id else 0
+            items.extend(item for item in replay if item[2] is None and item[1] > after)
+        return items, last_id
+
+    def snapshot(self):
+        """
+        (status_snapshot item, id of the newest event it covers), for a
+        subscriber resynchronizing after it dropped status deltas.
+        """
+        with self._publish_lock:
+            return self._snapshot_item(), self._last_id
+
+    def _snapshot_item(self):
+        cached = self._snapshot
+        if cached is None or cached[0] != self._last_id:
+            payload = {"type": "status_snapshot", "ts": time.time(), "devices": self._statuses}
+            cached = self._snapshot = (self._last_id, (encode_frame(payload), None, None))
+        return cached[1]
+
+    def subscriber_count(self):
+        """Connected clients, counting each client of a fan-out."""
+        return sum(sub.client_count() for sub in self._subscribers)
+
+    def queue_depths(self):
+        """(client id, frames waiting) for every connected client."""
+        depths = []
+        for sub in self._subscribers:
+            depths.extend(sub.queue_depths())
+        return depths
+
+    def dropped_total(self):
+        """Status deltas discarded by slow subscribers since startup."""
+        return self._dropped_closed + sum(sub.dropped for sub in self._subscribers)
+
+    def overflow_total(self):
+        """Subscribers disconnected for lagging too far behind on alerts."""
+        return self._overflowed_closed + sum(sub.overflow_count() for sub in self._subscribers)
+
+    @property
+    def status_submitted(self):
+        """status_update payloads handed to publish_status() so far."""
+        return self._submitted + self._coalescer.submitted
+
+    def publish(self, payload: dict, event_id=None):
+        """
+        Number `payload`, encode it once and deliver it to every subscriber.
+        `event_id` overrides the numbering with an id assigned upstream
+        (by the cluster event bus); such ids must increase.
+        """
+        with self._publish_lock:
+            self._publish(payload, None, event_id)
+
+    def _publish(self, payload, status, event_id=None):
+        if event_id is None:
+            event_id = self._last_id + 1
+        self._last_id = event_id
+        item = (encode_frame(payload, event_id), event_id, status)
+        self._replay.append(item)
+        for sub in self._subscribers:
+            sub.push(item)
+
+    def publish_status(self, payload: dict, event_id=None):
+        """
+        Submit a full status_update payload. Subscribers receive only the
+        fields that changed since the device's last published status, at
+        most once per coalesce_window. A payload with an upstream
+        `event_id` was coalesced upstream and is published immediately.
+        """
+        if self.coalesce_window > 0 and event_id is None:
+            self._coalescer.submit(payload)
+            return
+        with self._publish_lock:
+            self._submitted += 1
+            self._publish_delta(payload, event_id)
+
+    def flush(self):
+        """Publish the pending status deltas now."""
+        self._coalescer.flush()
+
+    def _publish_statuses(self, payloads):
+        with self._publish_lock:
+            for payload in payloads:
+                self._publish_delta(payload)
+
+    def _publish_delta(self, payload, event_id=None):
+        if event_id is not None:
+            # Upstream ids of deltas skipped below are still taken, so
+            # every worker of a cluster agrees on which ids it has seen
+            self._last_id = event_id
+        device = payload["device"]
+        status = {key: value for key, value in payload.items() if key not in STATUS_KEYS}
+        previous = self._statuses.get(device)
+        if previous is None:
+            delta = payload
+        else:
+            changed = {key: value for key, value in status.items()
+                       if key not in previous or previous[key] != value}
+            if not changed:
+                return
+            delta = {key: payload[key] for key in STATUS_KEYS if key in payload}
+            delta.update(changed)
+        self._statuses[device] = status
+        if not any(sub.client_count() for sub in self._subscribers):
+            # Nobody to send it to: the status_snapshot covers it on subscribe
+            self._snapshot = None
+            self._unsent_after = self._last_id if event_id is None else event_id - 1
+            return
+        self.status_published += 1
+        self._publish(delta, delta, event_id)
+
+
+class StatusCoalescer:
+    """
+    Coalescing stage for status_update payloads: keeps the latest payload
+    per device and passes them to `emit` at most once per `window`
+    seconds, from a background thread. With a window of 0 nothing is
+    submitted here.
+    """
+
+    def __init__(self, window, emit):
+        self.window = window
+        self.emit = emit            # (iterable of payloads) -> None
+        self.submitted = 0
+        self._pending = {}          # device -> latest full payload
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._thread = None
+
+    def submit(self, payload):
+        with self._lock:
+            self.submitted += 1
+            self._pending[payload["device"]] = payload
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True,
+                                                name="sse-coalescer")
+                self._thread.start()
+        if not self._wanted.is_set():
+            self._wanted.set()
+
+    def flush(self):
+        """Emit the pending payloads now."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.emit(pending.values())
+
+    def _loop(self):
+        wanted = self._wanted
+        while True:
+            wanted.wait()
+            time.sleep(self.window)
+            # Clear before flushing so a status submitted meanwhile
+            # schedules the next window
+            wanted.clear()
+            self.flush()
+
+
+class AsyncClient:
+    """
+    One coroutine /events client of an AsyncFanout (loop thread only).
+
+    Frames are bytes shared with every other client. There is no
+    per-client keepalive timer: the fan-out sends keepalives to all idle
+    clients from a single timer.
+    """
+
+    __slots__ = ("id", "_statuses", "_alerts", "_ready", "_closed", "dropped", "overflowed",
+                 "last_id", "max_backlog", "resync", "_stale", "_covered", "_compact_skip")
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, max_backlog=DEFAULT_MAX_BACKLOG, resync=None):
+        import asyncio  # only the async server gets here; keeps it off startup
+
+        self.id = next(Subscription._ids)
+        self._statuses = deque(maxlen=buffer_size)
+        self._alerts = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+        self.overflowed = False
+        self.last_id = 0
+        self.max_backlog = max_backlog
+        self.resync = resync
+        self._stale = False
+        self._covered = 0
+        self._compact_skip = 0
+
+    def push(self, item):
+        """Same as Subscription.push()."""
+        if _enqueue(self, item):
+            self._ready.set()
+
+    def mark_stale(self):
+        """Resync once drained: deltas for this client were lost upstream."""
+        self._stale = True
+        self._ready.set()
+
+    def depth(self):
+        return len(self._statuses) + len(self._alerts)
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    async def frames(self):
+        """Async counterpart of Subscription.frames()."""
+        ready = self._ready
+        yield KEEPALIVE_FRAME
+        while not self._closed:
+            await ready.wait()
+            ready.clear()
+            while True:
+                item = _next_item(self)
+                if item is None:
+                    if not self._stale:
+                        break
+                    item = _resync_item(self)
+                    if item is None:
+                        continue
+                yield item[0]
+
+
+class AsyncFanout:
+    """
+    Broadcaster subscriber serving many coroutine clients on one event loop.
+
+    It is attached to the EventBroadcaster once, however many clients are
+    connected, and passes the publisher's shared frames through. A publish
+    on the loop thread is delivered to every client inline. A publish
+    from another thread is queued, and one call_soon_threadsafe wakes the
+    loop for the whole queue rather than once per client. Every frame goes
+    to every client, so one timer sends keepalives to all clients when
+    nothing was delivered for a whole interval.
+
+    The cross-thread queue holds at most `buffer_size` status deltas while
+    the loop is stalled. Further deltas are dropped, and every client
+    resyncs from a status_snapshot once the loop catches up. Alerts are
+    always queued.
+
+    Must be created on the loop's thread.
+    """
+
+    def __init__(self, loop, buffer_size=DEFAULT_BUFFER_SIZE, keepalive=DEFAULT_KEEPALIVE,
+                 max_backlog=DEFAULT_MAX_BACKLOG):
+        self.id = next(Subscription._ids)
+        self.buffer_size = buffer_size
+        self.max_backlog = max_backlog
+        self.keepalive = keepalive
+        self.resync = None  # set by EventBroadcaster.attach()
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        self._clients = set()
+        self._pending = deque()
+        self._pending_dropped = 0
+        self._pending_stale = False
+        self._scheduled = False
+        self._dropped_closed = 0
+        self._overflowed_closed = 0
+        self._delivered = False
+        self._keepalive_handle = loop.call_later(keepalive, self._send_keepalives)
+
+    def add(self, resume=((), 0)):
+        """
+        Connect a new client (loop thread only), primed with the
+        (items, last id) pair from EventBroadcaster.resume(). Frames up to
+        that id still queued for delivery are skipped for this client.
+        """
+        client = AsyncClient(self.buffer_size, self.max_backlog, self.resync)
+        _prime(client, *resume)
+        self._clients.add(client)
+        return client
+
+    def remove(self, client):
+        """Disconnect a client (loop thread only); safe to call twice."""
+        if client in self._clients:
+            self._clients.discard(client)
+            self._dropped_closed += client.dropped
+            self._overflowed_closed += client.overflowed
+        client.close()
+
+    def push(self, item):
+        if threading.get_ident() == self._thread_id:
+            self._deliver(item)
+            return
+        if item[2] is not None and len(self._pending) >= self.buffer_size:
+            self._pending_dropped += 1
+            self._pending_stale = True
+        else:
+            self._pending.append(item)
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        # Reset first: a push racing with the drain schedules another one
+        self._scheduled = False
+        pending = self._pending
+        while pending:
+            self._deliver(pending.popleft())
+        if self._pending_stale:
+            self._pending_stale = False
+            for client in self._clients:
+                client.mark_stale()
+
+    def _deliver(self, item):
+        for client in self._clients:
+            client.push(item)
+        self._delivered = True
+
+    def _send_keepalives(self):
+        if not self._delivered:
+            keepalive = (KEEPALIVE_FRAME, None, None)
+            for client in self._clients:
+                client.push(keepalive)
+        self._delivered = False
+        self._keepalive_handle = self._loop.call_later(self.keepalive, self._send_keepalives)
+
+    @property
+    def dropped(self):
+        return (self._dropped_closed + self._pending_dropped +
+                sum(client.dropped for client in self._clients))
+
+    def overflow_count(self):
+        return self._overflowed_closed + sum(client.overflowed for client in self._clients)
+
+    def client_count(self):
+        return len(self._clients)
+
+    def queue_depths(self):
+        return [(client.id, client.depth()) for client in self._clients]
+
+    def close(self):
+        """Stop every client; callable from any thread."""
+        if threading.get_ident() != self._thread_id:
+            self._loop.call_soon_threadsafe(self.close)
+            return
+        self._keepalive_handle.cancel()
+        for client in list(self._clients):
+            client.close()
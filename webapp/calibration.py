@@ -0,0 +1,243 @@
+"""
+GuardianLink calibration profiles
+RSSI -> distance and RSSI -> proximity zone lookup tables
+
+Distance (the log-distance path-loss model, path_loss_distance) and
+proximity zone depend only on a device's calibration and its smoothed
+RSSI, and RSSI only spans a small range. A CalibrationProfile evaluates
+both once for every RSSI from RSSI_MIN to RSSI_MAX in RSSI_STEP steps, so
+a sample costs one table index instead of a pow(). Smoothed RSSI is
+rounded to the nearest step first; at n = 3.5 that moves a distance by at
+most 0.33%, far inside the model's own error. Readings outside the table
+fall back to the formula.
+
+Tables are only built for the default profile and the configured
+per-device overrides, and profiles with the same parameters share them.
+Profiles fitted per device (see auto_calibration.py) have parameters of
+their own, so a table each would cost ~20 KB per bracelet and a few
+milliseconds per refit; a FittedProfile evaluates the formula instead
+(~1 us more per sample) and costs a few dozen bytes.
+
+Profiles are immutable, and so is a Calibration apart from the fitted
+profiles, each added with one dict store. A configuration change builds
+a new Calibration and publishes it with one reference store (the server
+keeps it in the `config` snapshot), so a reader never sees a half-built
+table. The fitted profiles are carried over to it unless the zone
+thresholds changed.
+"""
+import math
+from array import array
+from functools import lru_cache
+from types import MappingProxyType
+
+# Table range and resolution (dBm); BLE reports RSSI as an int8
+RSSI_MIN = -127.0
+RSSI_MAX = 0.0
+RSSI_STEP = 0.1
+TABLE_SIZE = round((RSSI_MAX - RSSI_MIN) / RSSI_STEP) + 1
+
+# Zones from nearest to farthest, with their display colors
+ZONES = (
+    ("very_close", "#00ff00"),  # Bright green - 0-10m
+    ("near", "#ffff00"),  # Yellow - 10-20m
+    ("far", "#ff8800"),  # Orange - 20-30m
+    ("out_of_range", "#ff0000"),  # Red - >30m
+)
+# RSSI a device has to be above to be very_close, near and far
+DEFAULT_ZONE_THRESHOLDS = (-65.0, -75.0, -85.0)
+
+_EMPTY = MappingProxyType({})
+
+
+def path_loss_distance(rssi, tx_power, n):
+    """d = 10^((tx_power - rssi) / (10 n)) in meters, -1.0 for rssi 0."""
+    if rssi == 0:
+        return -1.0
+    return round(math.pow(10, (tx_power - rssi) / (10.0 * n)), 2)
+
+
+def zone_of(rssi, thresholds):
+    """(zone, color) of an RSSI under (very_close, near, far) thresholds."""
+    for zone, threshold in zip(ZONES, thresholds):
+        if rssi > threshold:
+            return zone
+    return ZONES[-1]
+
+
+def check_zone_thresholds(thresholds):
+    """
+    Validated (very_close, near, far) thresholds as a tuple of floats,
+    from a sequence or a {"very_close": .., "near": .., "far": ..} dict.
+    """
+    if isinstance(thresholds, dict):
+        try:
+            thresholds = [thresholds[zone] for zone, _ in ZONES[:-1]]
+        except KeyError as e:
+            raise ValueError(f"zone_thresholds is missing {e}") from None
+    thresholds = tuple(float(t) for t in thresholds)
+    if len(thresholds) != len(ZONES) - 1:
+        raise ValueError(f"zone_thresholds needs {len(ZONES) - 1} values")
+    if any(a <= b for a, b in zip(thresholds, thresholds[1:])):
+        raise ValueError("zone_thresholds must be decreasing (very_close > near > far)")
+    return thresholds
+
+
+class CalibrationProfile:
+    """
+    Distance and zone tables for one (tx_power, path_loss_exponent,
+    zone_thresholds). Build through profile() to share equal ones.
+    """
+
+    __slots__ = ("tx_power", "path_loss_exponent", "zone_thresholds", "_distances", "_zones")
+
+    def __init__(self, tx_power, path_loss_exponent, zone_thresholds=DEFAULT_ZONE_THRESHOLDS):
+        tx_power = float(tx_power)
+        path_loss_exponent = float(path_loss_exponent)
+        if not path_loss_exponent > 0:
+            raise ValueError("path_loss_exponent must be > 0")
+        self.tx_power = tx_power
+        self.path_loss_exponent = path_loss_exponent
+        self.zone_thresholds = check_zone_thresholds(zone_thresholds)
+        steps = [round(RSSI_MIN + i * RSSI_STEP, 1) for i in range(TABLE_SIZE)]
+        self._distances = array("d", (path_loss_distance(rssi, tx_power, path_loss_exponent)
+                                      for rssi in steps))
+        # References to the shared ZONES entries: ~20 KB per profile in all
+        self._zones = tuple(zone_of(rssi, self.zone_thresholds) for rssi in steps)
+
+    def lookup(self, rssi):
+        """(distance, (zone, color)) for a (smoothed) RSSI, in one index."""
+        i = int((rssi - RSSI_MIN) / RSSI_STEP + 0.5)
+        if rssi >= RSSI_MIN and i < TABLE_SIZE:
+            return self._distances[i], self._zones[i]
+        return (path_loss_distance(rssi, self.tx_power, self.path_loss_exponent),
+                zone_of(rssi, self.zone_thresholds))
+
+    def distance(self, rssi):
+        """Distance in meters for a (smoothed) RSSI."""
+        i = int((rssi - RSSI_MIN) / RSSI_STEP + 0.5)
+        if rssi >= RSSI_MIN and i < TABLE_SIZE:
+            return self._distances[i]
+        return path_loss_distance(rssi, self.tx_power, self.path_loss_exponent)
+
+    def zone(self, rssi):
+        """(zone, color) for a (smoothed) RSSI."""
+        i = int((rssi - RSSI_MIN) / RSSI_STEP + 0.5)
+        if rssi >= RSSI_MIN and i < TABLE_SIZE:
+            return self._zones[i]
+        return zone_of(rssi, self.zone_thresholds)
+
+    def params(self):
+        return {"tx_power": self.tx_power, "path_loss_exponent": self.path_loss_exponent}
+
+    def __repr__(self):
+        return (f"CalibrationProfile(tx_power={self.tx_power}, "
+                f"path_loss_exponent={self.path_loss_exponent}, "
+                f"zone_thresholds={self.zone_thresholds})")
+
+
+class FittedProfile:
+    """
+    Same interface as CalibrationProfile, evaluated with the formula
+    rather than looked up: one per fitted device, so no table.
+    `zone_thresholds` must already be validated.
+    """
+
+    __slots__ = ("tx_power", "path_loss_exponent", "zone_thresholds")
+
+    def __init__(self, tx_power, path_loss_exponent, zone_thresholds=DEFAULT_ZONE_THRESHOLDS):
+        path_loss_exponent = float(path_loss_exponent)
+        if not path_loss_exponent > 0:
+            raise ValueError("path_loss_exponent must be > 0")
+        self.tx_power = float(tx_power)
+        self.path_loss_exponent = path_loss_exponent
+        self.zone_thresholds = zone_thresholds
+
+    def lookup(self, rssi):
+        """(distance, (zone, color)) for a (smoothed) RSSI."""
+        return (path_loss_distance(rssi, self.tx_power, self.path_loss_exponent),
+                zone_of(rssi, self.zone_thresholds))
+
+    def distance(self, rssi):
+        """Distance in meters for a (smoothed) RSSI."""
+        return path_loss_distance(rssi, self.tx_power, self.path_loss_exponent)
+
+    def zone(self, rssi):
+        """(zone, color) for a (smoothed) RSSI."""
+        return zone_of(rssi, self.zone_thresholds)
+
+    params = CalibrationProfile.params
+
+    def __repr__(self):
+        return (f"FittedProfile(tx_power={self.tx_power}, "
+                f"path_loss_exponent={self.path_loss_exponent}, "
+                f"zone_thresholds={self.zone_thresholds})")
+
+
+@lru_cache(maxsize=256)
+def profile(tx_power, path_loss_exponent, zone_thresholds=DEFAULT_ZONE_THRESHOLDS):
+    """The shared CalibrationProfile for these parameters."""
+    return CalibrationProfile(tx_power, path_loss_exponent, zone_thresholds)
+
+
+class Calibration:
+    """
+    The default profile plus per-device profiles, keyed by device id:
+    configured overrides and fitted profiles. An override wins over a
+    fitted profile.
+
+    Args:
+        default: CalibrationProfile of devices without their own
+        devices: {device_id: CalibrationProfile} configured overrides
+        fitted: {device_id: FittedProfile} fitted profiles
+    """
+
+    __slots__ = ("default", "devices", "fitted", "_profiles")
+
+    def __init__(self, default, devices=None, fitted=None):
+        self.default = default
+        self.devices = MappingProxyType(dict(devices)) if devices else _EMPTY
+        self.fitted = dict(fitted or {})
+        self._profiles = dict(self.fitted, **self.devices)
+
+    @classmethod
+    def build(cls, tx_power, path_loss_exponent, zone_thresholds=DEFAULT_ZONE_THRESHOLDS,
+              device_params=None, fitted_params=None, previous=None):
+        """
+        Calibration from the default parameters, {device_id: (tx_power,
+        path_loss_exponent)} overrides and fitted parameters in the same
+        form. Every profile shares the zone thresholds. The fitted
+        profiles of `previous` (a Calibration) are reused instead of
+        `fitted_params` when its zone thresholds are the same.
+        """
+        zone_thresholds = check_zone_thresholds(zone_thresholds)
+        devices = {device_id: profile(float(tx), float(n), zone_thresholds)
+                   for device_id, (tx, n) in (device_params or {}).items()}
+        if previous is not None and previous.default.zone_thresholds == zone_thresholds:
+            fitted = previous.fitted
+        else:
+            fitted = {device_id: FittedProfile(tx, n, zone_thresholds)
+                      for device_id, (tx, n) in (fitted_params or {}).items()}
+        return cls(profile(float(tx_power), float(path_loss_exponent), zone_thresholds),
+                   devices, fitted)
+
+    def profile(self, device_id):
+        """The profile a device's samples are converted with."""
+        return self._profiles.get(device_id, self.default)
+
+    def set_fitted(self, device_id, tx_power, path_loss_exponent):
+        """
+        Publish a device's fitted parameters; returns the profile now in
+        effect for it (its override, if it has one).
+        """
+        fitted = FittedProfile(tx_power, path_loss_exponent, self.default.zone_thresholds)
+        self.fitted[device_id] = fitted
+        if device_id in self.devices:
+            return self.devices[device_id]
+        self._profiles[device_id] = fitted
+        return fitted
+
+    def drop_fitted(self, device_id):
+        """Put a device back on its override or the default profile."""
+        self.fitted.pop(device_id, None)
+        if device_id not in self.devices:
+            self._profiles.pop(device_id, None)
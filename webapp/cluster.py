@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+GuardianLink sharded server
+Runs server.py in several pre-forked worker processes that share one
+listening socket and one event bus (see event_bus.py)
+
+Each device belongs to exactly one worker: shard = crc32(device id) %
+workers. A worker accepts any request. /ingest records and BLE samples
+for a device of another shard are checked and forwarded over the bus to
+its owner. Only the owner keeps the device's state, so the samples of one
+device are still applied in order, by one process. Every event, from
+every worker, goes through the bus to all workers. Each worker's /events
+clients therefore see the whole fleet, with the same SSE ids whichever
+worker they are connected to. Parent location, configuration and geofence
+changes are applied on every worker.
+
+Owners also publish their devices' snapshots over the bus, coalesced
+per device over SNAPSHOT_REPLICATION_WINDOW. Every worker keeps a copy of
+all of them (device_registry.SnapshotReplicas), so /api/status and
+/api/devices answer for the whole fleet, identically on every worker.
+/api/geofences occupancy answers from the worker's own shard.
+
+The supervisor binds the port and the bus socket, forks the workers, and
+then relays bus messages on its main thread. A worker that dies is
+restarted. Its devices start over from their next sample, and its
+/events clients reconnect to another worker.
+
+Usage:
+    python cluster.py --workers 4 [--host 0.0.0.0] [--port 5001]
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import tempfile
+
+import server
+from event_bus import BusHub, UnixSocketBus
+
+
+def run_worker(index, count, listener, bus_path):
+    """Serve server.wsgi_app as shard `index`; never returns."""
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Without the hub this worker can no longer deliver events; exit so
+    # the supervisor restarts it (or is itself gone)
+    bus = UnixSocketBus(bus_path, index, on_disconnect=lambda: os._exit(1))
+    server.join_cluster(bus, index, count)
+    server.start_background_threads()
+    host, port = listener.getsockname()[:2]
+    make_server(host, port, server.wsgi_app, threaded=True, fd=listener.fileno()).serve_forever()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GuardianLink sharded server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--backlog", type=int, default=4096)
+    parser.add_argument("--bus", default=os.path.join(tempfile.gettempdir(),
+                                                      f"guardianlink-bus-{os.getpid()}.sock"),
+                        help="Unix socket path of the event bus")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+    hub = BusHub(args.bus)
+    workers = {}  # pid -> shard
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            hub.close(unlink=False)
+            try:
+                run_worker(index, args.workers, listener, args.bus)
+            finally:
+                os._exit(1)
+        workers[pid] = index
+
+    def reap():
+        """Restart workers that exited; False once the cluster stops."""
+        while workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return True
+            if pid == 0:
+                return True
+            index = workers.pop(pid)
+            print(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+            spawn(index)
+        return True
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    print("=" * 60)
+    print("GuardianLink Backend Server (sharded)")
+    print("=" * 60)
+    print(f"Workers: {args.workers}  Port: {args.port}  Bus: {args.bus}")
+
+    for index in range(args.workers):
+        spawn(index)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        hub.run(reap)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        hub.close()
+        listener.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
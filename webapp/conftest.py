@@ -0,0 +1,2 @@
+# test_client.py is a manual client for a running server, not a test module
+collect_ignore = ["test_client.py"]
@@ -0,0 +1,428 @@
+"""
+GuardianLink device registry
+Tracks per-bracelet state keyed by device_id, with address aliases
+
+Each DeviceState is owned by the writers: the sample path and the config
+handlers, which the server serializes under one lock. After every update
+the writer publishes an immutable DeviceSnapshot with publish(). Readers
+such as /api/status, /api/devices and SSE status events only read
+`device.snapshot`. That is a single atomic attribute load, so a reader
+never takes a lock and never sees half of an update. Every publish()
+advances the registry's VersionClock, which long-poll readers block on.
+
+Memory per tracked device (CPython 3.11, 64-bit), measured with tracemalloc
+over 100k devices that each have an address alias, RSSI and a location:
+  DeviceState object (__slots__, no __dict__)   ~200 bytes
+  RSSI ring buffer (array('f'), 3 samples)       ~76 bytes
+  boxed floats for rssi/distance/coords/times    ~24 bytes each
+  device_id/address strings + dict entries        ~150 bytes
+  RSSI filter (rssi_filters.py)                  ~100-250 bytes
+  fall detector (fall_detector.py)               ~460 bytes
+  published DeviceSnapshot (18-field tuple)      ~200 bytes
+  ----------------------------------------------------------------
+  ~1490 bytes per device with the default moving-average filter, so 100k
+  devices fit in ~150 MB.
+
+Fall history is allocated lazily on the first fall, so devices that never
+fall pay nothing for it (a populated history adds ~700 bytes). The same
+goes for the multi-observer ObservationWindow (~870 bytes), which only
+devices seen by a second observer get.
+"""
+import threading
+from array import array
+from collections import deque
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from trilateration import ObservationWindow
+
+# Number of raw RSSI samples kept per device for smoothing / fall detection
+RSSI_WINDOW = 3
+
+# Number of fall timestamps kept per device
+FALL_HISTORY = 10
+
+# Where a device's current location came from (DeviceState.location_source).
+# Only projected locations derive from the parent's fix, so only they are
+# recomputed when it or the calibration changes.
+LOCATION_PROJECTED = "projected"  # RSSI distance along the parent's heading
+LOCATION_TRILATERATED = "trilaterated"  # fused from several observers
+LOCATION_GPS = "gps"  # reported by the bracelet itself
+
+
+def _isoformat(ts):
+    return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+
+def _resolve_all(futures):
+    for future in futures:
+        if not future.done():
+            future.set_result(None)
+
+
+class VersionClock:
+    """
+    Counts published state changes. Long-poll readers block in wait() or
+    wait_async() until the version moves past the one they last saw.
+    advance() is a bare increment while nobody is waiting.
+    """
+
+    __slots__ = ("version", "_cond", "_waiters", "_async_waiters")
+
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+        self._waiters = 0
+        self._async_waiters = {}  # loop -> set of futures
+
+    def advance(self):
+        """Bump the version and wake every waiter (writers only)."""
+        self.version += 1
+        if self._waiters or self._async_waiters:
+            with self._cond:
+                self._cond.notify_all()
+                async_waiters, self._async_waiters = self._async_waiters, {}
+            for loop, futures in async_waiters.items():
+                loop.call_soon_threadsafe(_resolve_all, futures)
+        return self.version
+
+    def wait(self, since, timeout):
+        """Block until the version differs from `since`; False on timeout."""
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self.version != since, timeout)
+            finally:
+                self._waiters -= 1
+
+    async def wait_async(self, since, timeout):
+        """wait() for coroutines; does not block the event loop."""
+        import asyncio  # only the async server gets here; keeps it off startup
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self.version != since:
+                return True
+            self._async_waiters.setdefault(loop, set()).add(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                futures = self._async_waiters.get(loop)
+                if futures is not None:
+                    futures.discard(future)
+                    if not futures:
+                        del self._async_waiters[loop]
+
+
+class DeviceSnapshot(NamedTuple):
+    """
+    Immutable, self-consistent view of one device as of its last publish().
+
+    Timestamps are epoch floats, rendered to ISO strings only when
+    serialized.
+    """
+
+    device_id: Optional[str]
+    address: Optional[str]
+    connected: bool
+    rssi: Optional[float]
+    distance: Optional[float]
+    proximity_zone: Optional[str]
+    zone_color: Optional[str]
+    last_seen: Optional[float]
+    battery: int
+    lat: Optional[float]
+    lng: Optional[float]
+    accuracy: Optional[float]
+    last_lat: Optional[float]
+    last_lng: Optional[float]
+    last_location_ts: Optional[float]
+    yaw: Optional[float]
+    steps: Optional[int]
+    falls: Tuple[float, ...]
+
+    def last_known_location(self):
+        return {
+            "lat": self.last_lat,
+            "lng": self.last_lng,
+            "address": None,
+            "timestamp": _isoformat(self.last_location_ts)
+        }
+
+    def to_dict(self):
+        """Serialize in the same shape /api/status has always returned."""
+        return {
+            "device_id": self.device_id,
+            "connected": self.connected,
+            "rssi": self.rssi,
+            "distance": self.distance,
+            "proximity_zone": self.proximity_zone,
+            "zone_color": self.zone_color,
+            "last_seen": _isoformat(self.last_seen),
+            "battery": self.battery,
+            "address": self.address,
+            "location": {
+                "lat": self.lat,
+                "lng": self.lng,
+                "address": None,
+                "accuracy": self.accuracy
+            },
+            "yaw": self.yaw,
+            "steps": self.steps,
+            "falls": [_isoformat(ts) for ts in self.falls]
+        }
+
+
+class DeviceState:
+    """
+    Compact mutable state for one bracelet (writers only; readers use
+    `snapshot`).
+
+    Timestamps are stored as epoch floats and only rendered to ISO strings
+    when serialized.
+    """
+
+    __slots__ = (
+        "device_id", "address", "connected", "rssi", "distance",
+        "proximity_zone", "zone_color", "last_seen", "battery",
+        "lat", "lng", "accuracy", "location_source", "last_lat", "last_lng", "last_location_ts",
+        "yaw", "steps", "rssi_filter", "fall_detector", "_rssi_ring", "_rssi_count", "_rssi_pos",
+        "_falls", "observations", "snapshot", "_registry",
+    )
+
+    def __init__(self, device_id, address=None, registry=None):
+        self.device_id = device_id
+        self.address = address
+        self.connected = False
+        self.rssi = None
+        self.distance = None
+        self.proximity_zone = None
+        self.zone_color = None
+        self.last_seen = None
+        self.battery = 85
+        self.lat = None
+        self.lng = None
+        self.accuracy = None
+        self.location_source = None
+        self.last_lat = None
+        self.last_lng = None
+        self.last_location_ts = None
+        self.yaw = None
+        self.steps = None
+        self.rssi_filter = None  # created lazily by the server's filter config
+        self.fall_detector = None  # likewise (fall_detector.py)
+        self._rssi_ring = array("f", bytes(4 * RSSI_WINDOW))
+        self._rssi_count = 0
+        self._rssi_pos = 0
+        self._falls = None
+        self.observations = None  # ObservationWindow, created on the first observe()
+        self._registry = registry
+        self.publish()
+
+    def publish(self):
+        """Publish the current fields as a new immutable snapshot."""
+        self.snapshot = DeviceSnapshot(
+            self.device_id, self.address, self.connected, self.rssi, self.distance,
+            self.proximity_zone, self.zone_color, self.last_seen, self.battery,
+            self.lat, self.lng, self.accuracy, self.last_lat, self.last_lng, self.last_location_ts,
+            self.yaw, self.steps, tuple(self._falls) if self._falls else ()
+        )
+        registry = self._registry
+        if registry is not None:
+            registry.clock.advance()
+            if registry.on_publish is not None:
+                registry.on_publish(self.snapshot)
+        return self.snapshot
+
+    # ------------------------------------------------------------------
+    # RSSI history
+    # ------------------------------------------------------------------
+
+    def push_rssi(self, rssi):
+        """Append a raw RSSI sample to the ring buffer."""
+        self._rssi_ring[self._rssi_pos] = rssi
+        self._rssi_pos = (self._rssi_pos + 1) % RSSI_WINDOW
+        if self._rssi_count < RSSI_WINDOW:
+            self._rssi_count += 1
+
+    def rssi_sample_count(self):
+        return self._rssi_count
+
+    def rssi_mean(self):
+        """Mean of the buffered raw RSSI samples (None if empty)."""
+        n = self._rssi_count
+        if n == 0:
+            return None
+        if n == RSSI_WINDOW:
+            return sum(self._rssi_ring) / n
+        return sum(self._rssi_ring[:n]) / n
+
+    def smoothed_rssi(self):
+        """Latest filter output, or the raw mean before a filter exists."""
+        if self.rssi_filter is not None and self.rssi_filter.value is not None:
+            return self.rssi_filter.value
+        return self.rssi_mean()
+
+    # ------------------------------------------------------------------
+    # Fall history
+    # ------------------------------------------------------------------
+
+    def record_fall(self, ts):
+        if self._falls is None:
+            self._falls = deque(maxlen=FALL_HISTORY)
+        self._falls.append(ts)
+
+    # ------------------------------------------------------------------
+    # Location
+    # ------------------------------------------------------------------
+
+    def set_location(self, lat, lng, ts, source, accuracy=None):
+        """
+        Update current location; remember it as last known when connected.
+        `source` is one of the LOCATION_* constants; `accuracy` is the
+        uncertainty radius in meters, when known.
+        """
+        self.lat = lat
+        self.lng = lng
+        self.accuracy = accuracy
+        self.location_source = source
+        if self.connected:
+            self.last_lat = lat
+            self.last_lng = lng
+            self.last_location_ts = ts
+
+    def last_known_location(self):
+        return {
+            "lat": self.last_lat,
+            "lng": self.last_lng,
+            "address": None,
+            "timestamp": _isoformat(self.last_location_ts)
+        }
+
+    def observe(self, observer, lat, lng, distance, ts):
+        """Record one observer's position and RSSI distance to this device."""
+        if self.observations is None:
+            self.observations = ObservationWindow()
+        self.observations.add(observer, lat, lng, distance, ts)
+
+
+class DeviceRegistry:
+    """
+    O(1) lookup of DeviceState by device_id or by BLE/hardware address.
+
+    Lookups are safe from any thread. get_or_create() must be called by a
+    writer, i.e. under the server's state lock. `clock` advances on every
+    publish() of a device created here, and `on_publish` (if set) is
+    called with the new snapshot.
+    """
+
+    def __init__(self):
+        self.clock = VersionClock()
+        self.on_publish = None
+        self._devices = {}
+        self._aliases = {}  # address -> device_id
+        self._last_updated = None
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get(self, key):
+        """Look up a device by device_id or address; None if unknown."""
+        device = self._devices.get(key)
+        if device is None:
+            device_id = self._aliases.get(key)
+            if device_id is not None:
+                device = self._devices.get(device_id)
+        return device
+
+    def get_or_create(self, device_id, address=None):
+        """Return the device for `device_id`, creating it on first sight."""
+        device = self.get(device_id)
+        if device is None:
+            device = self._devices.setdefault(device_id, DeviceState(device_id, registry=self))
+        if address and address != device.device_id and device.address != address:
+            device.address = address
+            self._aliases[address] = device.device_id
+            device.publish()
+        return device
+
+    def touch(self, device):
+        """Remember `device` as the most recently updated one."""
+        self._last_updated = device
+
+    def most_recent(self):
+        """The most recently updated device (None before the first sample)."""
+        return self._last_updated
+
+    def devices(self):
+        return list(self._devices.values())
+
+    # Read interface shared with SnapshotReplicas
+
+    def snapshot(self, key):
+        """A device's published snapshot by device_id or address; None if unknown."""
+        device = self.get(key)
+        return device.snapshot if device is not None else None
+
+    def most_recent_snapshot(self):
+        device = self._last_updated
+        return device.snapshot if device is not None else None
+
+    def snapshots(self):
+        return [device.snapshot for device in self._devices.values()]
+
+
+class SnapshotReplicas:
+    """
+    Copies of the snapshots of every device of a sharded server, which
+    each worker keeps so that it can answer for devices it does not own.
+
+    Owners publish their snapshots over the event bus (see server.py) and
+    every worker, the owner included, put()s them here in bus order, so
+    all workers answer with the same snapshots. Same read interface as
+    DeviceRegistry. put() is called by one thread (the bus reader);
+    lookups are safe from any thread.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._snapshots = {}
+        self._aliases = {}  # address -> device_id
+        self._most_recent = None
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def put(self, snapshots):
+        """Store newer snapshots and wake the long-poll readers once."""
+        for snapshot in snapshots:
+            device_id = snapshot.device_id
+            self._snapshots[device_id] = snapshot
+            if snapshot.address and snapshot.address != device_id:
+                self._aliases[snapshot.address] = device_id
+            recent = self._most_recent
+            if (recent is None or recent.device_id == device_id
+                    or (snapshot.last_seen or 0) >= (recent.last_seen or 0)):
+                self._most_recent = snapshot
+        self.clock.advance()
+
+    def snapshot(self, key):
+        """A device's snapshot by device_id or address; None if unknown."""
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            device_id = self._aliases.get(key)
+            if device_id is not None:
+                snapshot = self._snapshots.get(device_id)
+        return snapshot
+
+    def most_recent_snapshot(self):
+        """The snapshot with the latest last_seen (None before any)."""
+        return self._most_recent
+
+    def snapshots(self):
+        return list(self._snapshots.values())
@@ -0,0 +1,283 @@
+"""
+GuardianLink event bus
+Carries events, forwarded samples and configuration changes between the
+worker processes of a sharded server (see cluster.py)
+
+Every worker connects to one BusHub over a Unix domain socket. A message
+is a fixed header (body length, topic, target shard, sequence number)
+followed by a JSON body. The hub relays messages in arrival order, either
+to the worker that owns the target shard or, when there is none, to every
+worker including the sender. It also numbers "event" messages. Every
+worker therefore publishes an event under the same SSE id, and a client
+that reconnects to another worker resumes with Last-Event-ID where it
+left off.
+
+LocalBus is the in-process stand-in with the same interface. It is used
+by a single-process server and for testing handlers: publish() calls the
+handlers directly, and events are left for the broadcaster to number.
+"""
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+
+# Message topics; the header carries their index
+HELLO = "hello"  # worker -> hub: the shard this connection owns
+TOPICS = (HELLO, "event", "ingest", "sample", "control", "snapshot")
+TOPIC_CODES = {topic: code for code, topic in enumerate(TOPICS)}
+EVENT_CODE = TOPIC_CODES["event"]
+
+# Target shard of a message delivered to every worker
+ALL = -1
+
+# Body length, topic, target shard, sequence number (0 until the hub sets it)
+HEADER = struct.Struct("!IBhQ")
+
+# Bytes the hub buffers for a worker that stopped reading before it is
+# disconnected (the supervisor then restarts it)
+MAX_PEER_BACKLOG = 64 * 1024 * 1024
+
+
+def encode_message(topic, message, shard=ALL, seq=0):
+    """One framed bus message."""
+    body = json.dumps(message, separators=(",", ":"), default=str).encode()
+    return HEADER.pack(len(body), TOPIC_CODES[topic], shard, seq) + body
+
+
+def _split_frames(buffer):
+    """Pop the complete frames off the front of a bytearray."""
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= HEADER.size:
+        length = HEADER.unpack_from(buffer, offset)[0]
+        end = offset + HEADER.size + length
+        if end > len(buffer):
+            break
+        frames.append(bytes(buffer[offset:end]))
+        offset = end
+    del buffer[:offset]
+    return frames
+
+
+class LocalBus:
+    """
+    In-process bus: every message goes straight to every handler, on the
+    publishing thread. Used by a single-process server.
+    """
+
+    def __init__(self):
+        self._handlers = ()
+
+    def subscribe(self, handler):
+        """Call handler(topic, message, seq) for every message."""
+        self._handlers = self._handlers + (handler,)
+
+    def publish(self, topic, message, shard=ALL):
+        for handler in self._handlers:
+            handler(topic, message, None)
+
+    def close(self):
+        pass
+
+
+class _Peer:
+    __slots__ = ("sock", "shard", "inbuf", "outbuf")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.shard = ALL
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+
+class BusHub:
+    """
+    Relay between the workers, run by the cluster supervisor on its main
+    thread. The socket is bound on construction, so workers forked
+    afterwards can connect before run() is entered.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.relayed = 0
+        self.dropped = 0  # shard-addressed messages with no owner connected
+        self._seq = 0
+        self._peers = {}
+        self._selector = selectors.DefaultSelector()
+        if os.path.exists(path):
+            os.unlink(path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen(64)
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+
+    def run(self, tick=None, interval=1.0):
+        """
+        Relay messages until tick() returns False; tick is called about
+        every `interval` seconds.
+        """
+        next_tick = time.monotonic() + interval
+        while True:
+            for key, mask in self._selector.select(max(0.0, next_tick - time.monotonic())):
+                if key.fileobj is self._listener:
+                    self._accept()
+                    continue
+                peer = key.data
+                if mask & selectors.EVENT_READ:
+                    self._read(peer)
+                if mask & selectors.EVENT_WRITE and peer.sock.fileno() != -1:
+                    self._flush(peer)
+            if time.monotonic() >= next_tick:
+                next_tick = time.monotonic() + interval
+                if tick is not None and tick() is False:
+                    return
+
+    def close(self, unlink=True):
+        """Close every socket (a forked worker passes unlink=False)."""
+        for peer in list(self._peers.values()):
+            peer.sock.close()
+        self._peers.clear()
+        self._listener.close()
+        self._selector.close()
+        if unlink and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        peer = self._peers[sock.fileno()] = _Peer(sock)
+        self._selector.register(sock, selectors.EVENT_READ, peer)
+
+    def _drop(self, peer):
+        self._peers.pop(peer.sock.fileno(), None)
+        self._selector.unregister(peer.sock)
+        peer.sock.close()
+
+    def _read(self, peer):
+        try:
+            data = peer.sock.recv(1 << 16)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(peer)
+            return
+        peer.inbuf += data
+        for frame in _split_frames(peer.inbuf):
+            self._route(peer, frame)
+
+    def _route(self, sender, frame):
+        length, topic, shard, _ = HEADER.unpack_from(frame)
+        if topic == TOPIC_CODES[HELLO]:
+            sender.shard = shard
+            return
+        if topic == EVENT_CODE:
+            self._seq += 1
+            frame = HEADER.pack(length, topic, shard, self._seq) + frame[HEADER.size:]
+        targets = [peer for peer in self._peers.values() if shard == ALL or peer.shard == shard]
+        if not targets:
+            self.dropped += 1
+            return
+        self.relayed += 1
+        for peer in targets:
+            if len(peer.outbuf) > MAX_PEER_BACKLOG:
+                print(f"Event bus: worker for shard {peer.shard} stopped reading; disconnecting")
+                self._drop(peer)
+                continue
+            pending = bool(peer.outbuf)
+            peer.outbuf += frame
+            if not pending:
+                self._flush(peer)
+
+    def _flush(self, peer):
+        try:
+            sent = peer.sock.send(peer.outbuf)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._drop(peer)
+            return
+        del peer.outbuf[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if peer.outbuf else 0)
+        if self._selector.get_key(peer.sock).events != events:
+            self._selector.modify(peer.sock, events, peer)
+
+
+class UnixSocketBus:
+    """
+    A worker's connection to the BusHub. publish() may be called from any
+    thread; handlers run on one reader thread, in hub order.
+
+    Args:
+        path: the hub's Unix socket
+        shard: shard this worker owns (messages addressed to it come here)
+        on_disconnect: called on the reader thread if the hub goes away
+    """
+
+    def __init__(self, path, shard=ALL, on_disconnect=None, connect_timeout=10.0):
+        self.path = path
+        self.shard = shard
+        self.on_disconnect = on_disconnect
+        self._handlers = ()
+        self._send_lock = threading.Lock()
+        self._sock = self._connect(path, connect_timeout)
+        self._sock.sendall(encode_message(HELLO, None, shard))
+        self._reader = None
+
+    @staticmethod
+    def _connect(path, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    def subscribe(self, handler):
+        """Call handler(topic, message, seq) for every message received."""
+        self._handlers = self._handlers + (handler,)
+        if self._reader is None:
+            self._reader = threading.Thread(target=self._read_loop, daemon=True, name="event-bus")
+            self._reader.start()
+
+    def publish(self, topic, message, shard=ALL):
+        data = encode_message(topic, message, shard)
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def close(self):
+        self._sock.close()
+
+    def _read_loop(self):
+        buffer = bytearray()
+        while True:
+            try:
+                data = self._sock.recv(1 << 16)
+            except OSError:
+                data = b""
+            if not data:
+                if self.on_disconnect is not None:
+                    self.on_disconnect()
+                return
+            buffer += data
+            for frame in _split_frames(buffer):
+                _, topic, _, seq = HEADER.unpack_from(frame)
+                message = json.loads(frame[HEADER.size:])
+                for handler in self._handlers:
+                    try:
+                        handler(TOPICS[topic], message, seq or None)
+                    except Exception as e:
+                        print(f"Event bus handler error ({TOPICS[topic]}): {e}")
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+GuardianLink fall detection
+Streaming per-device detector that fuses RSSI and IMU evidence, plus an
+offline evaluator for recorded traces
+
+Each sample updates a handful of running values in O(1): an EWMA RSSI
+baseline, and the time and strength of the latest evidence of each kind:
+
+  rssi_drop   RSSI fell `rssi_drop` dB or more below the baseline
+  sustained   the next RSSI sample is still that far down
+  impact      MotionLogic's smoothed accel magnitude (amag_g) spiked
+  rotation    |yaw_rate| spiked (the wrist tumbled)
+  hardware    the bracelet's own fall flag
+  still       the bracelet went still shortly after other evidence
+
+Evidence is combined by noisy-OR: confidence = 1 - prod(1 - p_i) over the
+evidence seen within `window` seconds. Stillness confirms evidence from
+up to `settle` seconds earlier. A fall is reported once the confidence
+reaches `threshold`, so a single RSSI glitch or a wrist flick alone does
+not alert. Walking or running after the candidate clears it, and RSSI
+drops while the IMU reports walking or running are put down to the child
+moving away. Bracelets without an IMU stream are judged on RSSI alone.
+
+After an alert the device is in cooldown. Evidence crossing the threshold
+again within `cooldown` seconds comes back as a suppressed alert, so
+repeated hardware flags and a lingering RSSI drop produce one alert.
+
+Usage (offline evaluation of a TRACE_FILE recording or loadgen synth --out):
+    python fall_detector.py trace.ndjson
+    python fall_detector.py trace.ndjson --threshold 0.7 --cooldown 20
+"""
+import argparse
+import math
+import sys
+import time
+from array import array
+from typing import NamedTuple, Tuple
+
+from trace_recorder import read_trace
+
+# Evidence kinds (indexes into the per-device evidence arrays)
+RSSI_DROP, SUSTAINED, IMPACT, ROTATION, HARDWARE, STILL = range(6)
+EVIDENCE = ("rssi_drop", "sustained", "impact", "rotation", "hardware", "still")
+
+# Probability of a fall given each kind of evidence. Ranges scale with how
+# far past its threshold the feature went (up to twice the threshold).
+P_RSSI_DROP = (0.40, 0.55)
+P_SUSTAINED = 0.35
+P_IMPACT = (0.40, 0.60)
+P_ROTATION = 0.20
+P_HARDWARE = 0.60
+P_STILL = 0.45
+
+# MotionLogic states (bracelet/MotionLogic.cpp)
+MOVING_STATES = ("walking", "running")
+
+
+class FallParams(NamedTuple):
+    rssi_drop: float = 15.0     # dB below the baseline
+    window: float = 2.0         # seconds within which evidence combines
+    settle: float = 5.0         # seconds stillness may follow other evidence
+    impact_g: float = 1.8       # smoothed |a| in g
+    rotation: float = 3.0       # |yaw rate| in rad/s
+    threshold: float = 0.6      # confidence that raises an alert
+    cooldown: float = 30.0      # seconds during which repeats are suppressed
+    baseline_alpha: float = 0.25
+    warmup: int = 3             # RSSI samples before drops are judged
+
+
+class FallAlert(NamedTuple):
+    ts: float
+    confidence: float
+    reasons: Tuple[str, ...]
+    suppressed: bool            # within the cooldown of a previous alert
+
+
+def _scaled(p_range, value, threshold):
+    low, high = p_range
+    excess = min(1.0, max(0.0, (value - threshold) / threshold))
+    return low + (high - low) * excess
+
+
+class FallDetector:
+    """Streaming fall detector for one device; feed samples in time order."""
+
+    __slots__ = ("params", "_baseline", "_rssi_count", "_drop_since", "_moving_ts",
+                 "_ts", "_p", "_last_alert", "suppressed")
+
+    def __init__(self, params=FallParams()):
+        self.params = params
+        self._baseline = 0.0
+        self._rssi_count = 0
+        self._drop_since = None
+        self._moving_ts = -math.inf
+        self._ts = array("d", [-math.inf] * len(EVIDENCE))
+        self._p = array("d", bytes(8 * len(EVIDENCE)))
+        self._last_alert = -math.inf
+        self.suppressed = 0
+
+    def rssi(self, rssi, ts):
+        """Feed one raw RSSI sample; returns a FallAlert or None."""
+        params = self.params
+        if self._rssi_count < params.warmup:
+            self._rssi_count += 1
+            self._baseline += (rssi - self._baseline) / self._rssi_count
+            return None
+        drop = self._baseline - rssi
+        if drop < params.rssi_drop or ts - self._moving_ts <= params.settle:
+            self._drop_since = None
+            self._baseline += params.baseline_alpha * (rssi - self._baseline)
+            return None
+        # The baseline is held while the signal is down, so the sample after
+        # a drop is judged against the level before it. A drop that lasts
+        # longer than `settle` is a new normal (bracelet in a bag, say).
+        if self._drop_since is None:
+            self._drop_since = ts
+            self._note(RSSI_DROP, ts, _scaled(P_RSSI_DROP, drop, params.rssi_drop))
+        elif ts - self._drop_since > params.settle:
+            self._drop_since = None
+            self._baseline = rssi
+            return None
+        elif ts - self._ts[RSSI_DROP] <= params.window:
+            self._note(SUSTAINED, ts, P_SUSTAINED)
+        return self._evaluate(ts)
+
+    def motion(self, ts, amag_g=None, yaw_rate=None, state=None, zupt=False):
+        """Feed MotionLogic features; returns a FallAlert or None."""
+        params = self.params
+        if amag_g is not None and amag_g >= params.impact_g:
+            self._note(IMPACT, ts, _scaled(P_IMPACT, amag_g, params.impact_g))
+        if yaw_rate is not None and abs(yaw_rate) >= params.rotation:
+            self._note(ROTATION, ts, P_ROTATION)
+        if state == "still" or zupt:
+            if ts - self._latest(exclude=STILL) <= params.settle:
+                self._note(STILL, ts, P_STILL)
+        elif state in MOVING_STATES:
+            self._moving_ts = ts
+            if ts - self._latest() > params.window:
+                self._clear()  # up and about again
+                return None
+        return self._evaluate(ts)
+
+    def hardware(self, ts):
+        """Feed the bracelet's own fall flag; returns a FallAlert or None."""
+        self._note(HARDWARE, ts, P_HARDWARE)
+        return self._evaluate(ts)
+
+    def confidence(self, now):
+        """Current fall confidence from the evidence still in the window."""
+        params = self.params
+        ts = self._ts
+        horizon = params.settle if now - ts[STILL] <= params.window else params.window
+        keep = 1.0
+        for i in range(len(EVIDENCE)):
+            if now - ts[i] <= horizon:
+                keep *= 1.0 - self._p[i]
+        return 1.0 - keep
+
+    def _note(self, kind, ts, p):
+        # Stronger evidence of a kind wins while the older one is still fresh
+        if ts - self._ts[kind] > self.params.window or p >= self._p[kind]:
+            self._p[kind] = p
+        self._ts[kind] = ts
+
+    def _latest(self, exclude=None):
+        return max(t for i, t in enumerate(self._ts) if i != exclude)
+
+    def _clear(self):
+        for i in range(len(EVIDENCE)):
+            self._ts[i] = -math.inf
+            self._p[i] = 0.0
+
+    def _evaluate(self, now):
+        confidence = self.confidence(now)
+        if confidence < self.params.threshold:
+            return None
+        horizon = self.params.settle if now - self._ts[STILL] <= self.params.window else self.params.window
+        reasons = tuple(name for name, ts in zip(EVIDENCE, self._ts) if now - ts <= horizon)
+        self._clear()
+        suppressed = now - self._last_alert < self.params.cooldown
+        if suppressed:
+            self.suppressed += 1
+        else:
+            self._last_alert = now
+        return FallAlert(now, round(confidence, 2), reasons, suppressed)
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+
+MOTION_FIELDS = ("amag_g", "yaw_rate", "state", "zupt")
+
+
+def _optional_float(record, field):
+    value = record.get(field)
+    return float(value) if value is not None else None
+
+
+def feed_motion(detector, record, ts):
+    """
+    Apply an ingest record's MotionLogic fields and fall flag.
+
+    Returns:
+        List of FallAlerts (suppressed ones included)
+    """
+    alerts = []
+    if any(field in record for field in MOTION_FIELDS):
+        alerts.append(detector.motion(ts, _optional_float(record, "amag_g"),
+                                      _optional_float(record, "yaw_rate"),
+                                      record.get("state"), bool(record.get("zupt"))))
+    if record.get("fall"):
+        alerts.append(detector.hardware(ts))
+    return [alert for alert in alerts if alert is not None]
+
+
+def feed(detector, record, ts):
+    """
+    Apply one trace / ingest record to a detector the way the server does:
+    motion and fall flag first, then the parent's RSSI (observer samples
+    from other gateways do not count).
+
+    Returns:
+        List of FallAlerts (suppressed ones included)
+    """
+    alerts = feed_motion(detector, record, ts)
+    if record.get("rssi") is not None and "observer" not in record:
+        alert = detector.rssi(float(record["rssi"]), ts)
+        if alert is not None:
+            alerts.append(alert)
+    return alerts
+
+
+def evaluate(records, params=FallParams(), tolerance=10.0):
+    """
+    Replay trace records through one detector per device.
+
+    Records labelled {"label": "fall"} mark true fall onsets. An alert
+    within `tolerance` seconds after an onset detects it; any other alert
+    is a false positive.
+
+    Returns:
+        Dict of counts, precision / recall when labels exist, detection
+        delay and per-sample cost
+    """
+    detectors = {}
+    truths = {}
+    alerts = {}
+    samples = suppressed = 0
+    elapsed = 0.0
+    for record in records:
+        device = record.get("device_id") or record.get("address") or "unknown"
+        ts = float(record.get("t", 0.0))
+        if record.get("label") == "fall":
+            truths.setdefault(device, []).append(ts)
+        detector = detectors.get(device)
+        if detector is None:
+            detector = detectors[device] = FallDetector(params)
+        started = time.perf_counter()
+        result = feed(detector, record, ts)
+        elapsed += time.perf_counter() - started
+        samples += 1
+        for alert in result:
+            if alert.suppressed:
+                suppressed += 1
+            else:
+                alerts.setdefault(device, []).append(alert.ts)
+
+    report = {
+        "samples": samples,
+        "devices": len(detectors),
+        "alerts": sum(len(ts) for ts in alerts.values()),
+        "suppressed": suppressed,
+        "us_per_sample": round(elapsed / samples * 1e6, 2) if samples else None,
+    }
+    if truths:
+        report.update(_score(truths, alerts, tolerance))
+    return report
+
+
+def _score(truths, alerts, tolerance):
+    tp = fp = 0
+    delays = []
+    missed = sum(len(onsets) for onsets in truths.values())
+    for device, alert_times in alerts.items():
+        onsets = sorted(truths.get(device, ()))
+        matched = set()
+        for ts in alert_times:
+            hit = next((i for i, onset in enumerate(onsets)
+                        if i not in matched and 0 <= ts - onset <= tolerance), None)
+            if hit is None:
+                fp += 1
+            else:
+                matched.add(hit)
+                tp += 1
+                delays.append(ts - onsets[hit])
+        missed -= len(matched)
+    precision = tp / (tp + fp) if tp + fp else None
+    recall = tp / (tp + missed) if tp + missed else None
+    return {
+        "falls": tp + missed,
+        "true_positives": tp,
+        "false_positives": fp,
+        "missed": missed,
+        "precision": round(precision, 3) if precision is not None else None,
+        "recall": round(recall, 3) if recall is not None else None,
+        "mean_delay_s": round(sum(delays) / len(delays), 2) if delays else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the fall detector on a recorded trace")
+    parser.add_argument("trace", help="NDJSON trace (TRACE_FILE recording or loadgen synth --out)")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="seconds after a labelled onset an alert still counts (default 10)")
+    for name, default in FallParams._field_defaults.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    params = FallParams(**{name: getattr(args, name) for name in FallParams._fields})
+    report = evaluate(read_trace(args.trace), params, args.tolerance)
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
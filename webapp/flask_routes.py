@@ -0,0 +1,424 @@
+"""
+GuardianLink HTTP API
+The Flask app and its routes. The state and the logic behind them live in
+server.py; importing Flask (with flask_cors) takes longer than the rest of
+the server put together, so server.load_app() imports this module on the
+first request that needs it.
+"""
+import math
+import os
+import time
+from datetime import datetime
+
+from flask import Flask, Response, jsonify, request, send_from_directory
+from flask_cors import CORS
+
+import binary_ingest
+import server
+from broadcaster import FrameCompressor, parse_event_id
+from calibration import ZONES
+from geofence import zone_from_dict
+from history_store import parse_time
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from rssi_filters import FILTERS
+
+app = Flask(__name__)
+CORS(app, expose_headers=["ETag"])  # Enable CORS for React frontend
+
+
+@app.route("/events")
+def sse_events():
+    """
+    Server-Sent Events stream for real-time updates. Reconnecting clients
+    resume after their Last-Event-ID.
+    
+    Query params:
+        compress: 1 to gzip/deflate the stream (when Accept-Encoding
+            allows it), 0 to never; default SSE_COMPRESSION
+    """
+    encoding = server.sse_encoding(request.headers.get("Accept-Encoding"),
+                                   request.args.get("compress"))
+    sub = server.broadcaster.subscribe(parse_event_id(request.headers.get("Last-Event-ID")))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": "Accept-Encoding"}
+    
+    def gen():
+        sent = server.sse_bytes_total.labels(encoding or "identity")
+        try:
+            if encoding is None:
+                for frame in sub.frames():
+                    sent.inc(len(frame))
+                    yield frame
+            else:
+                compress = FrameCompressor(encoding)
+                for frame in sub.frames():
+                    data = compress(frame)
+                    sent.inc(len(data))
+                    yield data
+        finally:
+            server.broadcaster.unsubscribe(sub)
+    
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(gen(), mimetype="text/event-stream", headers=headers)
+
+
+@app.route("/api/status", methods=["GET"])
+def get_status():
+    """
+    Get device status.
+    
+    Query params:
+        device: device_id or address (defaults to the most recently updated)
+        wait: long-poll for up to this many seconds until the status
+            differs from If-None-Match (or from the current status)
+    
+    Responds 304 when the status still matches If-None-Match.
+    """
+    try:
+        wait = server.parse_status_wait(request.args.get("wait"))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    key = request.args.get("device")
+    if_none_match = request.headers.get("If-None-Match")
+    if wait:
+        entry = server.wait_for_status(key, if_none_match or server.cached_status(key).etag, wait)
+    else:
+        entry = server.cached_status(key)
+    
+    status, headers, body = server.status_http(entry, if_none_match)
+    return Response(body, status=status, headers=headers)
+
+
+@app.route("/api/devices", methods=["GET"])
+def get_devices():
+    """
+    Bulk status for every tracked device.
+    
+    Query params:
+        ids: optional comma-separated device_ids/addresses to restrict to
+    """
+    return jsonify(server.devices_response(request.args.get("ids")))
+
+
+@app.route("/api/history", methods=["GET"])
+def get_history():
+    """
+    Recorded samples and events for one device.
+    
+    Query params:
+        device: device_id or address (required)
+        from, to: epoch seconds or ISO 8601 (default: the last hour)
+        step: bucket width in seconds for downsampling; by default the
+            range is split into at most HISTORY_MAX_POINTS buckets
+        raw: 1 to return every sample without downsampling
+    """
+    key = request.args.get("device")
+    if not key:
+        return jsonify({"success": False, "error": "device is required"}), 400
+    device = server.registry.get(key)
+    device_id = device.device_id if device is not None else key
+    
+    try:
+        end = parse_time(request.args.get("to"), time.time())
+        start = parse_time(request.args.get("from"), end - 3600)
+        step = float(request.args.get("step", 0))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    if request.args.get("raw") == "1":
+        step = None
+    elif step <= 0:
+        max_points = server.HISTORY_MAX_POINTS
+        step = (end - start) / max_points if end - start > max_points else None
+    
+    return jsonify({
+        "success": True,
+        "device": device_id,
+        "from": start,
+        "to": end,
+        "step": step,
+        "samples": server.history.query_samples(device_id, start, end, step),
+        "events": server.history.query_events(device_id, start, end)
+    })
+
+
+@app.route("/api/parent-location", methods=["POST"])
+def update_parent_location():
+    """
+    Update parent's GPS location and compass heading.
+    
+    Expected JSON:
+    {
+        "lat": 37.7749,
+        "lng": -122.4194,
+        "heading": 45  // Optional: compass direction in degrees
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        server.set_parent_location({
+            "lat": data.get("lat"),
+            "lng": data.get("lng"),
+            "heading": data.get("heading", 0)
+        })
+        
+        key = data.get("device")
+        device = server.snapshots.snapshot(key) if key else server.snapshots.most_recent_snapshot()
+        if device is not None and device.distance:
+            child_lat, child_lng = device.lat, device.lng
+            
+            # Calculate bearing and direction
+            bearing = server.calculate_bearing(
+                data["lat"], data["lng"],
+                child_lat, child_lng
+            )
+            direction_text = server.bearing_to_direction(bearing)
+            
+            return jsonify({
+                "success": True,
+                "child_location": {
+                    "device": device.device_id,
+                    "lat": child_lat,
+                    "lng": child_lng,
+                    "distance": device.distance,
+                    "bearing": round(bearing, 1),
+                    "direction": direction_text
+                }
+            })
+        
+        return jsonify({"success": True})
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route("/api/calibrate", methods=["GET", "POST"])
+def calibrate_rssi():
+    """
+    Calibrate RSSI-to-distance conversion from a measured distance.
+    
+    Expected JSON:
+    {
+        "rssi": -65,
+        "actual_distance": 1.0,  // meters
+        "device": "GL-0001"  // optional, see below
+    }
+    
+    Without "device", solves the global tx_power for the configured
+    path-loss exponent. With it, adds a point to that bracelet's fit,
+    which solves both its tx_power and exponent once its points span
+    enough distance. {"device": ..., "reset": true} forgets the
+    bracelet's points. GET lists every fit (?device= for one).
+    """
+    if request.method == "GET":
+        device_id = request.args.get("device")
+        with server.state_lock:
+            ids = [device_id] if device_id is not None else list(server.autocal.fits)
+            fits = {i: server.autocal.describe(i) for i in ids if i in server.autocal.fits}
+        return jsonify({"devices": fits, "shard": server.shard_index})
+    
+    try:
+        data = request.get_json()
+        device_id = data.get("device")
+        if device_id is not None:
+            return jsonify(server.calibrate_device(str(device_id), data))
+        rssi = data["rssi"]
+        actual_distance = data["actual_distance"]
+        
+        with server.state_lock:
+            # Calculate tx_power (RSSI at 1 meter): rssi = tx_power - 10 n log10(d)
+            tx_power = rssi + (10 * server.config.path_loss_exponent * math.log10(actual_distance))
+            server.set_config(server.config._replace(tx_power=tx_power))
+        
+        return jsonify({
+            "success": True,
+            "tx_power": round(tx_power, 1),
+            "message": "Calibration successful"
+        })
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route("/api/test-fall", methods=["POST"])
+def test_fall():
+    """Trigger a test fall event."""
+    server.push_event({
+        "type": "fall_detected",
+        "severity": "high",
+        "source": "manual_test",
+        "timestamp": datetime.now().isoformat()
+    })
+    return jsonify({"success": True})
+
+
+@app.route("/api/config", methods=["GET", "POST"])
+def get_or_update_config():
+    """Get or update configuration."""
+    if request.method == "POST":
+        data = request.get_json()
+        
+        with server.state_lock:
+            try:
+                # Validate before touching any device
+                cfg = server.updated_config(server.config, data)
+            except (TypeError, ValueError) as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            server.set_config(cfg)
+        
+        return jsonify({"success": True, "message": "Configuration updated"})
+    
+    cfg = server.config
+    return jsonify({
+        "tx_power": cfg.tx_power,
+        "path_loss_exponent": cfg.path_loss_exponent,
+        "disconnect_threshold": cfg.disconnect_threshold,
+        "device_lost_timeout": cfg.device_lost_timeout,
+        "rssi_filter": cfg.rssi_filter,
+        "rssi_filter_params": dict(cfg.rssi_filter_params),
+        "rssi_filters_available": list(FILTERS),
+        "zone_thresholds": dict(zip((zone for zone, _ in ZONES), cfg.zone_thresholds)),
+        "devices": server.config_devices(cfg),
+        "config_file": server.CONFIG_FILE or None,
+        "target_device_name": server.TARGET_DEVICE_NAME
+    })
+
+
+@app.route("/api/geofences", methods=["GET", "POST"])
+def geofences_endpoint():
+    """
+    List or create safe zones.
+    
+    GET query params:
+        device: only the zones this device is currently inside
+    
+    POST JSON (circle or polygon):
+    {"name": "Home", "type": "circle", "lat": 37.7749, "lng": -122.4194, "radius": 50}
+    {"name": "School", "type": "polygon", "points": [[37.77, -122.42], [37.78, -122.42], [37.78, -122.41]]}
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"success": False, "error": "expected a JSON object"}), 400
+        try:
+            zone = zone_from_dict(body)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        with server.state_lock:
+            server.geofences.add(zone)
+            server.save_geofences()
+        server.replicate_change("geofence_add", zone=zone.to_dict())
+        return jsonify({"success": True, "zone": zone.to_dict()}), 201
+    
+    key = request.args.get("device")
+    if key:
+        device = server.registry.get(key)
+        device_id = device.device_id if device is not None else key
+        inside = set(server.geofences.inside(device_id))
+        zones = [z for z in server.geofences.zones() if z.id in inside]
+    else:
+        zones = server.geofences.zones()
+    occupancy = server.geofences.occupancy()
+    return jsonify({
+        "success": True,
+        "zones": [dict(z.to_dict(), devices=occupancy.get(z.id, [])) for z in zones]
+    })
+
+
+@app.route("/api/geofences/<zone_id>", methods=["DELETE"])
+def delete_geofence(zone_id):
+    """Delete a safe zone."""
+    with server.state_lock:
+        removed = server.geofences.remove(zone_id)
+        if removed:
+            server.save_geofences()
+    if not removed:
+        return jsonify({"success": False, "error": f"unknown zone: {zone_id}"}), 404
+    server.replicate_change("geofence_remove", zone=zone_id)
+    return jsonify({"success": True})
+
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    """Generic ingest endpoint for hardware: accepts JSON payloads containing
+    device_id, rssi, lat, lng, and fall (boolean). The server immediately
+    pushes corresponding SSE events so the front-end can react in real-time.
+
+    Example payloads:
+      {"device_id":"DEV123","rssi":-42}
+      {"device_id":"DEV123","lat":37.7749, "lng":-122.4194}
+      {"device_id":"DEV123","fall":true, "severity":"high"}
+
+    An optional "ts" (epoch seconds) is the sample's own time. Without it,
+    or if it is more than a day old or a minute ahead of the server clock,
+    the sample is stamped on arrival.
+
+    Batch mode: send a JSON array of such objects, or an
+    `application/x-ndjson` body (one object per line, may be chunked).
+    Items are parsed incrementally and answered with a summary:
+      {"ok":true, "accepted":120, "rejected":0, "devices":12, "errors":[]}
+    """
+    body, status = server.ingest_response(request.mimetype, request.stream)
+    return jsonify(body), status
+
+
+@app.route("/ingest/binary", methods=["POST"])
+def ingest_binary():
+    """
+    Binary ingest: a buffer of fixed-layout records (see binary_ingest.py),
+    sent with Content-Type: application/vnd.guardianlink.v1. Records carry
+    device id, timestamp, RSSI, lat/lng, fall flag, yaw and step count and
+    are applied like a JSON batch.
+    """
+    if request.mimetype != binary_ingest.CONTENT_TYPE:
+        return jsonify({
+            "ok": False,
+            "error": f"expected Content-Type {binary_ingest.CONTENT_TYPE}"
+        }), 415
+    
+    return jsonify(server.ingest_batch(binary_ingest.iter_records(request.get_data(cache=False))))
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness probe: answers as soon as the routes are loaded."""
+    return jsonify(server.health_body())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Counters, gauges and histograms in the Prometheus text format."""
+    return Response(server.metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/monitor")
+def monitor_html():
+    # serve a simple static monitor page included in this folder
+    return send_from_directory(os.path.dirname(__file__), "monitor.html")
+
+
+@app.route("/")
+def index():
+    """Serve API documentation."""
+    return jsonify({
+        "name": "GuardianLink Backend API",
+        "version": "1.0",
+        "ble_available": server.BLE_AVAILABLE,
+        "endpoints": {
+            "/api/status": "GET - Current device status (?device=<id>)",
+            "/api/devices": "GET - Bulk status for all tracked devices (?ids=a,b)",
+            "/api/history": "GET - Recorded samples/events (?device=&from=&to=&step=)",
+            "/api/parent-location": "POST - Update parent GPS location",
+            "/api/calibrate": "POST - Calibrate RSSI to distance",
+            "/api/test-fall": "POST - Trigger test fall event",
+            "/api/config": "GET/POST - Configuration",
+            "/api/geofences": "GET/POST - Safe zones (?device=<id>); DELETE /api/geofences/<id>",
+            "/ingest": "POST - Hardware samples (JSON object, JSON array or NDJSON)",
+            "/ingest/binary": "POST - Binary hardware records (application/vnd.guardianlink.v1)",
+            "/events": "GET - SSE stream for real-time updates",
+            "/healthz": "GET - Liveness probe",
+            "/metrics": "GET - Prometheus metrics"
+        }
+    })
@@ -0,0 +1,315 @@
+"""
+GuardianLink geofences
+Parent-defined safe zones (circles and polygons) and per-device enter/exit
+tracking
+
+Zones are indexed in a uniform lat/lng grid. Each zone is registered in
+every cell its bounding box overlaps, so a location update looks up one
+cell and runs exact containment tests only on the few zones near the
+child. Zones whose bounding box spans more than MAX_ZONE_CELLS cells (a
+whole city) are kept in a short list that is checked on every update.
+
+Containment uses a local equirectangular projection around each zone. That
+is accurate to well under a meter for zones up to a few kilometers across.
+
+Each device remembers the set of zones it is inside, and update() reports
+only the transitions. A device already inside a zone has to move
+`hysteresis` meters beyond its edge before it exits, so RSSI-derived
+locations jittering on the boundary do not flap.
+
+Writers (add, remove, update) are serialized by the caller (the server's
+state lock). Zone lists and the grid are replaced, not mutated, so
+readers never lock.
+"""
+import itertools
+import json
+import math
+import os
+
+EARTH_RADIUS = 6371000  # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Grid cell size in degrees (~1.1 km north-south)
+DEFAULT_CELL_DEG = 0.01
+
+# Zones covering more cells than this are checked on every update instead
+MAX_ZONE_CELLS = 1024
+
+# Meters a device must move past a zone's edge before it exits
+DEFAULT_HYSTERESIS = 5.0
+
+
+def _check_coordinate(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        raise ValueError(f"coordinate out of range: ({lat}, {lng})")
+    return lat, lng
+
+
+class CircleZone:
+    """Every point within `radius` meters of (lat, lng)."""
+
+    __slots__ = ("id", "name", "lat", "lng", "radius", "_lng_scale", "bbox")
+
+    kind = "circle"
+
+    def __init__(self, zone_id, name, lat, lng, radius):
+        self.id = zone_id
+        self.name = name
+        self.lat, self.lng = _check_coordinate(lat, lng)
+        self.radius = float(radius)
+        if not self.radius > 0:
+            raise ValueError("radius must be positive")
+        self._lng_scale = math.cos(math.radians(self.lat))
+        dlat = self.radius / METERS_PER_DEGREE
+        dlng = dlat / max(self._lng_scale, 1e-6)
+        self.bbox = (self.lat - dlat, self.lng - dlng, self.lat + dlat, self.lng + dlng)
+
+    def contains(self, lat, lng, margin=0.0):
+        dy = (lat - self.lat) * METERS_PER_DEGREE
+        dx = (lng - self.lng) * METERS_PER_DEGREE * self._lng_scale
+        reach = self.radius + margin
+        return dx * dx + dy * dy <= reach * reach
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "type": self.kind,
+                "lat": self.lat, "lng": self.lng, "radius": self.radius}
+
+
+class PolygonZone:
+    """A simple polygon given as [(lat, lng), ...] vertices."""
+
+    __slots__ = ("id", "name", "points", "_origin", "_lng_scale", "_xy", "bbox")
+
+    kind = "polygon"
+
+    def __init__(self, zone_id, name, points):
+        self.id = zone_id
+        self.name = name
+        self.points = [_check_coordinate(lat, lng) for lat, lng in points]
+        if len(self.points) < 3:
+            raise ValueError("a polygon needs at least 3 points")
+        lats = [p[0] for p in self.points]
+        lngs = [p[1] for p in self.points]
+        self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+        self._origin = ((self.bbox[0] + self.bbox[2]) / 2, (self.bbox[1] + self.bbox[3]) / 2)
+        self._lng_scale = math.cos(math.radians(self._origin[0]))
+        self._xy = [self._project(lat, lng) for lat, lng in self.points]
+
+    def _project(self, lat, lng):
+        return ((lng - self._origin[1]) * METERS_PER_DEGREE * self._lng_scale,
+                (lat - self._origin[0]) * METERS_PER_DEGREE)
+
+    def contains(self, lat, lng, margin=0.0):
+        x, y = self._project(lat, lng)
+        xy = self._xy
+        inside = False
+        j = len(xy) - 1
+        for i in range(len(xy)):
+            xi, yi = xy[i]
+            xj, yj = xy[j]
+            if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+        if inside or margin <= 0:
+            return inside
+        return self._edge_distance(x, y) <= margin
+
+    def _edge_distance(self, x, y):
+        xy = self._xy
+        best = math.inf
+        j = len(xy) - 1
+        for i in range(len(xy)):
+            ax, ay = xy[j]
+            bx, by = xy[i]
+            dx, dy = bx - ax, by - ay
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length2))
+            px, py = ax + t * dx - x, ay + t * dy - y
+            best = min(best, px * px + py * py)
+            j = i
+        return math.sqrt(best)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "type": self.kind,
+                "points": [[lat, lng] for lat, lng in self.points]}
+
+
+def zone_from_dict(data, zone_id=None):
+    """
+    Build a zone from its JSON form (as accepted by POST /api/geofences).
+
+    Raises:
+        ValueError: not a dict, unknown type, missing fields or invalid
+            geometry
+    """
+    if not isinstance(data, dict):
+        raise ValueError("zone must be a JSON object")
+    zone_id = data.get("id", zone_id)
+    name = str(data.get("name") or "")
+    kind = data.get("type", "circle" if "radius" in data else "polygon")
+    try:
+        if kind == "circle":
+            return CircleZone(zone_id, name, data["lat"], data["lng"], data["radius"])
+        if kind == "polygon":
+            return PolygonZone(zone_id, name, data["points"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"invalid {kind} zone: {e}") from None
+    raise ValueError(f"unknown zone type: {kind}")
+
+
+class GeofenceEngine:
+    """
+    Spatially indexed zones plus the set of zones each device is inside.
+
+    Zones added without an id are named `<id_prefix><n>`. Processes that
+    assign ids independently (cluster workers) need distinct prefixes.
+    """
+
+    def __init__(self, cell_deg=DEFAULT_CELL_DEG, hysteresis=DEFAULT_HYSTERESIS, id_prefix="zone-"):
+        self.cell_deg = cell_deg
+        self.hysteresis = hysteresis
+        self.id_prefix = id_prefix
+        self._zones = {}
+        self._grid = {}
+        self._large = ()
+        self._inside = {}  # device_id -> frozenset of zone ids
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._zones)
+
+    # ------------------------------------------------------------------
+    # Zones
+    # ------------------------------------------------------------------
+
+    def zones(self):
+        return list(self._zones.values())
+
+    def get(self, zone_id):
+        return self._zones.get(zone_id)
+
+    def add(self, zone):
+        """Add (or replace, by id) a zone; assigns an id if it has none."""
+        self.extend([zone])
+        return zone
+
+    def extend(self, zones):
+        """add() several zones with a single reindex."""
+        merged = dict(self._zones)
+        for zone in zones:
+            if zone.id is None:
+                zone.id = self._next_id(merged)
+            if not zone.name:
+                zone.name = zone.id
+            merged[zone.id] = zone
+        self._reindex(merged)
+
+    def remove(self, zone_id):
+        """Delete a zone. Devices inside it forget it without an exit event."""
+        if zone_id not in self._zones:
+            return False
+        zones = dict(self._zones)
+        del zones[zone_id]
+        self._reindex(zones)
+        for device_id, inside in list(self._inside.items()):
+            if zone_id in inside:
+                self._inside[device_id] = inside - {zone_id}
+        return True
+
+    def _next_id(self, zones):
+        while True:
+            zone_id = f"{self.id_prefix}{next(self._ids)}"
+            if zone_id not in zones:
+                return zone_id
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _reindex(self, zones):
+        grid = {}
+        large = []
+        for zone in zones.values():
+            min_lat, min_lng, max_lat, max_lng = zone.bbox
+            r0, c0 = self._cell(min_lat, min_lng)
+            r1, c1 = self._cell(max_lat, max_lng)
+            if (r1 - r0 + 1) * (c1 - c0 + 1) > MAX_ZONE_CELLS:
+                large.append(zone)
+                continue
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    grid.setdefault((row, col), []).append(zone)
+        # Publish the new index in one store per attribute
+        self._grid = {cell: tuple(cell_zones) for cell, cell_zones in grid.items()}
+        self._large = tuple(large)
+        self._zones = zones
+
+    # ------------------------------------------------------------------
+    # Devices
+    # ------------------------------------------------------------------
+
+    def update(self, device_id, lat, lng):
+        """
+        Record a device's new location.
+
+        Returns:
+            List of ("geofence_enter" | "geofence_exit", zone) transitions
+        """
+        previous = self._inside.get(device_id, frozenset())
+        if not self._zones and not previous:
+            return []
+        current = set()
+        for zone in self._grid.get(self._cell(lat, lng), ()) + self._large:
+            margin = self.hysteresis if zone.id in previous else 0.0
+            if zone.contains(lat, lng, margin):
+                current.add(zone.id)
+        # Zones left behind in another grid cell still get the hysteresis
+        for zone_id in previous - current:
+            zone = self._zones.get(zone_id)
+            if zone is not None and zone.contains(lat, lng, self.hysteresis):
+                current.add(zone_id)
+        if current == previous:
+            return []
+        self._inside[device_id] = frozenset(current)
+        transitions = [("geofence_exit", self._zones[zone_id])
+                       for zone_id in previous - current if zone_id in self._zones]
+        transitions.extend(("geofence_enter", self._zones[zone_id]) for zone_id in current - previous)
+        return transitions
+
+    def inside(self, device_id):
+        """Ids of the zones a device is currently inside."""
+        return sorted(self._inside.get(device_id, ()))
+
+    def occupancy(self):
+        """{zone id: [device ids inside]} for every zone."""
+        result = {zone_id: [] for zone_id in self._zones}
+        for device_id, inside in list(self._inside.items()):
+            for zone_id in inside:
+                if zone_id in result:
+                    result[zone_id].append(device_id)
+        return result
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self, path):
+        """Replace the zones with those saved at `path` (missing file = none)."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        zones = {}
+        for item in data.get("zones", []):
+            zone = zone_from_dict(item)
+            zones[zone.id] = zone
+        self._reindex(zones)
+        return len(zones)
+
+    def save(self, path):
+        """Write the zones to `path` atomically (temp file + rename)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"zones": [zone.to_dict() for zone in self._zones.values()]}, f, indent=2)
+        os.replace(tmp, path)
@@ -0,0 +1,341 @@
+"""
+GuardianLink history store
+Append-only RSSI / location / event history in SQLite (WAL mode)
+
+Producers only append a tuple to an in-memory deque; a background writer
+thread drains it and commits in batches, so recording never blocks the
+sample path on disk I/O. Samples live in a WITHOUT ROWID table clustered
+on (device, ts), which makes per-device time-range queries a sequential
+scan of one B-tree range.
+
+The writer also maintains per-minute rollups (sums and counts), so
+downsampled queries with a step of a minute or more read 1440 rows per
+device-day instead of 86400.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    device   TEXT NOT NULL,
+    ts       REAL NOT NULL,
+    rssi     REAL,
+    distance REAL,
+    lat      REAL,
+    lng      REAL,
+    zone     TEXT,
+    PRIMARY KEY (device, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS samples_1m (
+    device       TEXT NOT NULL,
+    minute       INTEGER NOT NULL,
+    rssi_sum     REAL NOT NULL,
+    rssi_n       INTEGER NOT NULL,
+    distance_sum REAL NOT NULL,
+    distance_n   INTEGER NOT NULL,
+    lat_sum      REAL NOT NULL,
+    lng_sum      REAL NOT NULL,
+    loc_n        INTEGER NOT NULL,
+    last_ts      REAL NOT NULL,
+    zone         TEXT,
+    PRIMARY KEY (device, minute)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS events (
+    device  TEXT,
+    ts      REAL NOT NULL,
+    type    TEXT NOT NULL,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS events_device_ts ON events (device, ts);
+"""
+
+# Writer commits at least this often (seconds) and at most this many rows at once
+FLUSH_INTERVAL = 0.5
+BATCH_SIZE = 5000
+
+ROLLUP_SECONDS = 60
+
+ROLLUP_UPSERT = """
+INSERT INTO samples_1m VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (device, minute) DO UPDATE SET
+    rssi_sum = rssi_sum + excluded.rssi_sum,
+    rssi_n = rssi_n + excluded.rssi_n,
+    distance_sum = distance_sum + excluded.distance_sum,
+    distance_n = distance_n + excluded.distance_n,
+    lat_sum = lat_sum + excluded.lat_sum,
+    lng_sum = lng_sum + excluded.lng_sum,
+    loc_n = loc_n + excluded.loc_n,
+    zone = CASE WHEN excluded.last_ts >= last_ts THEN excluded.zone ELSE zone END,
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+# Rows allowed to wait for the writer before new ones are dropped
+MAX_PENDING = 200000
+
+# Seconds a write waits for another connection's lock (cluster workers
+# share the file), then how many more times a failed batch is retried,
+# one flush interval apart, before it is dropped
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+
+
+class HistoryStore:
+    """
+    Embedded time-series store for per-device history.
+
+    Args:
+        path: SQLite database file
+        flush_interval: seconds between writer commits
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self._local = threading.local()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Create the schema and start the background writer."""
+        if self._running:
+            return
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush whatever is pending and stop the writer."""
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+
+    def record_sample(self, device, ts, rssi=None, distance=None, lat=None, lng=None, zone=None):
+        """Queue one sample row. No-op until start() has been called."""
+        if not self._running:
+            return
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((0, (device, ts, rssi, distance, lat, lng, zone)))
+
+    def record_event(self, device, ts, event_type, payload):
+        """Queue one event row (payload is stored as JSON)."""
+        if not self._running:
+            return
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((1, (device, ts, event_type, payload)))
+
+    def _writer_loop(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        pending = self._pending
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = not self._running
+            failures = 0
+            while pending:
+                batch = [pending.popleft() for _ in range(min(len(pending), BATCH_SIZE))]
+                try:
+                    _write_batch(conn, batch)
+                    failures = 0
+                except sqlite3.OperationalError as e:
+                    # Usually "database is locked": another writer held the
+                    # lock past BUSY_TIMEOUT. Put the batch back and retry.
+                    failures += 1
+                    if failures > WRITE_RETRIES:
+                        print(f"History writer error: {e}; dropped {len(batch)} rows")
+                        self.dropped += len(batch)
+                        failures = 0
+                        continue
+                    pending.extendleft(reversed(batch))
+                    time.sleep(self.flush_interval)
+                except sqlite3.Error as e:
+                    print(f"History writer error: {e}; dropped {len(batch)} rows")
+                    self.dropped += len(batch)
+            if stopping:
+                conn.close()
+                return
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def query_samples(self, device, start, end, step=None, limit=10000):
+        """
+        Samples for `device` with start <= ts <= end, oldest first.
+
+        Args:
+            step: bucket width in seconds; when set, each bucket is reduced
+                to the average of its rows (zone = most recent in bucket).
+                Steps of a minute or more are served from the rollup table
+                at minute resolution.
+            limit: maximum rows returned
+
+        Returns:
+            list of dicts with ts, rssi, distance, lat, lng, zone
+        """
+        conn = self._connect()
+        try:
+            if step and step >= ROLLUP_SECONDS:
+                # Whole minutes from the rollup table; buckets are aligned
+                # to minute boundaries
+                rows = conn.execute(
+                    """
+                    SELECT MAX(last_ts),
+                           SUM(rssi_sum) / NULLIF(SUM(rssi_n), 0),
+                           SUM(distance_sum) / NULLIF(SUM(distance_n), 0),
+                           SUM(lat_sum) / NULLIF(SUM(loc_n), 0),
+                           SUM(lng_sum) / NULLIF(SUM(loc_n), 0),
+                           zone
+                    FROM samples_1m
+                    WHERE device = ? AND minute BETWEEN ? AND ?
+                    GROUP BY CAST((minute * ? - ?) / ? AS INTEGER)
+                    ORDER BY 1
+                    LIMIT ?
+                    """,
+                    (device, int(start // ROLLUP_SECONDS), int(end // ROLLUP_SECONDS),
+                     ROLLUP_SECONDS, start, step, limit)).fetchall()
+            elif step:
+                rows = conn.execute(
+                    """
+                    SELECT MAX(ts), AVG(rssi), AVG(distance), AVG(lat), AVG(lng), zone
+                    FROM samples
+                    WHERE device = ? AND ts BETWEEN ? AND ?
+                    GROUP BY CAST((ts - ?) / ? AS INTEGER)
+                    ORDER BY 1
+                    LIMIT ?
+                    """,
+                    (device, start, end, start, step, limit)).fetchall()
+            else:
+                rows = conn.execute(
+                    """
+                    SELECT ts, rssi, distance, lat, lng, zone
+                    FROM samples
+                    WHERE device = ? AND ts BETWEEN ? AND ?
+                    ORDER BY ts
+                    LIMIT ?
+                    """,
+                    (device, start, end, limit)).fetchall()
+        except sqlite3.OperationalError:
+            # Store not initialized yet (no samples recorded)
+            return []
+
+        return [
+            {
+                "ts": ts,
+                "rssi": round(rssi, 1) if rssi is not None else None,
+                "distance": round(distance, 2) if distance is not None else None,
+                "lat": round(lat, 6) if lat is not None else None,
+                "lng": round(lng, 6) if lng is not None else None,
+                "zone": zone
+            }
+            for ts, rssi, distance, lat, lng, zone in rows
+        ]
+
+    def query_events(self, device, start, end, limit=1000):
+        """Events for `device` with start <= ts <= end, oldest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT ts, type, payload FROM events
+                WHERE device = ? AND ts BETWEEN ? AND ?
+                ORDER BY ts
+                LIMIT ?
+                """,
+                (device, start, end, limit)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        return [{"ts": ts, "type": event_type, "event": json.loads(payload)}
+                for ts, event_type, payload in rows]
+
+
+def _write_batch(conn, batch):
+    """Commit a batch of queued (kind, row) items in one transaction."""
+    samples, events = [], []
+    for kind, row in batch:
+        if kind == 0:
+            samples.append(row)
+        else:
+            events.append((row[0], row[1], row[2], json.dumps(row[3], default=str)))
+    with conn:
+        if samples:
+            conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)", samples)
+            conn.executemany(ROLLUP_UPSERT, _rollup(samples))
+        if events:
+            conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", events)
+
+
+def _rollup(samples):
+    """
+    Fold sample rows into per-(device, minute) sums for ROLLUP_UPSERT.
+    Like INSERT OR REPLACE into samples, the last row for a (device, ts)
+    wins, so a repeated sample is counted once.
+    """
+    samples = {(row[0], row[1]): row for row in samples}.values()
+    buckets = {}
+    for device, ts, rssi, distance, lat, lng, zone in samples:
+        key = (device, int(ts // ROLLUP_SECONDS))
+        b = buckets.get(key)
+        if b is None:
+            b = buckets[key] = [device, key[1], 0.0, 0, 0.0, 0, 0.0, 0.0, 0, ts, zone]
+        if rssi is not None:
+            b[2] += rssi
+            b[3] += 1
+        if distance is not None:
+            b[4] += distance
+            b[5] += 1
+        if lat is not None and lng is not None:
+            b[6] += lat
+            b[7] += lng
+            b[8] += 1
+        if ts >= b[9]:
+            b[9] = ts
+            b[10] = zone
+    return buckets.values()
+
+
+def parse_time(value, default):
+    """
+    Parse a query-string time: epoch seconds or an ISO 8601 timestamp.
+
+    Raises:
+        ValueError: if the value is neither
+    """
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+GuardianLink load generator
+Replays recorded traces or synthesizes many bracelets against /ingest and
+reports throughput, ingest latency and SSE end-to-end delivery latency.
+
+Examples:
+    # Record a trace: TRACE_FILE=trace.ndjson python server.py
+    python loadgen.py replay trace.ndjson --speed 1
+    python loadgen.py replay trace.ndjson --speed 10
+    python loadgen.py replay trace.ndjson --speed max --concurrency 16
+    python loadgen.py synth --devices 200 --rate 2 --duration 30 --speed max
+    python loadgen.py synth --devices 50 --duration 60 --out synth.ndjson
+
+SSE latency is measured per device: the time from sending a sample to
+receiving the next `location` event for that device on /events.
+"""
+import argparse
+import http.client
+import json
+import math
+import queue
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from trace_recorder import read_trace
+
+DEFAULT_URL = "http://localhost:5001"
+
+# Same path-loss model as the server's defaults
+TX_POWER = -60
+PATH_LOSS_EXPONENT = 3.5
+
+
+# ============================================================================
+# WORKLOADS
+# ============================================================================
+
+def trace_workload(path):
+    """(offset_seconds, record) pairs from a recorded trace."""
+    items = []
+    t0 = None
+    for rec in read_trace(path):
+        t = rec.pop("t", None)
+        rec.pop("src", None)
+        # The sender's own sample time is stale on replay; the server
+        # stamps the record on arrival instead
+        rec.pop("ts", None)
+        if t is None:
+            t = t0 or 0.0
+        if t0 is None:
+            t0 = t
+        items.append((t - t0, rec))
+    items.sort(key=lambda item: item[0])
+    return items
+
+
+def synthetic_workload(devices, rate_hz, duration, noise_db=4.0, fade_prob=0.02, seed=1, falls=0):
+    """
+    (offset_seconds, record) pairs for `devices` bracelets sampled at
+    `rate_hz` for `duration` seconds.
+
+    Each bracelet does a bounded random walk in distance (0.5-40 m) and
+    position. RSSI follows the log-distance model with Gaussian shadowing
+    of `noise_db` plus occasional deep multipath fades.
+
+    With `falls`, that many falls are spread over random bracelets. The
+    onset sample carries an impact, a tumble and {"label": "fall"} (for
+    fall_detector.py's evaluator), then the bracelet lies still with the
+    body shadowing its signal. Those traces also carry MotionLogic states
+    and the odd wrist flick, so the detector sees realistic non-falls.
+    """
+    rng = random.Random(seed)
+    state = []
+    for i in range(devices):
+        state.append({
+            "id": f"SYN{i:05d}",
+            "distance": rng.uniform(1.0, 15.0),
+            "velocity": 0.0,
+            "lat": 37.7749 + rng.uniform(-0.01, 0.01),
+            "lng": -122.4194 + rng.uniform(-0.01, 0.01),
+            "phase": rng.random() / rate_hz,
+            "falls": set(),
+            "down": 0,
+        })
+
+    items = []
+    steps = int(duration * rate_hz)
+    for _ in range(falls):
+        state[rng.randrange(devices)]["falls"].add(rng.randrange(steps))
+    for step in range(steps):
+        for dev in state:
+            dev["velocity"] = 0.9 * dev["velocity"] + rng.gauss(0, 0.3)
+            dev["distance"] = min(40.0, max(0.5, dev["distance"] + dev["velocity"] / rate_hz))
+            rssi = TX_POWER - 10 * PATH_LOSS_EXPONENT * math.log10(dev["distance"])
+            rssi += rng.gauss(0, noise_db)
+            if rng.random() < fade_prob:
+                rssi -= rng.uniform(10, 20)
+            record = {"device_id": dev["id"]}
+            if falls:
+                rssi += fall_motion(rng, dev, step, rate_hz, record)
+            record["rssi"] = max(-110, min(0, round(rssi)))
+            # Every 10th sample also carries a GPS fix
+            if step % 10 == 0:
+                dev["lat"] += rng.gauss(0, 0.00001)
+                dev["lng"] += rng.gauss(0, 0.00001)
+                record["lat"] = round(dev["lat"], 7)
+                record["lng"] = round(dev["lng"], 7)
+            items.append((step / rate_hz + dev["phase"], record))
+    items.sort(key=lambda item: item[0])
+    return items
+
+
+def fall_motion(rng, dev, step, rate_hz, record):
+    """
+    Add MotionLogic fields (and a fall label) to a synthetic record.
+
+    Returns:
+        RSSI offset in dB (body shadowing while lying down)
+    """
+    if step in dev["falls"]:
+        dev["down"] = max(2, int(8 * rate_hz))
+        dev["velocity"] = 0.0
+        record.update(label="fall", state="jerk",
+                      amag_g=round(rng.uniform(2.0, 3.5), 2),
+                      yaw_rate=round(rng.uniform(3.0, 6.0), 2))
+        return -rng.uniform(15, 25)
+    if dev["down"]:
+        dev["down"] -= 1
+        record.update(state="still", zupt=True)
+        return -rng.uniform(12, 20)
+    if rng.random() < 0.01:
+        # Wrist flick: a spike without a fall
+        record.update(state="walking", amag_g=round(rng.uniform(1.8, 2.4), 2),
+                      yaw_rate=round(rng.uniform(1.0, 4.0), 2))
+    elif step % 5 == 0:
+        record["state"] = "walking"
+    return 0.0
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+class SseListener(threading.Thread):
+    """
+    Reads /events and matches `location` events to the send time of the
+    latest sample for the same device.
+    """
+
+    def __init__(self, url):
+        super().__init__(daemon=True)
+        self._url = urlparse(url)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.ready = threading.Event()
+        self.stopped = False
+
+    def sent(self, device, ts):
+        with self._lock:
+            self._pending.setdefault(device, ts)
+
+    def run(self):
+        conn = http.client.HTTPConnection(self._url.hostname, self._url.port or 80, timeout=60)
+        conn.request("GET", "/events", headers={"Accept": "text/event-stream"})
+        resp = conn.getresponse()
+        self.ready.set()
+        while not self.stopped:
+            line = resp.fp.readline()
+            if not line:
+                break
+            if not line.startswith(b"data: "):
+                continue
+            now = time.perf_counter()
+            try:
+                ev = json.loads(line[6:])
+            except ValueError:
+                continue
+            if ev.get("type") != "location":
+                continue
+            with self._lock:
+                sent = self._pending.pop(ev.get("device"), None)
+            if sent is not None:
+                self.latencies.append(now - sent)
+
+
+class Sender(threading.Thread):
+    """Posts work items from a queue over one keep-alive connection."""
+
+    def __init__(self, url, work, sse):
+        super().__init__(daemon=True)
+        self._url = urlparse(url)
+        self._work = work
+        self._sse = sse
+        self._conn = None
+        self.latencies = []
+        self.samples = 0
+        self.errors = 0
+
+    def _post(self, body):
+        for attempt in range(2):
+            try:
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(
+                        self._url.hostname, self._url.port or 80, timeout=30)
+                self._conn.request("POST", "/ingest", body=body,
+                                   headers={"Content-Type": "application/json"})
+                resp = self._conn.getresponse()
+                resp.read()
+                return resp.status
+            except (OSError, http.client.HTTPException):
+                self._conn = None
+                if attempt:
+                    raise
+
+    def run(self):
+        while True:
+            records = self._work.get()
+            if records is None:
+                return
+            body = json.dumps(records if len(records) > 1 else records[0])
+            start = time.perf_counter()
+            if self._sse is not None:
+                for rec in records:
+                    self._sse.sent(rec.get("device_id"), start)
+            try:
+                status = self._post(body)
+            except (OSError, http.client.HTTPException):
+                status = None
+            self.latencies.append(time.perf_counter() - start)
+            if status == 200:
+                self.samples += len(records)
+            else:
+                self.errors += len(records)
+
+
+def run_load(url, items, speed, concurrency, batch, measure_sse=True):
+    """
+    Send `items` to the server and return a results dict.
+
+    Args:
+        speed: playback speed multiplier, or None for as fast as possible
+        batch: samples per request (>1 sends JSON-array batches)
+    """
+    sse = None
+    if measure_sse:
+        sse = SseListener(url)
+        sse.start()
+        if not sse.ready.wait(5):
+            print("warning: could not open /events, SSE latency not measured", file=sys.stderr)
+            sse = None
+
+    work = queue.Queue(maxsize=concurrency * 4)
+    senders = [Sender(url, work, sse) for _ in range(concurrency)]
+    for s in senders:
+        s.start()
+
+    start = time.perf_counter()
+    chunk = []
+    for offset, record in items:
+        if speed is not None:
+            delay = start + offset / speed - time.perf_counter()
+            if delay > 0:
+                if chunk:
+                    work.put(chunk)
+                    chunk = []
+                time.sleep(delay)
+        chunk.append(record)
+        if len(chunk) >= batch:
+            work.put(chunk)
+            chunk = []
+    if chunk:
+        work.put(chunk)
+    for _ in senders:
+        work.put(None)
+    for s in senders:
+        s.join()
+    elapsed = time.perf_counter() - start
+
+    if sse is not None:
+        time.sleep(1.0)  # let trailing events arrive
+        sse.stopped = True
+
+    latencies = [lat for s in senders for lat in s.latencies]
+    samples = sum(s.samples for s in senders)
+    sse_latencies = sse.latencies if sse is not None else []
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "samples": samples,
+        "requests": len(latencies),
+        "errors": sum(s.errors for s in senders),
+        "elapsed_s": round(elapsed, 3),
+        "samples_per_s": round(samples / elapsed, 1) if elapsed else None,
+        "ingest_p50_ms": ms(percentile(latencies, 50)),
+        "ingest_p99_ms": ms(percentile(latencies, 99)),
+        "sse_events_matched": len(sse_latencies),
+        "sse_p50_ms": ms(percentile(sse_latencies, 50)),
+        "sse_p99_ms": ms(percentile(sse_latencies, 99)),
+    }
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GuardianLink trace replay and load generator")
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"server base URL (default {DEFAULT_URL})")
+    parser.add_argument("--speed", type=parse_speed, default=parse_speed("1"),
+                        help="playback speed: 1, 10 (x), or max")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel connections")
+    parser.add_argument("--batch", type=int, default=1, help="samples per request")
+    parser.add_argument("--no-sse", action="store_true", help="skip SSE latency measurement")
+    parser.add_argument("--json", help="write the results to this file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    replay = sub.add_parser("replay", help="replay a recorded NDJSON trace")
+    replay.add_argument("trace")
+
+    synth = sub.add_parser("synth", help="synthesize N bracelets")
+    synth.add_argument("--devices", type=int, default=10)
+    synth.add_argument("--rate", type=float, default=1.0, help="samples per second per device")
+    synth.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+    synth.add_argument("--noise", type=float, default=4.0, help="RSSI shadowing sigma (dB)")
+    synth.add_argument("--seed", type=int, default=1)
+    synth.add_argument("--falls", type=int, default=0,
+                       help="labelled falls to simulate (IMU fields included)")
+    synth.add_argument("--out", help="also write the synthesized trace here")
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        items = trace_workload(args.trace)
+    else:
+        items = synthetic_workload(args.devices, args.rate, args.duration, args.noise, seed=args.seed,
+                                   falls=args.falls)
+        if args.out:
+            now = time.time()
+            with open(args.out, "w") as f:
+                for offset, record in items:
+                    f.write(json.dumps(dict(record, t=now + offset, src="synth")) + "\n")
+
+    speed = "max" if args.speed is None else f"{args.speed:g}x"
+    print(f"Sending {len(items)} samples to {args.url} at {speed} "
+          f"(concurrency={args.concurrency}, batch={args.batch})")
+    results = run_load(args.url, items, args.speed, args.concurrency, max(1, args.batch),
+                       measure_sse=not args.no_sse)
+
+    print("=" * 60)
+    for key, value in results.items():
+        print(f"{key:<20} {value}")
+    print("=" * 60)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(results, command=args.command, speed=speed,
+                           concurrency=args.concurrency, batch=args.batch), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+GuardianLink metrics
+Counters and histograms cheap enough to leave on in the sample path,
+rendered in the Prometheus text exposition format for /metrics
+
+Every counter or histogram child keeps one small array('d') per writer
+thread. An increment is a thread-local lookup plus an in-place add: no
+lock, no contention between threads and nothing allocated per sample.
+The per-thread slots are summed only when /metrics is scraped. Slots of
+threads that have exited are folded into a retired total, so the
+per-request threads of a threaded WSGI server do not accumulate.
+
+Gauges and counters owned by other components (subscriber count, queue
+depths, drop counters) are read through callbacks at scrape time.
+"""
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+INF = float("inf")
+
+# Latency buckets (seconds) for per-sample work: 5 us .. 100 ms
+LATENCY_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                   0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+# Live per-thread slots kept before dead threads are folded away
+PRUNE_THRESHOLD = 32
+
+
+class _PerThread:
+    """
+    Fixed-size float slots, one array per writer thread.
+
+    Writers read `local.cell` directly and fall back to cell() only on a
+    thread's first write.
+    """
+
+    __slots__ = ("_size", "local", "_cells", "_retired", "_lock")
+
+    def __init__(self, size):
+        self._size = size
+        self.local = threading.local()
+        self._cells = []  # (thread, array) pairs
+        self._retired = array("d", bytes(8 * size))
+        self._lock = threading.Lock()
+
+    def cell(self):
+        """This thread's slots, created on the thread's first write."""
+        try:
+            return self.local.cell
+        except AttributeError:
+            pass
+        cell = array("d", bytes(8 * self._size))
+        with self._lock:
+            if len(self._cells) >= PRUNE_THRESHOLD:
+                self._prune()
+            self._cells.append((threading.current_thread(), cell))
+        self.local.cell = cell
+        return cell
+
+    def _prune(self):
+        live = []
+        retired = self._retired
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for i, value in enumerate(cell):
+                    retired[i] += value
+        self._cells = live
+
+    def totals(self):
+        """Sum of every thread's slots (live and exited)."""
+        with self._lock:
+            self._prune()
+            totals = list(self._retired)
+            for _, cell in self._cells:
+                for i, value in enumerate(cell):
+                    totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_slots", "_local")
+
+    def __init__(self):
+        self._slots = _PerThread(1)
+        self._local = self._slots.local
+
+    def inc(self, amount=1):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._slots.cell()[0] += amount
+
+    def value(self):
+        return self._slots.totals()[0]
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_slots", "_local")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # One slot per bucket plus +Inf, then the running sum
+        self._slots = _PerThread(len(bounds) + 2)
+        self._local = self._slots.local
+
+    def observe(self, value):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._slots.cell()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self):
+        """(cumulative bucket counts incl. +Inf, sum, count)."""
+        totals = self._slots.totals()
+        cumulative = []
+        running = 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+
+class _Metric(ABC):
+    """Base for metrics with optional labels; children are created once."""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = None if self.labelnames else self._new_child()
+
+    @abstractmethod
+    def _new_child(self):
+        """A new child holding one label combination's values."""
+
+    def labels(self, *values):
+        """
+        Child for one label combination. Callers on the hot path should
+        bind children once and keep them.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _items(self):
+        if self._default is not None:
+            return [((), self._default)]
+        return list(self._children.items())
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        if self._default is not None:
+            # Skip one call level on the unlabelled hot path
+            self.inc = self._default.inc
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        raise ValueError(f"{self.name} has labels; use labels(...).inc()")
+
+    def collect(self):
+        for values, child in self._items():
+            yield self.name + "_total", values, child.value()
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram (bucket bounds are upper limits, inclusive)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+        if self._default is not None:
+            self.observe = self._default.observe
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        raise ValueError(f"{self.name} has labels; use labels(...).observe()")
+
+    def collect(self):
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for values, child in self._items():
+            cumulative, total, count = child.snapshot()
+            for le, running in zip(bounds, cumulative):
+                yield self.name + "_bucket", values + (("le", le),), running
+            yield self.name + "_sum", values, total
+            yield self.name + "_count", values, count
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose value is read from `fn` at scrape time.
+
+    `fn` returns a number, or with labelnames an iterable of
+    (label_values_tuple, number) pairs.
+    """
+
+    def __init__(self, name, help, fn, kind="gauge", labelnames=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def collect(self):
+        sample_name = self.name + "_total" if self.kind == "counter" else self.name
+        if not self.labelnames:
+            yield sample_name, (), self._fn()
+            return
+        for values, value in self._fn():
+            yield sample_name, tuple(values), value
+
+
+class MetricsRegistry:
+    """Owns a set of metrics and renders them for /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self.register(Histogram(name, help, buckets, labelnames))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        return self.register(CallbackMetric(name, help, fn, "gauge", labelnames))
+
+    def counter_func(self, name, help, fn, labelnames=()):
+        return self.register(CallbackMetric(name, help, fn, "counter", labelnames))
+
+    def render(self):
+        """Text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            # In 0.0.4 the HELP/TYPE name must match the samples, so
+            # counters are declared under their _total name
+            name = metric.name + "_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, values, value in metric.collect():
+                lines.append(f"{sample_name}{_format_labels(metric.labelnames, values)} "
+                             f"{_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _format_labels(names, values):
+    if not values:
+        return ""
+    pairs = []
+    for i, value in enumerate(values):
+        # Histogram buckets append ("le", bound) after the declared labels
+        name, value = value if i >= len(names) else (names[i], value)
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    if value != value:
+        return "NaN"
+    if value in (INF, -INF):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
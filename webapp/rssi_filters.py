@@ -0,0 +1,144 @@
+"""
+GuardianLink RSSI filters
+Per-device smoothing stage between raw RSSI samples and distance/zone logic
+
+Every filter keeps its state in a few __slots__ fields (plus a fixed
+preallocated ring for the moving average), updates in constant time and
+allocates nothing per sample besides the returned float.
+"""
+from array import array
+
+
+class MovingAverageFilter:
+    """Mean of the last `window` samples (the server's original smoother)."""
+
+    name = "moving_average"
+    __slots__ = ("window", "_ring", "_pos", "_count", "_sum", "value")
+
+    def __init__(self, window=3, tx_power=None, n=None):
+        window = int(window)
+        if window < 1:
+            raise ValueError("window must be >= 1")
+        self.window = window
+        self._ring = array("d", bytes(8 * window))
+        self._pos = 0
+        self._count = 0
+        self._sum = 0.0
+        self.value = None
+
+    def update(self, rssi):
+        if self._count == self.window:
+            self._sum -= self._ring[self._pos]
+        else:
+            self._count += 1
+        self._ring[self._pos] = rssi
+        self._sum += rssi
+        self._pos = (self._pos + 1) % self.window
+        self.value = self._sum / self._count
+        return self.value
+
+    def set_calibration(self, tx_power, n):
+        pass
+
+    def params(self):
+        return {"window": self.window}
+
+
+class EmaFilter:
+    """Exponential moving average: value += alpha * (rssi - value)."""
+
+    name = "ema"
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, alpha=0.3, tx_power=None, n=None):
+        alpha = float(alpha)
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, rssi):
+        if self.value is None:
+            self.value = float(rssi)
+        else:
+            self.value += self.alpha * (rssi - self.value)
+        return self.value
+
+    def set_calibration(self, tx_power, n):
+        pass
+
+    def params(self):
+        return {"alpha": self.alpha}
+
+
+class KalmanFilter:
+    """
+    1-D Kalman filter on log-distance x = log10(d) = (TxPower - RSSI) / (10 * n).
+
+    The state is a random walk: process noise `q` is the variance of the
+    change in log-distance per sample, measurement noise `r` is the RSSI
+    noise variance in dB^2 (converted to log-distance units). The output
+    is mapped back to an RSSI-equivalent so it feeds the same distance
+    and zone logic as the other filters.
+    """
+
+    name = "kalman"
+    __slots__ = ("q", "r", "tx_power", "n", "_x", "_p", "_r_ld", "value")
+
+    def __init__(self, q=0.002, r=16.0, tx_power=-60, n=3.5):
+        self.q = float(q)
+        self.r = float(r)
+        if self.q <= 0 or self.r <= 0:
+            raise ValueError("q and r must be > 0")
+        self.tx_power = tx_power
+        self.n = n
+        self._x = None
+        self._p = 1.0
+        self._r_ld = self.r / (10.0 * n) ** 2
+        self.value = None
+
+    def update(self, rssi):
+        scale = 10.0 * self.n
+        z = (self.tx_power - rssi) / scale
+        if self._x is None:
+            self._x = z
+            self._p = self._r_ld
+        else:
+            p = self._p + self.q
+            k = p / (p + self._r_ld)
+            self._x += k * (z - self._x)
+            self._p = (1.0 - k) * p
+        self.value = self.tx_power - scale * self._x
+        return self.value
+
+    def set_calibration(self, tx_power, n):
+        """Re-express the current estimate under a new calibration."""
+        if self._x is not None:
+            rssi = self.tx_power - 10.0 * self.n * self._x
+            self._x = (tx_power - rssi) / (10.0 * n)
+            self._p *= (self.n / n) ** 2
+        self.tx_power = tx_power
+        self.n = n
+        self._r_ld = self.r / (10.0 * n) ** 2
+
+    def params(self):
+        return {"q": self.q, "r": self.r}
+
+
+FILTERS = {cls.name: cls for cls in (MovingAverageFilter, EmaFilter, KalmanFilter)}
+
+
+def make_filter(name, tx_power, n, **params):
+    """
+    Build a filter by name.
+
+    Raises:
+        ValueError: unknown filter name or invalid parameters
+    """
+    cls = FILTERS.get(name)
+    if cls is None:
+        raise ValueError(f"unknown rssi filter '{name}' (choose from {', '.join(FILTERS)})")
+    try:
+        return cls(tx_power=tx_power, n=n, **params)
+    except TypeError as e:
+        raise ValueError(f"invalid parameters for {name}: {e}")
@@ -3,144 +3,509 @@
 GuardianLink Backend Server
 Handles BLE RSSI scanning, distance calculation, direction estimation, and location tracking
 """
+import hashlib
+import importlib.util
 import json
 import os
+import sys
 import threading
 import time
 import math
-from queue import Queue, Empty
+import zlib
 from datetime import datetime
-from collections import deque
-
-from flask import Flask, request, jsonify, Response, send_from_directory
-from flask_cors import CORS
-
-# Try to import bleak for BLE (optional). If not available we'll run a simulator.
-try:
-    from bleak import BleakScanner
-    BLE_AVAILABLE = True
-except Exception:
-    BleakScanner = None
-    BLE_AVAILABLE = False
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from werkzeug.wrappers import Request as WsgiRequest, Response as WsgiResponse
+
+from broadcaster import EventBroadcaster, StatusCoalescer, negotiate_encoding
+from event_bus import ALL as ALL_SHARDS, LocalBus
+from device_registry import (
+    LOCATION_GPS, LOCATION_PROJECTED, LOCATION_TRILATERATED, DeviceRegistry, DeviceSnapshot,
+    DeviceState, SnapshotReplicas,
+)
+from batch_ingest import NDJSON_MIMETYPES, iter_json_array, iter_ndjson, peek_stream
+import binary_ingest
+from rssi_filters import make_filter
+from calibration import DEFAULT_ZONE_THRESHOLDS, Calibration, check_zone_thresholds
+from auto_calibration import AutoCalibration
+from history_store import HistoryStore
+from trace_recorder import TraceRecorder
+from geofence import GeofenceEngine, zone_from_dict
+from fall_detector import MOTION_FIELDS, FallDetector, FallParams, feed_motion
+from watchdog import Watchdog
+import trilateration
+from metrics import MetricsRegistry
+import batch_location
+from batch_location import (
+    numpy_available, calculate_child_location_batch,
+    calculate_bearing_batch, bearing_to_direction_batch
+)
+
+# bleak is optional; if it is not installed we'll run a simulator. Only its
+# presence is checked here: importing it (and ble_backend's asyncio) is
+# left to the scanner thread, so a restart serves requests sooner.
+BLE_AVAILABLE = importlib.util.find_spec("bleak") is not None
 
 # Only enable BLE scanning if the environment variable ENABLE_BLE=1 is set.
 # This prevents the server from failing during development when hardware isn't ready.
 BLE_ENABLED = os.getenv("ENABLE_BLE", "0") == "1"
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+# Advertisement source for the scanner: "bleak" (real adapter) or "fake"
+# (scripted advertisements, for testing the scan pipeline without hardware)
+BLE_BACKEND = os.getenv("BLE_BACKEND", "bleak")
+
+# Run the simulator when no BLE adapter is available; SIMULATOR=0 keeps the
+# server quiet (e.g. when only /ingest feeds it, or for benchmarks)
+SIMULATOR_ENABLED = os.getenv("SIMULATOR", "1") == "1"
+
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
+# Startup values for the tunables below; at runtime the live values are in
+# the `config` snapshot (changed through /api/config, /api/calibrate and
+# CONFIG_FILE)
+
 # RSSI to Distance Calibration
 # Calibrated for your ESP32: RSSI=-60 at 1.0m (perfect calibration!)
 TX_POWER = -60  # RSSI at 1 meter (calibrated with your hardware)
 PATH_LOSS_EXPONENT = 3.5  # Environmental factor (increased for indoor accuracy)
+# Per-bracelet overrides: {device_id: (tx_power, path_loss_exponent)}
+DEVICE_CALIBRATION = {}
+
+# Automatic per-device calibration (see auto_calibration.py): each
+# bracelet's tx_power and path_loss_exponent are fitted to /api/calibrate
+# points and to ground truth, i.e. its GPS or trilaterated position
+# against the parent's fix. A ground-truth point weighs this much
+# relative to an /api/calibrate point.
+GROUND_TRUTH_WEIGHT = 0.2
+# Ground-truth distances outside this range (meters) are not used: closer,
+# GPS error dominates; farther, the RSSI is mostly noise
+GROUND_TRUTH_RANGE = (3.0, 60.0)
+# Trilaterated fixes count as ground truth up to this accuracy (meters)
+GROUND_TRUTH_MAX_ACCURACY = 2.0
+
+# Proximity zones: smoothed RSSI a device has to be above to count as
+# very_close, near and far (see calibration.py)
+ZONE_THRESHOLDS = DEFAULT_ZONE_THRESHOLDS
+
+# RSSI smoothing filter applied per device (see rssi_filters.py):
+# "moving_average", "ema" or "kalman", plus its parameters
+RSSI_FILTER = "moving_average"
+RSSI_FILTER_PARAMS = {"window": 3}
 
 # Distance thresholds (meters)
 DISCONNECT_THRESHOLD = 30  # Alert when child is beyond this distance
 RSSI_THRESHOLD = -90  # Below this RSSI, consider out of range
 
-# Fall detection parameters
+# Fall detection parameters (see fall_detector.py)
 FALL_RSSI_DROP = 15  # Sudden RSSI drop indicating possible fall
-FALL_TIME_WINDOW = 2  # seconds
+FALL_TIME_WINDOW = 2  # seconds within which RSSI/IMU evidence combines
+FALL_CONFIDENCE = 0.6  # Alert once the combined evidence reaches this
+FALL_COOLDOWN = 30  # seconds; further alerts for the same device are suppressed
+
+# History database (SQLite, WAL mode); set HISTORY_DB="" to disable recording
+HISTORY_DB = os.getenv("HISTORY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.db"))
+HISTORY_MAX_POINTS = 1000  # default downsampling target for /api/history
+
+# Safe zones (JSON); set GEOFENCES_FILE="" to keep them in memory only
+GEOFENCES_FILE = os.getenv("GEOFENCES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geofences.json"))
+
+# Tunables file (JSON, same keys as POST /api/config plus "devices"),
+# applied at startup and again whenever its mtime changes; set
+# CONFIG_FILE="" to configure through the API only
+CONFIG_FILE = os.getenv("CONFIG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"))
+CONFIG_POLL_INTERVAL = 2.0  # seconds between mtime checks
+
+# Fitted calibration profiles (JSON); set CALIBRATION_PROFILES_FILE="" to
+# keep them in memory only
+CALIBRATION_PROFILES_FILE = os.getenv("CALIBRATION_PROFILES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_profiles.json"))
+CALIBRATION_SAVE_INTERVAL = 30.0  # seconds between saves of changed fits
+
+# Raw input trace (NDJSON) for replay with loadgen.py; unset = not recorded
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# SSE: status_update events are coalesced per device over this many
+# seconds (0 = send every change immediately); alerts are never delayed
+SSE_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_WINDOW", "0.25"))
+SSE_REPLAY_SIZE = 1024  # events kept for Last-Event-ID resume
+# Status deltas queued per /events client before the oldest are dropped
+# (the client then gets a fresh status_snapshot). Alerts are never dropped;
+# a client SSE_MAX_BACKLOG alerts behind is disconnected and resumes
+# with Last-Event-ID.
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", "256"))
+SSE_MAX_BACKLOG = SSE_REPLAY_SIZE
+# gzip/deflate on /events (a streaming compressor per client, flushed
+# after every event) for clients that ask with ?compress=1 and accept it
+# in Accept-Encoding; SSE_COMPRESSION=1 compresses for every client that
+# accepts it unless it asks for ?compress=0
+SSE_COMPRESSION = os.getenv("SSE_COMPRESSION", "0") == "1"
+
+# Multi-observer location: when a bracelet is heard by several parent
+# phones / gateways, their distances are fused by weighted least squares
+# over this many seconds (see trilateration.py)
+TRILATERATION_WINDOW = 10.0
+PARENT_OBSERVER = "parent"  # observer id of the server's own BLE samples
+
+# HTTP port of `python server.py`
+PORT = int(os.getenv("PORT", "5001"))
 
 # Device tracking
 TARGET_DEVICE_NAME = "GuardianLink"  # Must match BLE beacon name
+# Seconds without any sample (BLE, simulator or /ingest) before a bracelet
+# is reported lost; it is reported recovered at its next sample
+DEVICE_LOST_TIMEOUT = float(os.getenv("DEVICE_LOST_TIMEOUT", "5.0"))
+WATCHDOG_TICK = 0.25  # timer wheel resolution (seconds)
+# An /ingest record's own "ts" is used as the sample time only within this
+# window around the server clock (late uploads from a gateway's buffer are
+# fine, seconds-since-boot or a wrong RTC are not); outside it the record
+# is stamped on arrival
+INGEST_TS_MAX_AGE = 24 * 3600.0
+INGEST_TS_MAX_AHEAD = 60.0
 
 # ============================================================================
 # DATA STRUCTURES
 # ============================================================================
 
-# Event queue for server-sent events
-events = Queue()
-
-# Device state tracking
-device_state = {
-    "connected": False,
-    "rssi": None,
-    "distance": None,
-    "last_seen": None,
-    "battery": 85,
-    "address": None,
-    "location": {
-        "lat": None,
-        "lng": None,
-        "address": None
-    },
-    "parent_location": {
-        "lat": None,
-        "lng": None,
-        "heading": None  # Compass direction in degrees
-    }
-}
-
-# RSSI history for fall detection and smoothing (reduced for faster response)
-rssi_history = deque(maxlen=3)
-
-# Last known good location (when connected)
-last_known_location = {
+# Fan-out hub for server-sent events (one ring buffer per /events client)
+broadcaster = EventBroadcaster(buffer_size=SSE_BUFFER_SIZE, replay_size=SSE_REPLAY_SIZE,
+                               coalesce_window=SSE_COALESCE_WINDOW, max_backlog=SSE_MAX_BACKLOG)
+
+# Carries events to the broadcaster. In a single process this is a direct
+# call; cluster.py swaps in a Unix-socket bus shared by its workers, and
+# sets which shard of the devices this process owns (see join_cluster)
+bus = LocalBus()
+shard_index = 0
+shard_count = 1
+# Cluster workers coalesce their status updates before the bus
+status_coalescer = None
+
+# Per-bracelet state (RSSI history, location, falls) keyed by device_id
+registry = DeviceRegistry()
+
+# Where /api/status and /api/devices read device snapshots from: the
+# registry itself, or in a cluster worker the SnapshotReplicas of every
+# worker's devices (see join_cluster)
+snapshots = registry
+# Cluster workers coalesce their devices' snapshots before the bus
+snapshot_coalescer = None
+
+# Persistent RSSI / location / event history, written by a background thread
+history = HistoryStore(HISTORY_DB or ":memory:")
+
+# Raw sample recorder, active only when TRACE_FILE is set
+trace = TraceRecorder(TRACE_FILE)
+
+# Parent-defined safe zones and which of them each device is inside
+geofences = GeofenceEngine()
+
+# Per-device path-loss fits; the published ones are part of
+# config.calibration. Saved to calibration_profiles_path (cluster workers
+# each save their own shard's, see join_cluster).
+autocal = AutoCalibration()
+calibration_profiles_path = CALIBRATION_PROFILES_FILE
+
+# Last-seen watchdog (timer wheel), fed by every sample on its owning
+# process; runs on the monotonic clock
+watchdog = Watchdog(DEVICE_LOST_TIMEOUT, WATCHDOG_TICK, time.monotonic())
+
+# Shared by every device's FallDetector
+FALL_PARAMS = FallParams(rssi_drop=FALL_RSSI_DROP, window=FALL_TIME_WINDOW,
+                         threshold=FALL_CONFIDENCE, cooldown=FALL_COOLDOWN)
+
+class Config(NamedTuple):
+    """
+    Live tuning values, published as one immutable snapshot. Writers
+    replace `config` wholesale under state_lock (through set_config).
+    Readers load it once per operation, so a device's distance and zone
+    tables always match the rest of the snapshot.
+    
+    `calibration` holds the lookup tables built from tx_power,
+    path_loss_exponent, zone_thresholds and device_calibration, plus the
+    fitted profiles; see calibrated().
+    """
+    tx_power: float
+    path_loss_exponent: float
+    disconnect_threshold: float
+    rssi_filter: str
+    rssi_filter_params: Mapping
+    zone_thresholds: tuple = DEFAULT_ZONE_THRESHOLDS
+    device_calibration: Mapping = MappingProxyType({})
+    device_lost_timeout: float = DEVICE_LOST_TIMEOUT
+    calibration: Calibration = None
+
+
+def calibrated(cfg, old=None):
+    """
+    `cfg` with its calibration built, fitted profiles included. The
+    calibration of `old` is reused when the calibration values are the
+    same, and its fitted profiles when the zone thresholds are.
+    """
+    values = (cfg.tx_power, cfg.path_loss_exponent, cfg.zone_thresholds, cfg.device_calibration)
+    previous = old.calibration if old is not None else None
+    if previous is not None and values == (
+            old.tx_power, old.path_loss_exponent, old.zone_thresholds, old.device_calibration):
+        return cfg._replace(calibration=previous)
+    return cfg._replace(calibration=Calibration.build(*values, fitted_params=autocal.published,
+                                                      previous=previous))
+
+
+config = calibrated(Config(TX_POWER, PATH_LOSS_EXPONENT, DISCONNECT_THRESHOLD,
+                           RSSI_FILTER, MappingProxyType(dict(RSSI_FILTER_PARAMS)),
+                           ZONE_THRESHOLDS, MappingProxyType(dict(DEVICE_CALIBRATION))))
+
+# Parent phone location, shared by every tracked bracelet. Replaced as a
+# whole (never mutated in place) so a reader always sees one fix.
+parent_location = {
     "lat": None,
     "lng": None,
-    "address": None,
-    "timestamp": None
+    "heading": None  # Compass direction in degrees
 }
 
+# Process start, for /healthz uptime
+STARTED_AT = time.time()
+
+# Serializes every writer of device state, `config` and `parent_location`.
+# Readers never take it: they read device.snapshot, `config` and
+# `parent_location`, each of which is replaced with one atomic store.
+state_lock = threading.RLock()
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Exposed on /metrics; counters and histograms are per-thread and lock-free
+metrics = MetricsRegistry()
+
+samples_total = metrics.counter(
+    "guardianlink_samples", "Samples received, by source", ("source",))
+SAMPLES_BLE = samples_total.labels("ble")
+SAMPLES_SIMULATOR = samples_total.labels("simulator")
+SAMPLES_INGEST = samples_total.labels("ingest")
+
+ingest_rejected = metrics.counter(
+    "guardianlink_ingest_rejected", "Ingest records rejected as invalid")
+
+calibration_points = metrics.counter(
+    "guardianlink_calibration_points", "Points added to per-device calibration fits, by source",
+    ("source",))
+CALIBRATION_POINTS_MANUAL = calibration_points.labels("calibrate")
+CALIBRATION_POINTS_GPS = calibration_points.labels("gps")
+CALIBRATION_POINTS_TRILATERATION = calibration_points.labels("trilateration")
+calibration_fits = metrics.counter(
+    "guardianlink_calibration_fits", "Fitted calibration profiles published")
+
+update_latency = metrics.histogram(
+    "guardianlink_update_device_state_seconds", "Time spent in update_device_state per sample")
+
+events_total = metrics.counter(
+    "guardianlink_events", "Events published, by type (fall and disconnect rates)", ("type",))
+# Children for the event types push_event sees; any other type is bound on use
+EVENT_COUNTERS = {kind: events_total.labels(kind) for kind in (
+    "status_update", "location", "fall", "fall_detected", "device_disconnected",
+    "device_lost", "device_recovered", "geofence_enter", "geofence_exit")}
+
+ble_scan_cycle = metrics.histogram(
+    "guardianlink_ble_scan_cycle_seconds",
+    "Time between BLE scanner housekeeping ticks (1 s nominal; longer means the scan loop stalled)",
+    buckets=(0.9, 0.99, 1.0, 1.01, 1.05, 1.1, 1.25, 1.5, 2.0, 5.0, 10.0))
+
+ble_scanner_restarts = metrics.counter(
+    "guardianlink_ble_scanner_restarts", "BLE scanner restarts after an adapter error")
+
+# Read from the owning components at scrape time
+metrics.gauge("guardianlink_sse_subscribers", "Connected /events clients",
+              lambda: broadcaster.subscriber_count())
+metrics.gauge("guardianlink_sse_queue_depth", "Frames waiting to be sent, per /events client",
+              lambda: (((str(sub_id),), depth) for sub_id, depth in broadcaster.queue_depths()),
+              ("subscriber",))
+metrics.counter_func("guardianlink_sse_dropped_frames",
+                     "status_update deltas discarded because an /events client fell behind",
+                     lambda: broadcaster.dropped_total())
+metrics.counter_func("guardianlink_sse_overflow_disconnects",
+                     "/events clients disconnected for falling SSE_MAX_BACKLOG alerts behind",
+                     lambda: broadcaster.overflow_total())
+metrics.counter_func("guardianlink_sse_status_suppressed",
+                     "status_update events not sent: coalesced, unchanged or no subscribers",
+                     lambda: broadcaster.status_submitted - broadcaster.status_published)
+sse_bytes_total = metrics.counter(
+    "guardianlink_sse_bytes", "Bytes written to /events clients, by Content-Encoding",
+    ("encoding",))
+
+metrics.counter_func("guardianlink_history_dropped",
+                     "History rows discarded because the writer fell behind",
+                     lambda: history.dropped)
+metrics.gauge("guardianlink_devices", "Tracked devices", lambda: len(registry))
+metrics.gauge("guardianlink_devices_lost", "Devices silent for longer than the lost timeout",
+              lambda: len(watchdog.lost))
+
+fall_alerts_total = metrics.counter(
+    "guardianlink_fall_alerts", "Fall detector alerts, sent or suppressed as duplicates",
+    ("result",))
+FALL_ALERTS_SENT = fall_alerts_total.labels("sent")
+FALL_ALERTS_SUPPRESSED = fall_alerts_total.labels("suppressed")
+
+status_cache_total = metrics.counter(
+    "guardianlink_status_cache", "/api/status bodies served from cache or re-serialized",
+    ("result",))
+STATUS_CACHE_HIT = status_cache_total.labels("hit")
+STATUS_CACHE_MISS = status_cache_total.labels("miss")
+
 # ============================================================================
 # RSSI TO DISTANCE CALCULATION
 # ============================================================================
 
-def calculate_distance(rssi, tx_power=TX_POWER, n=PATH_LOSS_EXPONENT):
+def smooth_rssi(device, new_rssi):
     """
-    Calculate distance from RSSI using path loss model.
-    
-    Formula: d = 10^((TxPower - RSSI) / (10 * n))
+    Run a raw RSSI sample through the device's filter (config.rssi_filter).
     
-    Args:
-        rssi: Received Signal Strength Indicator
-        tx_power: RSSI at 1 meter distance
-        n: Path loss exponent (2-4)
+    The raw sample is also kept in the device's short history for fall
+    detection. Caller holds state_lock.
+    """
+    device.push_rssi(new_rssi)
+    if device.rssi_filter is None:
+        cfg = config
+        profile = cfg.calibration.profile(device.device_id)
+        device.rssi_filter = make_filter(cfg.rssi_filter, profile.tx_power,
+                                         profile.path_loss_exponent, **cfg.rssi_filter_params)
+    return device.rssi_filter.update(new_rssi)
+
+
+def fall_detector(device):
+    """The device's streaming fall detector, created on first use."""
+    if device.fall_detector is None:
+        device.fall_detector = FallDetector(FALL_PARAMS)
+    return device.fall_detector
+
+
+def detect_fall(device, current_rssi, now):
+    """
+    Feed a raw RSSI sample to the device's fall detector. A sudden drop
+    alone is not enough; it has to persist or be backed by IMU evidence.
     
     Returns:
-        Distance in meters
+        FallAlert (possibly suppressed as a duplicate) or None
     """
-    if rssi == 0:
-        return -1.0
-    
-    ratio = (tx_power - rssi) / (10.0 * n)
-    distance = math.pow(10, ratio)
-    
-    return round(distance, 2)
+    return fall_detector(device).rssi(current_rssi, now)
 
 
-def smooth_rssi(new_rssi):
+def fall_event(device, alert, **fields):
     """
-    Apply moving average filter to smooth RSSI readings.
+    Record a detector alert on the device and build its event, or count
+    it and return None when it repeats an alert still in cooldown. The
+    event is "fall" when the bracelet flagged it and "fall_detected" when
+    the server inferred it. Caller holds state_lock.
     """
-    rssi_history.append(new_rssi)
-    if len(rssi_history) == 0:
-        return new_rssi
-    return sum(rssi_history) / len(rssi_history)
+    if alert.suppressed:
+        FALL_ALERTS_SUPPRESSED.inc()
+        return None
+    FALL_ALERTS_SENT.inc()
+    device.record_fall(alert.ts)
+    return dict({
+        "type": "fall" if "hardware" in alert.reasons else "fall_detected",
+        "device": device.device_id,
+        "severity": "high" if alert.confidence >= 0.8 else "medium",
+        "confidence": alert.confidence,
+        "reasons": list(alert.reasons),
+        "timestamp": datetime.fromtimestamp(alert.ts).isoformat()
+    }, **fields)
 
 
-def detect_fall(current_rssi):
+# ============================================================================
+# AUTOMATIC CALIBRATION
+# ============================================================================
+
+def add_calibration_point(device_id, rssi, distance, weight=1.0, force=False, now=None):
     """
-    Detect sudden RSSI drop that might indicate a fall.
+    Add an (RSSI, true distance) point to a device's path-loss fit and
+    publish the refitted profile when it moved enough (see
+    auto_calibration.py). The device's filter follows the new profile;
+    its distance does from the next sample. Caller holds state_lock.
+    
+    Args:
+        force: publish the fit now (an explicit /api/calibrate point)
     
     Returns:
-        True if fall detected, False otherwise
+        The device's published (tx_power, path_loss_exponent), or None
     """
-    if len(rssi_history) < 3:
-        return False
-    
-    # Check for sudden drop
-    recent_avg = sum(list(rssi_history)[-3:]) / 3
-    if recent_avg - current_rssi >= FALL_RSSI_DROP:
-        return True
+    autocal.add(device_id, rssi, distance, weight)
+    cfg = config
+    params = autocal.update(device_id, cfg.path_loss_exponent,
+                            time.time() if now is None else now, force)
+    if params is None:
+        return autocal.published.get(device_id)
+    calibration_fits.inc()
+    profile = cfg.calibration.set_fitted(device_id, *params)
+    device = registry.get(device_id)
+    if device is not None and device.rssi_filter is not None:
+        device.rssi_filter.set_calibration(profile.tx_power, profile.path_loss_exponent)
+    return params
+
+
+def add_ground_truth(device_id, rssi, lat, lng, parent, counter, now):
+    """
+    Use a known position of the bracelet (its GPS, or an accurate
+    trilaterated fix) and the parent's fix as a calibration point for a
+    raw RSSI sample. Caller holds state_lock.
+    """
+    if not (parent["lat"] and parent["lng"]):
+        return
+    distance = calculate_ground_distance(parent["lat"], parent["lng"], lat, lng)
+    if GROUND_TRUTH_RANGE[0] <= distance <= GROUND_TRUTH_RANGE[1]:
+        counter.inc()
+        add_calibration_point(device_id, rssi, distance, GROUND_TRUTH_WEIGHT, now=now)
+
+
+def reset_calibration(device_id):
+    """
+    Forget a device's calibration points and put it back on the default
+    (or configured) profile. Returns False if it had no points.
+    """
+    with state_lock:
+        if not autocal.reset(device_id):
+            return False
+        config.calibration.drop_fitted(device_id)
+        device = registry.get(device_id)
+        if device is not None:
+            if device.rssi_filter is not None:
+                profile = config.calibration.profile(device_id)
+                device.rssi_filter.set_calibration(profile.tx_power, profile.path_loss_exponent)
+            recompute_devices([device])
+    return True
+
+
+def load_calibration_profiles(path):
+    """Load saved fits and publish their profiles; returns the count."""
+    global config
     
-    return False
+    with state_lock:
+        count = autocal.load(path)
+        config = calibrated(config)
+        recalibrate_filters()
+    return count
+
+
+def save_calibration_profiles():
+    """Save the fits if they changed since the last save."""
+    if not calibration_profiles_path:
+        return
+    with state_lock:
+        if not autocal.dirty:
+            return
+        data = autocal.to_dict()
+        autocal.dirty = False
+    autocal.save(calibration_profiles_path, data)
+
+
+def calibration_saver_loop(stop_event: threading.Event):
+    """Save changed fits every CALIBRATION_SAVE_INTERVAL seconds."""
+    while not stop_event.wait(CALIBRATION_SAVE_INTERVAL):
+        try:
+            save_calibration_profiles()
+        except OSError as e:
+            print(f"⚠️  Could not save calibration profiles: {e}")
 
 
 # ============================================================================
@@ -211,6 +576,21 @@ def calculate_bearing(lat1, lng1, lat2, lng2):
     return (bearing_deg + 360) % 360
 
 
+def calculate_ground_distance(lat1, lng1, lat2, lng2):
+    """
+    Great-circle (haversine) distance between two GPS coordinates.
+    
+    Returns:
+        Distance in meters
+    """
+    R = 6371000
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    a = (math.sin((lat2_rad - lat1_rad) / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * R * math.asin(math.sqrt(a))
+
+
 def bearing_to_direction(bearing):
     """
     Convert bearing degrees to cardinal direction.
@@ -226,157 +606,456 @@ def bearing_to_direction(bearing):
 # ============================================================================
 
 def push_event(payload: dict):
-    """Push event to SSE queue."""
+    """
+    Broadcast event to every connected SSE client. status_update events
+    go through the broadcaster's coalescing stage; everything else is
+    sent immediately.
+    """
     payload.setdefault("ts", time.time())
-    events.put(payload)
+    kind = payload["type"]
+    (EVENT_COUNTERS.get(kind) or events_total.labels(kind)).inc()
+    # Alerts and location reports go to history; status updates are
+    # already covered by the sample rows
+    if kind == "status_update":
+        if status_coalescer is not None:
+            status_coalescer.submit(payload)
+        else:
+            bus.publish("event", payload)
+        return
+    bus.publish("event", payload)
+    history.record_event(payload.get("device"), payload["ts"], kind, payload)
 
 
-def get_proximity_zone(rssi):
+def get_proximity_zone(rssi, device_id=None):
     """
-    Determine proximity zone based on RSSI.
+    Determine proximity zone based on RSSI, with the configured
+    thresholds (config.zone_thresholds).
     
     Returns tuple: (zone_name, zone_color)
     """
-    if rssi > -65:
-        return ("very_close", "#00ff00")  # Bright green - 0-10m
-    elif rssi > -75:
-        return ("near", "#ffff00")  # Yellow - 10-20m
-    elif rssi > -85:
-        return ("far", "#ff8800")  # Orange - 20-30m
-    else:
-        return ("out_of_range", "#ff0000")  # Red - >30m
+    return config.calibration.profile(device_id).zone(rssi)
 
 
-def update_device_state(rssi, address):
+def mark_seen(device, now):
     """
-    Update device state based on new RSSI reading.
+    Note a sample from a device: its last_seen time, registry order and
+    watchdog timer. Pushes device_recovered if the device had been lost.
+    Caller holds state_lock.
     """
-    global device_state, last_known_location
-    
-    # Smooth RSSI
-    smoothed_rssi = smooth_rssi(rssi)
+    silent = watchdog.seen(device.device_id, time.monotonic())
+    device.last_seen = now
+    registry.touch(device)
+    if silent is not None:
+        push_event({
+            "type": "device_recovered",
+            "device": device.device_id,
+            "silent_for": round(silent, 1),
+            "connected": device.connected,
+            "timestamp": datetime.fromtimestamp(now).isoformat()
+        })
+
+
+def device_lost(device_id, silent):
+    """
+    Disconnect a device the watchdog found silent and push device_lost.
+    Caller holds state_lock.
+    """
+    device = registry.get(device_id)
+    if device is None:
+        watchdog.forget(device_id)
+        return
+    device.connected = False
+    device.publish()
+    push_event({
+        "type": "device_lost",
+        "device": device.device_id,
+        "silent_for": round(silent, 1),
+        "last_seen": datetime.fromtimestamp(device.last_seen).isoformat(),
+        "last_location": device.last_known_location(),
+        "timestamp": datetime.now().isoformat()
+    })
+    push_event(status_event(device))
+
+
+def watchdog_loop(stop_event: threading.Event):
+    """Report devices that went silent, every WATCHDOG_TICK seconds."""
+    while not stop_event.wait(WATCHDOG_TICK):
+        with state_lock:
+            for device_id, silent in watchdog.expire(time.monotonic()):
+                try:
+                    device_lost(device_id, silent)
+                except Exception as e:
+                    # One bad device must not stop lost-device detection
+                    print(f"watchdog: could not report {device_id} lost: {e}")
+
+
+def status_event(device):
+    """Build the `status_update` SSE payload from a device's snapshot."""
+    snap = device.snapshot
+    return {
+        "type": "status_update",
+        "device": snap.device_id,
+        "connected": snap.connected,
+        "rssi": snap.rssi,
+        "distance": snap.distance,
+        "location": {"lat": snap.lat, "lng": snap.lng, "address": None,
+                     "accuracy": snap.accuracy}
+    }
+
+
+def update_device_state(rssi, address, device_id=None, publish_status=True, locate=True,
+                        now=None, record=True):
+    """
+    Update a device's state based on a new RSSI reading.
     
-    # Calculate distance (keep for reference, but use zones for display)
-    distance = calculate_distance(smoothed_rssi)
+    Args:
+        rssi: Raw RSSI sample
+        address: BLE/hardware address the sample came from
+        device_id: Logical device id (defaults to the address)
+        publish_status: Push a `status_update` event (batch ingest turns
+            this off and publishes one per device at the end)
+        locate: Derive the child's location from the distance and the
+            parent's fix (off when the sample carries its own GPS fix)
+        now: Time of the sample (defaults to now)
+        record: Write the sample to history (off when the caller records
+            it itself once the sample's GPS fix is applied)
     
-    # Get proximity zone
-    zone, zone_color = get_proximity_zone(smoothed_rssi)
+    Returns:
+        The updated DeviceState
+    """
+    started = time.perf_counter()
+    with state_lock:
+        cfg = config
+        parent = parent_location
+        device = registry.get_or_create(device_id or address, address)
+        now = time.time() if now is None else now
+        
+        # A fresh, accurate trilaterated fix is ground truth for this
+        # sample's distance to the parent
+        if (device.accuracy is not None and device.accuracy <= GROUND_TRUTH_MAX_ACCURACY
+                and now - (device.last_location_ts or 0) <= TRILATERATION_WINDOW):
+            add_ground_truth(device.device_id, rssi, device.lat, device.lng, parent,
+                             CALIBRATION_POINTS_TRILATERATION, now)
+        
+        # Smooth RSSI
+        smoothed_rssi = smooth_rssi(device, rssi)
+        
+        # Distance (keep for reference, but use zones for display) and
+        # proximity zone, both looked up in the device's calibration tables
+        distance, (zone, zone_color) = cfg.calibration.profile(device.device_id).lookup(smoothed_rssi)
+        
+        # Update state
+        announced = device.connected or device.last_seen is None
+        device.connected = zone != "out_of_range"
+        device.rssi = round(smoothed_rssi, 1)
+        device.distance = distance
+        device.proximity_zone = zone
+        device.zone_color = zone_color
+        mark_seen(device, now)
+        
+        # Check for fall
+        alert = detect_fall(device, rssi, now)
+        fall = fall_event(device, alert, rssi=rssi, distance=distance) if alert else None
+        
+        # Update child location if parent location is available. Devices
+        # that other observers also report on are trilaterated instead of
+        # projected along the parent's heading.
+        located = locate and parent_has_fix(parent)
+        if located:
+            fix = None
+            if device.observations is not None:
+                device.observe(PARENT_OBSERVER, parent["lat"], parent["lng"], distance, now)
+                fix = trilaterate(device, now)
+            if fix is not None:
+                device.set_location(fix.lat, fix.lng, now, LOCATION_TRILATERATED, fix.accuracy)
+            else:
+                child_lat, child_lng = calculate_child_location(
+                    parent["lat"],
+                    parent["lng"],
+                    distance,
+                    parent["heading"]
+                )
+                device.set_location(child_lat, child_lng, now, LOCATION_PROJECTED)
+        
+        device.publish()
+        if record:
+            history.record_sample(device.device_id, now, device.rssi, distance,
+                                  device.lat, device.lng, zone)
+        if located:
+            check_geofences(device, now)
+        
+        if fall:
+            push_event(fall)
+        
+        # Check for disconnect, once per move out of range
+        if announced and not device.connected:
+            push_event({
+                "type": "device_disconnected",
+                "device": device.device_id,
+                "distance": distance,
+                "last_location": device.last_known_location(),
+                "timestamp": datetime.now().isoformat()
+            })
+        
+        # Push status update event
+        if publish_status:
+            push_event(status_event(device))
     
-    # Update state
-    device_state["connected"] = zone != "out_of_range"
-    device_state["rssi"] = round(smoothed_rssi, 1)
-    device_state["distance"] = distance
-    device_state["proximity_zone"] = zone
-    device_state["zone_color"] = zone_color
-    device_state["last_seen"] = datetime.now().isoformat()
-    device_state["address"] = address
+    update_latency.observe(time.perf_counter() - started)
+    return device
+
+
+def observe_device(rssi, device_id, observer, observer_lat, observer_lng,
+                   address=None, publish_status=True, now=None):
+    """
+    Record a sample heard by another parent phone or gateway and
+    re-trilaterate the device.
     
-    # Check for fall
-    if detect_fall(rssi):
-        push_event({
-            "type": "fall_detected",
-            "severity": "high",
-            "rssi": rssi,
-            "distance": distance,
-            "timestamp": datetime.now().isoformat()
-        })
+    The observer's RSSI is converted to a distance on its own. It does not
+    feed the device's smoothing filter, proximity zone or connected flag,
+    which stay relative to the parent.
     
-    # Check for disconnect
-    if not device_state["connected"]:
+    Returns:
+        The updated DeviceState
+    """
+    with state_lock:
+        cfg = config
+        parent = parent_location
+        device = registry.get_or_create(device_id or address, address)
+        now = time.time() if now is None else now
+        if (device.observations is None and device.distance is not None
+                and device.last_seen is not None and parent_has_fix(parent)):
+            # First other observer: start from the parent's latest reading
+            device.observe(PARENT_OBSERVER, parent["lat"], parent["lng"],
+                           device.distance, device.last_seen)
+        distance = cfg.calibration.profile(device.device_id).distance(rssi)
+        device.observe(observer, float(observer_lat), float(observer_lng), distance, now)
+        mark_seen(device, now)
+        
+        fix = trilaterate(device, now)
+        if fix is not None:
+            device.set_location(fix.lat, fix.lng, now, LOCATION_TRILATERATED, fix.accuracy)
+        device.publish()
+        if fix is not None:
+            history.record_sample(device.device_id, now, device.rssi, device.distance,
+                                  device.lat, device.lng, device.proximity_zone)
+            check_geofences(device, now)
+        if publish_status:
+            push_event(status_event(device))
+    return device
+
+
+def trilaterate(device, now):
+    """Fused position of a device from its observers (None below three)."""
+    return trilateration.solve(device.observations, now, TRILATERATION_WINDOW)
+
+
+# ============================================================================
+# BULK RECOMPUTATION
+# ============================================================================
+
+def parent_has_fix(parent):
+    return bool(parent["lat"] and
+                parent["lng"] and
+                parent["heading"] is not None)
+
+
+def check_geofences(device, now):
+    """
+    Push geofence_enter/geofence_exit events for a device's new location.
+    Caller holds state_lock.
+    """
+    if device.lat is None or device.lng is None:
+        return
+    for kind, zone in geofences.update(device.device_id, device.lat, device.lng):
         push_event({
-            "type": "device_disconnected",
-            "distance": distance,
-            "last_location": last_known_location,
-            "timestamp": datetime.now().isoformat()
+            "type": kind,
+            "device": device.device_id,
+            "zone": zone.id,
+            "zone_name": zone.name,
+            "lat": device.lat,
+            "lng": device.lng,
+            "timestamp": datetime.fromtimestamp(now).isoformat()
         })
+
+
+def recompute_devices(devices=None):
+    """
+    Recompute distance (with the current calibration tables) and child
+    location for many devices, the locations in one vectorized pass. Used
+    when calibration or the parent's position changes.
     
-    # Update child location if parent location is available
-    if (device_state["parent_location"]["lat"] and 
-        device_state["parent_location"]["lng"] and
-        device_state["parent_location"]["heading"] is not None):
+    Returns:
+        Number of devices updated
+    """
+    with state_lock:
+        cfg = config
+        parent = parent_location
+        if devices is None:
+            devices = registry.devices()
+        devices = [d for d in devices if d.rssi_sample_count()]
+        if not devices:
+            return 0
         
-        child_lat, child_lng = calculate_child_location(
-            device_state["parent_location"]["lat"],
-            device_state["parent_location"]["lng"],
-            distance,
-            device_state["parent_location"]["heading"]
-        )
+        has_fix = parent_has_fix(parent)
+        plat, plng, heading = parent["lat"], parent["lng"], parent["heading"]
         
-        device_state["location"]["lat"] = child_lat
-        device_state["location"]["lng"] = child_lng
+        calibration = cfg.calibration
+        distances = [calibration.profile(d.device_id).distance(d.smoothed_rssi()) for d in devices]
+        if has_fix and numpy_available():
+            np = batch_location.np
+            lats, lngs = calculate_child_location_batch(plat, plng, np.array(distances), heading)
+            lats, lngs = lats.tolist(), lngs.tolist()
+        elif has_fix:
+            locations = [calculate_child_location(plat, plng, dist, heading) for dist in distances]
+            lats = [loc[0] for loc in locations]
+            lngs = [loc[1] for loc in locations]
         
-        # Update last known location if connected
-        if device_state["connected"]:
-            last_known_location["lat"] = child_lat
-            last_known_location["lng"] = child_lng
-            last_known_location["timestamp"] = datetime.now().isoformat()
+        now = time.time()
+        for i, device in enumerate(devices):
+            device.distance = distances[i]
+            # Trilaterated fixes are refreshed by the next observation, and
+            # the bracelet's own GPS fixes do not depend on the parent at all
+            if has_fix and device.location_source == LOCATION_PROJECTED:
+                device.set_location(lats[i], lngs[i], now, LOCATION_PROJECTED)
+            device.publish()
+        if has_fix:
+            for device in devices:
+                check_geofences(device, now)
+        
+        return len(devices)
+
+
+def recalibrate_filters():
+    """Carry every device filter's state over to the current calibration."""
+    with state_lock:
+        calibration = config.calibration
+        for device in registry.devices():
+            if device.rssi_filter is not None:
+                profile = calibration.profile(device.device_id)
+                device.rssi_filter.set_calibration(profile.tx_power, profile.path_loss_exponent)
+
+
+def device_bearings(devices):
+    """
+    Bearing and cardinal direction from the parent to each device.
     
-    # Push status update event
-    push_event({
-        "type": "status_update",
-        "connected": device_state["connected"],
-        "rssi": device_state["rssi"],
-        "distance": distance,
-        "location": device_state["location"]
-    })
+    Args:
+        devices: DeviceSnapshots
+    
+    Returns:
+        List of (bearing, direction) tuples, (None, None) where unknown
+    """
+    result = [(None, None)] * len(devices)
+    parent = parent_location
+    if not (parent["lat"] and parent["lng"]):
+        return result
+    
+    located = [i for i, d in enumerate(devices) if d.lat is not None and d.lng is not None]
+    if not located:
+        return result
+    
+    plat, plng = parent["lat"], parent["lng"]
+    if numpy_available():
+        np = batch_location.np
+        lats = np.fromiter((devices[i].lat for i in located), dtype=np.float64, count=len(located))
+        lngs = np.fromiter((devices[i].lng for i in located), dtype=np.float64, count=len(located))
+        bearings = calculate_bearing_batch(plat, plng, lats, lngs)
+        directions = bearing_to_direction_batch(bearings).tolist()
+        bearings = bearings.tolist()
+    else:
+        bearings = [calculate_bearing(plat, plng, devices[i].lat, devices[i].lng) for i in located]
+        directions = [bearing_to_direction(b) for b in bearings]
+    
+    for j, i in enumerate(located):
+        result[i] = (round(bearings[j], 1), directions[j])
+    return result
 
 
 # ============================================================================
 # BLE SCANNING
 # ============================================================================
 
-def ble_scanner_loop(stop_event: threading.Event):
+def make_advertisement_source():
+    """Build the advertisement source selected by BLE_BACKEND."""
+    from ble_backend import BleakAdvertisementSource, FakeAdvertisementSource
+    
+    if BLE_BACKEND == "fake":
+        # A bracelet walking away and back, advertising 10 times a second
+        trace = [("FA:KE:00:00:00:01", TARGET_DEVICE_NAME, -55 - (i if i < 30 else 60 - i))
+                 for i in range(60)]
+        return FakeAdvertisementSource(trace, interval=0.1, repeat=True)
+    return BleakAdvertisementSource()
+
+
+def ble_scanner_factory(source=None):
     """
-    Scan for BLE devices and track GuardianLink bracelet.
+    Return a function that builds a BleScanner wired to the device
+    registry. Handler state (addresses seen, last tick) is shared by every
+    scanner it builds, so it survives scanner restarts.
     """
-    if not BLE_AVAILABLE:
-        return
+    from ble_backend import BleScanner
     
-    print(f"BLE scanner started. Looking for device: {TARGET_DEVICE_NAME}")
+    # Last printed zone per address, so the log only shows zone changes
+    zones = {}
+    
+    def on_sample(rssi, address, name):
+        SAMPLES_BLE.inc()
+        trace.record("ble", {"device_id": address, "name": name, "rssi": rssi})
+        owner = shard_owner(address)
+        if owner is not None:
+            bus.publish("sample", {"address": address, "rssi": rssi}, owner)
+            return
+        state = update_device_state(rssi, address)
+        if zones.get(address) != state.proximity_zone:
+            zones[address] = state.proximity_zone
+            zone = state.proximity_zone.replace('_', ' ').title()
+            print(f"Found {name} ({address}): RSSI={rssi} | Zone: {zone}", flush=True)
+    
+    last_tick = time.perf_counter()
+    
+    def on_tick():
+        """
+        Time the scan loop's housekeeping ticks. Bracelets that stop
+        advertising are left to the watchdog, like every other source.
+        """
+        nonlocal last_tick
+        tick = time.perf_counter()
+        ble_scan_cycle.observe(tick - last_tick)
+        last_tick = tick
+    
+    def make_scanner():
+        return BleScanner(
+            source or make_advertisement_source(),
+            on_sample,
+            name_filter=TARGET_DEVICE_NAME,
+            on_tick=on_tick
+        )
     
-    # Import asyncio for running async discover
-    import asyncio
+    return make_scanner
+
+
+def ble_scanner_loop(stop_event: threading.Event, source=None):
+    """
+    Scan for BLE devices and track GuardianLink bracelets.
+    
+    One long-lived scanner and event loop: every advertisement is pushed
+    into update_device_state as it arrives, instead of sampling once per
+    discovery round.
+    """
+    if source is None and not BLE_AVAILABLE and BLE_BACKEND != "fake":
+        return
     
-    async def scan_devices():
-        """Async function to scan for devices with RSSI."""
-        devices = await BleakScanner.discover(timeout=2.0, return_adv=True)
-        return devices
+    print(f"BLE scanner started. Looking for device: {TARGET_DEVICE_NAME}")
+    make_scanner = ble_scanner_factory(source)
     
     while not stop_event.is_set():
         try:
-            # Run async discover in sync context
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            devices = loop.run_until_complete(scan_devices())
-            loop.close()
-            
-            found = False
-            for address, (device, advertisement_data) in devices.items():
-                name = device.name or ""
-                
-                # Look for our target device
-                if TARGET_DEVICE_NAME.lower() in name.lower():
-                    found = True
-                    rssi = advertisement_data.rssi
-                    update_device_state(rssi, device.address)
-                    zone = device_state['proximity_zone'].replace('_', ' ').title()
-                    print(f"Found {name}: RSSI={rssi} | Zone: {zone}", flush=True)
-            
-            if not found:
-                # Device not found - mark as disconnected
-                if device_state["connected"]:
-                    device_state["connected"] = False
-                    push_event({
-                        "type": "device_disconnected",
-                        "reason": "out_of_range",
-                        "last_location": last_known_location,
-                        "timestamp": datetime.now().isoformat()
-                    })
-            
-            time.sleep(1.0)
-            
+            make_scanner().run_forever(stop_event)
         except Exception as e:
+            # Adapter missing or reset: back off and start a fresh scanner
             print(f"BLE scanner error: {e}")
+            ble_scanner_restarts.inc()
             time.sleep(2.0)
 
 
@@ -402,261 +1081,847 @@ def simulator_loop(stop_event: threading.Event):
             direction = -1
         
         # Occasionally simulate a fall
-        if simulated_rssi < -80 and len(rssi_history) > 0:
+        if simulated_rssi < -80:
             simulated_rssi = -95  # Sudden drop
         
-        update_device_state(simulated_rssi, "SIM:00:00:00:00:00")
-        print(f"Simulator: RSSI={simulated_rssi}, Distance={device_state['distance']}m")
+        SAMPLES_SIMULATOR.inc()
+        trace.record("simulator", {"device_id": "SIM:00:00:00:00:00", "rssi": simulated_rssi})
+        owner = shard_owner("SIM:00:00:00:00:00")
+        if owner is not None:
+            bus.publish("sample", {"address": "SIM:00:00:00:00:00", "rssi": simulated_rssi}, owner)
+            continue
+        state = update_device_state(simulated_rssi, "SIM:00:00:00:00:00")
+        print(f"Simulator: RSSI={simulated_rssi}, Distance={state.distance}m")
 
 
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
 
-@app.route("/events")
-def sse_events():
-    """Server-Sent Events stream for real-time updates."""
-    def gen():
-        while True:
-            try:
-                ev = events.get(timeout=0.5)
-            except Empty:
-                # Send keepalive
-                yield ": keepalive\n\n"
-                continue
-            data = json.dumps(ev)
-            yield f"data: {data}\n\n"
+def sse_encoding(accept_encoding, compress=None):
+    """
+    Content-Encoding for a new /events stream, or None: compressed when
+    the client's ?compress= (or else SSE_COMPRESSION) opts in and its
+    Accept-Encoding allows gzip or deflate.
+    """
+    if compress == "1" or (compress is None and SSE_COMPRESSION):
+        return negotiate_encoding(accept_encoding)
+    return None
+
+
+def status_body(snapshot, parent):
+    """/api/status body for one DeviceSnapshot and parent location."""
+    status = snapshot.to_dict()
+    status["parent_location"] = dict(parent)
+    return {
+        "success": True,
+        "device": status,
+        "last_known_location": snapshot.last_known_location()
+    }
+
+
+# Longest ?wait= long-poll accepted by /api/status, in seconds
+STATUS_MAX_WAIT = 60.0
+
+# Shape-stable status for before anything has reported
+EMPTY_SNAPSHOT = DeviceState(None).snapshot
+
+
+class CachedStatus(NamedTuple):
+    """Serialized /api/status response and the state it was built from."""
+    snapshot: object
+    parent: object
+    status: int
+    etag: str
+    body: bytes
+
+
+# Request key (device_id, address or None) -> CachedStatus
+status_cache = {}
+
+
+def cached_status(key=None):
+    """
+    Pre-serialized /api/status response for `key`. The JSON body is built
+    once per published snapshot / parent location and reused by every
+    poll until one of them is replaced. The ETag is a hash of the body.
+    """
+    snapshot = snapshots.snapshot(key) if key else snapshots.most_recent_snapshot()
+    if snapshot is None and key:
+        body = json.dumps({"success": False, "error": f"unknown device: {key}"}, sort_keys=True).encode()
+        return CachedStatus(None, None, 404, None, body)
     
-    return Response(gen(), mimetype="text/event-stream")
+    if snapshot is None:
+        snapshot = EMPTY_SNAPSHOT
+    parent = parent_location
+    entry = status_cache.get(key)
+    if entry is not None and entry.snapshot is snapshot and entry.parent is parent:
+        STATUS_CACHE_HIT.inc()
+        return entry
+    
+    STATUS_CACHE_MISS.inc()
+    body = json.dumps(status_body(snapshot, parent), sort_keys=True, separators=(",", ":")).encode()
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    entry = status_cache[key] = CachedStatus(snapshot, parent, 200, etag, body)
+    return entry
+
+
+def wait_for_status(key, etag, timeout):
+    """Block until the status for `key` no longer has `etag`, or timeout."""
+    clock = registry.clock
+    deadline = time.monotonic() + timeout
+    while True:
+        since = clock.version
+        entry = cached_status(key)
+        remaining = deadline - time.monotonic()
+        if entry.etag != etag or remaining <= 0:
+            return entry
+        clock.wait(since, remaining)
+
+
+def parse_status_wait(value):
+    """Seconds from ?wait=, capped at STATUS_MAX_WAIT; 0 when absent."""
+    if not value:
+        return 0.0
+    try:
+        wait = float(value)
+    except ValueError:
+        raise ValueError(f"invalid wait: {value!r}") from None
+    if not wait >= 0:
+        raise ValueError(f"invalid wait: {value!r}")
+    return min(wait, STATUS_MAX_WAIT)
+
 
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers `etag`."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
 
-@app.route("/api/status", methods=["GET"])
-def get_status():
-    """Get current device status."""
-    return jsonify({
+
+def status_http(entry, if_none_match):
+    """(status, headers, body) for a CachedStatus, honouring If-None-Match."""
+    headers = {"Content-Type": "application/json", "Cache-Control": "no-cache"}
+    if entry.etag is None:
+        return entry.status, headers, entry.body
+    headers["ETag"] = entry.etag
+    if etag_matches(if_none_match, entry.etag):
+        return 304, headers, b""
+    return entry.status, headers, entry.body
+
+
+def devices_response(ids=None):
+    """/api/devices body, optionally restricted to comma-separated `ids`."""
+    if ids:
+        found = [s for s in (snapshots.snapshot(k) for k in ids.split(",")) if s is not None]
+    else:
+        found = snapshots.snapshots()
+    
+    return {
         "success": True,
-        "device": device_state,
-        "last_known_location": last_known_location
-    })
+        "count": len(found),
+        "parent_location": parent_location,
+        "devices": [
+            dict(s.to_dict(), last_known_location=s.last_known_location(),
+                 bearing=bearing, direction=direction)
+            for s, (bearing, direction) in zip(found, device_bearings(found))
+        ]
+    }
 
 
-@app.route("/api/parent-location", methods=["POST"])
-def update_parent_location():
+def set_parent_location(location, replicate=True):
+    """
+    Replace the parent's fix and recompute every child's location from it.
+    `replicate` passes the change on to the other cluster workers.
     """
-    Update parent's GPS location and compass heading.
+    global parent_location
+    
+    with state_lock:
+        if replicate or location != parent_location:
+            parent_location = location
+            registry.clock.advance()
+            recompute_devices()
+    if replicate:
+        replicate_change("parent_location", location=location)
+
+
+def calibrate_device(device_id, data):
+    """/api/calibrate body for one bracelet, forwarded to its cluster worker."""
+    reset = bool(data.get("reset"))
+    if not reset:
+        rssi, actual_distance = float(data["rssi"]), float(data["actual_distance"])
+        if not actual_distance > 0:
+            raise ValueError("actual_distance must be > 0")
+    owner = shard_owner(device_id)
+    if owner is not None:
+        bus.publish("control", {"op": "calibrate", "device": device_id, "data": data}, owner)
+        return {"success": True, "forwarded": owner}
+    
+    if reset:
+        reset = reset_calibration(device_id)
+        save_calibration_profiles()
+        return {"success": True, "device": device_id, "reset": reset}
     
-    Expected JSON:
-    {
-        "lat": 37.7749,
-        "lng": -122.4194,
-        "heading": 45  // Optional: compass direction in degrees
+    with state_lock:
+        CALIBRATION_POINTS_MANUAL.inc()
+        tx_power, n = add_calibration_point(device_id, rssi, actual_distance, force=True)
+        device = registry.get(device_id)
+        if device is not None:
+            recompute_devices([device])
+        fit = autocal.describe(device_id)
+        override = device_id in config.device_calibration
+    save_calibration_profiles()
+    return {
+        "success": True,
+        "device": device_id,
+        "tx_power": tx_power,
+        "path_loss_exponent": n,
+        "points": fit["points"],
+        "override": override,
+        "message": "Calibration successful"
     }
+
+
+def updated_config(cfg, data):
     """
-    try:
-        data = request.get_json()
+    `cfg` with the tunables in `data` (the JSON of POST /api/config or of
+    CONFIG_FILE) applied, calibration tables included. Keys left out keep
+    their current value; "devices" replaces every per-device override.
+    
+    Raises:
+        ValueError or TypeError for an invalid value
+    """
+    old = cfg
+    if "rssi_filter" in data or "rssi_filter_params" in data:
+        name = data.get("rssi_filter", cfg.rssi_filter)
+        params = data.get("rssi_filter_params",
+                          cfg.rssi_filter_params if name == cfg.rssi_filter else {})
+        params = make_filter(name, cfg.tx_power, cfg.path_loss_exponent, **params).params()
+        cfg = cfg._replace(rssi_filter=name, rssi_filter_params=MappingProxyType(params))
+    
+    for key in ("tx_power", "path_loss_exponent", "disconnect_threshold", "device_lost_timeout"):
+        if key in data:
+            cfg = cfg._replace(**{key: float(data[key])})
+    if not cfg.device_lost_timeout > 0:
+        raise ValueError("device_lost_timeout must be > 0")
+    if "zone_thresholds" in data:
+        cfg = cfg._replace(zone_thresholds=check_zone_thresholds(data["zone_thresholds"]))
+    if "devices" in data:
+        devices = data["devices"]
+        if not isinstance(devices, dict) or not all(isinstance(p, dict) for p in devices.values()):
+            raise ValueError("devices must map device ids to {tx_power, path_loss_exponent}")
+        overrides = {}
+        for device_id, params in devices.items():
+            overrides[device_id] = (float(params.get("tx_power", cfg.tx_power)),
+                                    float(params.get("path_loss_exponent", cfg.path_loss_exponent)))
+        cfg = cfg._replace(device_calibration=MappingProxyType(overrides))
+    return calibrated(cfg, old)
+
+
+def config_devices(cfg):
+    """Per-device calibration overrides as served by /api/config."""
+    return {device_id: {"tx_power": tx_power, "path_loss_exponent": n}
+            for device_id, (tx_power, n) in cfg.device_calibration.items()}
+
+
+def set_config(cfg, replicate=True):
+    """
+    Publish a new `config` snapshot and bring device state in line with
+    it: a new filter choice resets every device's filter, and a new
+    calibration (built here, published with the rest of the snapshot) is
+    carried into the filters and recomputed distances. The watchdog takes
+    the new lost timeout as each device's timer next fires. `replicate`
+    passes the change on to the other cluster workers.
+    """
+    global config
+    
+    with state_lock:
+        old = config
+        cfg = calibrated(cfg, old)
+        if cfg == old:
+            return
+        config = cfg
+        if (cfg.rssi_filter, cfg.rssi_filter_params) != (old.rssi_filter, old.rssi_filter_params):
+            # Devices build a fresh filter on their next sample
+            for device in registry.devices():
+                device.rssi_filter = None
+        if cfg.calibration is not old.calibration:
+            recalibrate_filters()
+            recompute_devices()
+        watchdog.set_timeout(cfg.device_lost_timeout)
+    if replicate:
+        fields = cfg._asdict()
+        del fields["calibration"]
+        replicate_change("config", config=dict(fields,
+                                               rssi_filter_params=dict(cfg.rssi_filter_params),
+                                               device_calibration=dict(cfg.device_calibration)))
+
+
+def load_config_file(path=CONFIG_FILE):
+    """
+    Apply the tunables in a JSON config file on top of the live config.
+    Every cluster worker reads the file itself, so the change is not
+    replicated.
+    
+    Raises:
+        OSError, ValueError or TypeError, leaving the config unchanged
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    with state_lock:
+        set_config(updated_config(config, data), replicate=False)
+
+
+def watch_config_file(stop_event, path=CONFIG_FILE, interval=CONFIG_POLL_INTERVAL):
+    """
+    Reload the config file whenever its mtime changes. A file that fails
+    to load (e.g. caught half-written) is reported and retried on its
+    next change; a removed file leaves the live config as it is.
+    """
+    def mtime():
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+    
+    seen = mtime()
+    while not stop_event.wait(interval):
+        current = mtime()
+        if current == seen:
+            continue
+        seen = current
+        if current is None:
+            continue
+        try:
+            load_config_file(path)
+            print(f"⚙️  Reloaded config from {path}")
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️  Config file {path} not applied: {e}")
+
+
+def save_geofences():
+    if GEOFENCES_FILE:
+        geofences.save(GEOFENCES_FILE)
+
+
+# Maximum per-item errors echoed back in a batch ingest response
+MAX_BATCH_ERRORS = 100
+
+
+def ingest_device(data):
+    """The device id an /ingest record is about."""
+    return data.get("device_id") or data.get("address") or "unknown"
+
+
+def check_ingest_record(data):
+    """Raise ValueError for an /ingest record apply_ingest_record would reject."""
+    if not (data.get("fall") or "rssi" in data or ("lat" in data and "lng" in data)
+            or any(field in data for field in MOTION_FIELDS)):
+        raise ValueError("no recognized fields")
+    if "observer" in data and not ("observer_lat" in data and "observer_lng" in data):
+        raise ValueError("observer samples need observer_lat and observer_lng")
+    ts = data.get("ts")
+    if ts is not None and (isinstance(ts, bool) or not isinstance(ts, (int, float))
+                           or not math.isfinite(ts) or ts < 0):
+        raise ValueError("ts must be epoch seconds")
+
+
+def sample_time(ts, now):
+    """A record's own `ts` if it is plausible on the server clock, else `now`."""
+    if ts and now - INGEST_TS_MAX_AGE <= ts <= now + INGEST_TS_MAX_AHEAD:
+        return ts
+    return now
+
+
+def apply_ingest_record(data, pending=None):
+    """
+    Apply one /ingest record to the device registry.
+    
+    Args:
+        data: Decoded JSON object
+        pending: Optional dict for batch mode. Location and status events
+            are stored in it keyed by device (latest wins) instead of being
+            pushed, so a batch publishes at most one of each per device.
+            Fall alerts are always pushed immediately.
+    
+    Returns:
+        The event describing the record
+    
+    Raises:
+        ValueError: if the record has no recognized fields, is an observer
+            sample without the observer's position, or has a ts that is not
+            a finite, non-negative number
+    """
+    check_ingest_record(data)
+    SAMPLES_INGEST.inc()
+    trace.record("ingest", data)
+    
+    device = ingest_device(data)
+    batch = pending is not None
+    
+    with state_lock:
+        state = registry.get_or_create(device, data.get("address"))
+        # The sample's own time (binary records always carry one); 0,
+        # absent or implausible means it is stamped on arrival
+        now = sample_time(data.get("ts"), time.time())
+        mark_seen(state, now)
         
-        device_state["parent_location"]["lat"] = data.get("lat")
-        device_state["parent_location"]["lng"] = data.get("lng")
-        device_state["parent_location"]["heading"] = data.get("heading", 0)
+        # IMU fields from the bracelet's MotionLogic, when present
+        if "yaw" in data:
+            state.yaw = float(data["yaw"])
+        if "steps" in data:
+            state.steps = int(data["steps"])
         
-        # Recalculate child location if we have distance
-        if device_state["distance"]:
-            child_lat, child_lng = calculate_child_location(
-                data["lat"],
-                data["lng"],
-                device_state["distance"],
-                data.get("heading", 0)
-            )
-            
-            device_state["location"]["lat"] = child_lat
-            device_state["location"]["lng"] = child_lng
-            
-            # Calculate bearing and direction
-            bearing = calculate_bearing(
-                data["lat"], data["lng"],
-                child_lat, child_lng
-            )
-            direction_text = bearing_to_direction(bearing)
-            
-            return jsonify({
-                "success": True,
-                "child_location": {
-                    "lat": child_lat,
-                    "lng": child_lng,
-                    "distance": device_state["distance"],
-                    "bearing": round(bearing, 1),
-                    "direction": direction_text
-                }
-            })
+        # MotionLogic features and the bracelet's own fall flag go through
+        # the fall detector, which debounces them and drops duplicates.
+        # Alerts are pushed immediately, in batches too.
+        extra = {"source": "ingest"}
+        if data.get("fall"):
+            extra["meta"] = data.get("meta", {})
+            if "severity" in data:
+                extra["severity"] = data["severity"]
+        falls = [fall_event(state, alert, **extra)
+                 for alert in feed_motion(fall_detector(state), data, now)]
+        falls = [ev for ev in falls if ev is not None]
+        
+        if data.get("fall") or not ("rssi" in data or ("lat" in data and "lng" in data)):
+            state.publish()
+            for ev in falls:
+                push_event(ev)
+            if falls:
+                return falls[0]
+            return {
+                "type": "fall_suppressed" if data.get("fall") else "motion",
+                "device": device,
+                "state": data.get("state"),
+                "source": "ingest"
+            }
+        for ev in falls:
+            push_event(ev)
         
-        return jsonify({"success": True})
+        # Sample heard by another parent phone / gateway at a known position
+        if "observer" in data and data.get("rssi") is not None:
+            observe_device(data["rssi"], device, str(data["observer"]),
+                           data["observer_lat"], data["observer_lng"],
+                           data.get("address"), publish_status=not batch, now=now)
+            ev = {
+                "type": "location",
+                "device": device,
+                "lat": state.lat,
+                "lng": state.lng,
+                "accuracy": state.accuracy,
+                "rssi": data.get("rssi"),
+                "observer": data["observer"],
+                "source": "ingest"
+            }
+        # If hardware reports location
+        elif "lat" in data and "lng" in data:
+            if data.get("rssi") is not None:
+                # The bracelet's own fix calibrates its RSSI
+                add_ground_truth(device, data["rssi"], float(data["lat"]), float(data["lng"]),
+                                 parent_location, CALIBRATION_POINTS_GPS, now)
+                update_device_state(data["rssi"], data.get("address"), device,
+                                    publish_status=not batch, locate=False, now=now,
+                                    record=False)
+            state.set_location(float(data["lat"]), float(data["lng"]), now, LOCATION_GPS)
+            state.publish()
+            history.record_sample(device, now, state.rssi, state.distance,
+                                  state.lat, state.lng, state.proximity_zone)
+            check_geofences(state, now)
+            ev = {
+                "type": "location",
+                "device": device,
+                "lat": float(data["lat"]),
+                "lng": float(data["lng"]),
+                "rssi": data.get("rssi"),
+                "source": "ingest"
+            }
+        # Fallback: rssi-only presence/location
+        else:
+            update_device_state(data["rssi"], data.get("address"), device,
+                                publish_status=not batch, now=now)
+            ev = {
+                "type": "location",
+                "device": device,
+                "rssi": data.get("rssi"),
+                "source": "ingest"
+            }
         
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 400
+        if batch:
+            pending[(device, "location")] = ev
+            if state.rssi is not None:
+                pending[(device, "status_update")] = state
+        else:
+            push_event(ev)
+    return ev
 
 
-@app.route("/api/calibrate", methods=["POST"])
-def calibrate_rssi():
+def ingest_batch(records):
     """
-    Calibrate TX_POWER for more accurate distance calculation.
+    Apply a stream of (record, error) pairs in one pass, then publish one
+    location and one status event per touched device.
+    
+    Returns a compact summary dict: counts plus the index and reason of
+    each rejected item. In a cluster, records for devices of another shard
+    are checked and forwarded to their owner, and counted as `forwarded`.
+    """
+    pending = {}
+    forward = {}
+    accepted = 0
+    forwarded = 0
+    rejected = 0
+    errors = []
+    
+    for index, (data, error) in enumerate(records):
+        if error is None:
+            try:
+                owner = shard_owner(ingest_device(data))
+                if owner is None:
+                    apply_ingest_record(data, pending)
+                else:
+                    check_ingest_record(data)
+                    forward_records(forward, owner, data)
+                    forwarded += 1
+                accepted += 1
+                continue
+            except (ValueError, TypeError) as e:
+                error = str(e)
+        rejected += 1
+        ingest_rejected.inc()
+        if len(errors) < MAX_BATCH_ERRORS:
+            errors.append({"index": index, "error": error})
+    
+    for owner in list(forward):
+        forward_records(forward, owner)
     
-    Expected JSON:
-    {
-        "rssi": -65,
-        "actual_distance": 1.0  // meters
+    devices = set()
+    for (device, kind), item in pending.items():
+        devices.add(device)
+        push_event(status_event(item) if kind == "status_update" else item)
+    
+    result = {
+        "ok": rejected == 0,
+        "accepted": accepted,
+        "rejected": rejected,
+        "devices": len(devices),
+        "errors": errors
     }
+    if shard_count > 1:
+        result["forwarded"] = forwarded
+    return result
+
+
+def ingest_response(mimetype, stream):
     """
-    global TX_POWER
+    Decode and apply an /ingest body of any supported format.
+    
+    Args:
+        mimetype: request Content-Type without parameters
+        stream: file-like object with a read() method
     
+    Returns:
+        (response body dict, HTTP status)
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        return ingest_batch(iter_ndjson(stream)), 200
+    if mimetype == binary_ingest.CONTENT_TYPE:
+        return ingest_batch(binary_ingest.iter_records(stream.read())), 200
+
+    first, stream = peek_stream(stream)
+    if first == b"[":
+        return ingest_batch(iter_json_array(stream)), 200
+
     try:
-        data = request.get_json()
-        rssi = data["rssi"]
-        actual_distance = data["actual_distance"]
-        
-        # Calculate TX_POWER (RSSI at 1 meter)
-        TX_POWER = rssi - (10 * PATH_LOSS_EXPONENT * math.log10(actual_distance))
-        
-        return jsonify({
-            "success": True,
-            "tx_power": round(TX_POWER, 1),
-            "message": "Calibration successful"
-        })
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 400
+        data = json.loads(stream.read())
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        ingest_rejected.inc()
+        return {"ok": False, "error": "invalid json"}, 400
 
+    try:
+        owner = shard_owner(ingest_device(data))
+        if owner is not None:
+            check_ingest_record(data)
+            bus.publish("ingest", {"records": [data]}, owner)
+            return {"ok": True, "forwarded": owner}, 200
+        ev = apply_ingest_record(data)
+    except ValueError as e:
+        ingest_rejected.inc()
+        return {"ok": False, "error": str(e)}, 400
+    return {"ok": True, "event": ev}, 200
+
+
+def health_body():
+    return {
+        "ok": True,
+        "uptime": round(time.time() - STARTED_AT, 3),
+        "devices": len(registry),
+        "shard": shard_index
+    }
 
-@app.route("/api/test-fall", methods=["POST"])
-def test_fall():
-    """Trigger a test fall event."""
-    push_event({
-        "type": "fall_detected",
-        "severity": "high",
-        "source": "manual_test",
-        "timestamp": datetime.now().isoformat()
-    })
-    return jsonify({"success": True})
 
+# ============================================================================
+# WSGI ENTRY POINTS
+# ============================================================================
 
-@app.route("/api/config", methods=["GET", "POST"])
-def config():
-    """Get or update configuration."""
-    global TX_POWER, PATH_LOSS_EXPONENT, DISCONNECT_THRESHOLD
-    
-    if request.method == "POST":
-        data = request.get_json()
-        
-        if "tx_power" in data:
-            TX_POWER = data["tx_power"]
-        if "path_loss_exponent" in data:
-            PATH_LOSS_EXPONENT = data["path_loss_exponent"]
-        if "disconnect_threshold" in data:
-            DISCONNECT_THRESHOLD = data["disconnect_threshold"]
-        
-        return jsonify({"success": True, "message": "Configuration updated"})
+def load_app():
+    """
+    Import the Flask app on first use. Flask (with flask_cors) takes longer
+    to import than the rest of the server put together, so its routes live
+    in flask_routes.py: `python server.py` answers /healthz and /ingest (see
+    wsgi_app) before anything needs them.
     
-    return jsonify({
-        "tx_power": TX_POWER,
-        "path_loss_exponent": PATH_LOSS_EXPONENT,
-        "disconnect_threshold": DISCONNECT_THRESHOLD,
-        "target_device_name": TARGET_DEVICE_NAME
-    })
+    Returns:
+        the Flask app (also available as `server.app`)
+    """
+    import flask_routes
+    return flask_routes.app
 
 
-@app.route("/ingest", methods=["POST"])
-def ingest():
-    """Generic ingest endpoint for hardware: accepts JSON payloads containing
-    device_id, rssi, lat, lng, and fall (boolean). The server immediately
-    pushes corresponding SSE events so the front-end can react in real-time.
+def __getattr__(name):
+    # `server.app` builds the Flask app on first use
+    if name == "app":
+        return load_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    Example payloads:
-      {"device_id":"DEV123","rssi":-42}
-      {"device_id":"DEV123","lat":37.7749, "lng":-122.4194}
-      {"device_id":"DEV123","fall":true, "severity":"high"}
+
+def json_response(body, status=200):
+    # Same body and CORS header as jsonify() behind flask_cors
+    return WsgiResponse(json.dumps(body, sort_keys=True, separators=(",", ":")) + "\n",
+                        status=status, mimetype="application/json",
+                        headers={"Access-Control-Allow-Origin": "*"})
+
+
+def wsgi_app(environ, start_response):
     """
-    try:
-        data = request.get_json(force=True)
-    except Exception:
-        return jsonify({"ok": False, "error": "invalid json"}), 400
-
-    device = data.get("device_id") or data.get("address") or "unknown"
-
-    # If hardware reports fall directly
-    if data.get("fall"):
-        ev = {
-            "type": "fall",
-            "device": device,
-            "severity": data.get("severity", "high"),
-            "meta": data.get("meta", {}),
-            "source": "ingest"
-        }
-        push_event(ev)
-        return jsonify({"ok": True, "event": ev})
-
-    # If hardware reports location
-    if "lat" in data and "lng" in data:
-        ev = {
-            "type": "location",
-            "device": device,
-            "lat": float(data["lat"]),
-            "lng": float(data["lng"]),
-            "rssi": data.get("rssi"),
-            "source": "ingest"
-        }
-        push_event(ev)
-        return jsonify({"ok": True, "event": ev})
-
-    # Fallback: rssi-only presence/location
-    if "rssi" in data:
-        ev = {
-            "type": "location",
-            "device": device,
-            "rssi": data.get("rssi"),
-            "source": "ingest"
-        }
-        push_event(ev)
-        return jsonify({"ok": True, "event": ev})
-
-    return jsonify({"ok": False, "error": "no recognized fields"}), 400
-
-
-@app.route("/monitor")
-def monitor_html():
-    # serve a simple static monitor page included in this folder
-    return send_from_directory(os.path.dirname(__file__), "monitor.html")
-
-
-@app.route("/")
-def index():
-    """Serve API documentation."""
-    return jsonify({
-        "name": "GuardianLink Backend API",
-        "version": "1.0",
-        "ble_available": BLE_AVAILABLE,
-        "endpoints": {
-            "/api/status": "GET - Current device status",
-            "/api/parent-location": "POST - Update parent GPS location",
-            "/api/calibrate": "POST - Calibrate RSSI to distance",
-            "/api/test-fall": "POST - Trigger test fall event",
-            "/api/config": "GET/POST - Configuration",
-            "/events": "GET - SSE stream for real-time updates"
-        }
-    })
+    WSGI app served by `python server.py` and by cluster workers. /healthz
+    and POST /ingest are answered here; every other request goes to the
+    Flask app, which is imported by the first of them.
+    """
+    path = environ.get("PATH_INFO")
+    method = environ["REQUEST_METHOD"]
+    if path == "/healthz" and method in ("GET", "HEAD"):
+        response = json_response(health_body())
+    elif path == "/ingest" and method == "POST":
+        req = WsgiRequest(environ)
+        response = json_response(*ingest_response(req.mimetype, req.stream))
+    else:
+        return load_app()(environ, start_response)
+    return response(environ, start_response)
+
+
+# ============================================================================
+# CLUSTER
+# ============================================================================
+
+# Records per forwarded ingest message
+FORWARD_BATCH = 1000
+
+# Seconds over which a worker coalesces its devices' snapshots before
+# publishing them to every worker (how far /api/status may lag a sample)
+SNAPSHOT_REPLICATION_WINDOW = 0.25
+
+
+def shard_of(device_id, shards):
+    """Shard that owns a device: crc32 of its id, modulo the shard count."""
+    return zlib.crc32(device_id.encode()) % shards
+
+
+def shard_owner(device_id):
+    """Shard that owns `device_id`, or None if it is this process."""
+    if shard_count == 1:
+        return None
+    shard = shard_of(device_id, shard_count)
+    return None if shard == shard_index else shard
+
+
+def forward_records(forward, owner, data=None):
+    """
+    Queue an /ingest record in `forward` for the worker that owns its
+    device. The owner's queue is sent once it holds FORWARD_BATCH records,
+    or right away when called without `data`.
+    """
+    records = forward.setdefault(owner, [])
+    if data is not None:
+        records.append(data)
+        if len(records) < FORWARD_BATCH:
+            return
+    del forward[owner]
+    if records:
+        bus.publish("ingest", {"records": records}, owner)
+
+
+def replicate_change(op, **fields):
+    """
+    Send a parent location, configuration or geofence change to every
+    cluster worker (a device calibration goes to its owner only, see
+    calibrate_device). The sender receives it too, so all workers apply
+    concurrent changes in the bus's order.
+    """
+    if shard_count > 1:
+        bus.publish("control", dict(fields, op=op), ALL_SHARDS)
+
+
+def apply_change(message):
+    """Apply a change sent by replicate_change()."""
+    op = message["op"]
+    if op == "parent_location":
+        set_parent_location(message["location"], replicate=False)
+    elif op == "config":
+        fields = dict(message["config"])
+        fields["rssi_filter_params"] = MappingProxyType(fields["rssi_filter_params"])
+        fields["zone_thresholds"] = tuple(fields["zone_thresholds"])
+        fields["device_calibration"] = MappingProxyType(
+            {device_id: tuple(params) for device_id, params in fields["device_calibration"].items()})
+        set_config(Config(**fields), replicate=False)
+    elif op == "calibrate":
+        # Addressed to this worker only: it owns the device
+        data = message["data"]
+        if data.get("reset"):
+            reset_calibration(message["device"])
+        else:
+            with state_lock:
+                CALIBRATION_POINTS_MANUAL.inc()
+                add_calibration_point(message["device"], float(data["rssi"]),
+                                      float(data["actual_distance"]), force=True)
+                device = registry.get(message["device"])
+                if device is not None:
+                    recompute_devices([device])
+        save_calibration_profiles()
+    elif op == "geofence_add":
+        with state_lock:
+            geofences.add(zone_from_dict(message["zone"]))
+    elif op == "geofence_remove":
+        with state_lock:
+            geofences.remove(message["zone"])
+
+
+def on_bus_message(topic, message, seq):
+    """
+    Handle one bus message: publish an event to this process's /events
+    clients, apply samples forwarded by other workers, or apply a change.
+    """
+    if topic == "event":
+        if message["type"] == "status_update":
+            broadcaster.publish_status(message, seq)
+        else:
+            broadcaster.publish(message, seq)
+    elif topic == "ingest":
+        ingest_batch((data, None) for data in message["records"])
+    elif topic == "sample":
+        update_device_state(message["rssi"], message["address"])
+    elif topic == "snapshot":
+        snapshots.put(DeviceSnapshot(*fields[:-1], tuple(fields[-1]))
+                      for fields in message["snapshots"])
+    elif topic == "control":
+        apply_change(message)
+
+
+bus.subscribe(on_bus_message)
+
+
+def publish_statuses(payloads):
+    for payload in payloads:
+        bus.publish("event", payload)
+
+
+def replicate_snapshot(snapshot):
+    """registry.on_publish of a cluster worker: queue a snapshot for the bus."""
+    snapshot_coalescer.submit({"device": snapshot.device_id, "snapshot": snapshot})
+
+
+def publish_snapshots(payloads):
+    found = [payload["snapshot"] for payload in payloads]
+    for start in range(0, len(found), FORWARD_BATCH):
+        bus.publish("snapshot", {"snapshots": found[start:start + FORWARD_BATCH]})
+
+
+def join_cluster(cluster_bus, index, count):
+    """
+    Make this process shard `index` of `count`, exchanging events and
+    forwarded samples over `cluster_bus`. Called by cluster.py in each
+    worker before it starts serving.
+    """
+    global bus, shard_index, shard_count, status_coalescer, calibration_profiles_path
+    global snapshots, snapshot_coalescer
+    
+    bus = cluster_bus
+    shard_index, shard_count = index, count
+    # Workers name new zones concurrently; their ids must not collide
+    geofences.id_prefix = f"zone-{index}-"
+    # Every worker answers /api/status and /api/devices for the whole
+    # fleet from the snapshots all owners publish
+    snapshots = SnapshotReplicas(registry.clock)
+    snapshot_coalescer = StatusCoalescer(SNAPSHOT_REPLICATION_WINDOW, publish_snapshots)
+    registry.on_publish = replicate_snapshot
+    if SSE_COALESCE_WINDOW > 0:
+        # Coalesced here, so the bus carries one update per device and window
+        status_coalescer = StatusCoalescer(SSE_COALESCE_WINDOW, publish_statuses)
+    if TRACE_FILE:
+        trace.path = f"{TRACE_FILE}.{index}"
+    if CALIBRATION_PROFILES_FILE:
+        calibration_profiles_path = f"{CALIBRATION_PROFILES_FILE}.{index}"
+    bus.subscribe(on_bus_message)
 
 
 # ============================================================================
 # STARTUP
 # ============================================================================
 
-def start_background_threads():
-    """Start BLE scanner or simulator thread."""
+def start_background_threads(ble_thread=True):
+    """
+    Start the history writer and the BLE scanner or simulator thread.
+    
+    Args:
+        ble_thread: run the BLE scanner on its own thread; the async
+            server passes False and runs it on its event loop instead
+    """
     stop_event = threading.Event()
     
-    if BLE_AVAILABLE:
+    if HISTORY_DB:
+        history.start()
+        print(f"📼 Recording history to {HISTORY_DB}")
+    if GEOFENCES_FILE:
+        with state_lock:
+            count = geofences.load(GEOFENCES_FILE)
+        print(f"📍 Loaded {count} geofence(s) from {GEOFENCES_FILE}")
+    if TRACE_FILE:
+        trace.start()
+        print(f"📼 Recording input trace to {trace.path}")
+    t = threading.Thread(target=watchdog_loop, args=(stop_event,), daemon=True, name="watchdog")
+    t.start()
+    if calibration_profiles_path:
+        count = load_calibration_profiles(calibration_profiles_path)
+        print(f"📐 Loaded {count} calibration fit(s) from {calibration_profiles_path}")
+        t = threading.Thread(target=calibration_saver_loop, args=(stop_event,), daemon=True,
+                             name="calibration-saver")
+        t.start()
+    if CONFIG_FILE:
+        if os.path.exists(CONFIG_FILE):
+            try:
+                load_config_file(CONFIG_FILE)
+                print(f"⚙️  Loaded config from {CONFIG_FILE}")
+            except (OSError, TypeError, ValueError) as e:
+                print(f"⚠️  Config file {CONFIG_FILE} not applied: {e}")
+        t = threading.Thread(target=watch_config_file, args=(stop_event,), daemon=True,
+                             name="config-watcher")
+        t.start()
+    
+    if shard_index != 0:
+        # One scanner per host: cluster worker 0 runs it and forwards samples
+        return stop_event
+    if BLE_AVAILABLE or BLE_BACKEND == "fake":
+        if not ble_thread:
+            return stop_event
         t = threading.Thread(target=ble_scanner_loop, args=(stop_event,), daemon=True)
         t.start()
         print("✅ BLE scanner thread started")
-    else:
+    elif SIMULATOR_ENABLED:
         t = threading.Thread(target=simulator_loop, args=(stop_event,), daemon=True)
         t.start()
         print("⚠️  BLE not available - simulator thread started")
@@ -665,18 +1930,27 @@ def start_background_threads():
 
 
 if __name__ == "__main__":
+    # flask_routes does `import server`: make that this module rather than
+    # a second copy with its own state
+    sys.modules["server"] = sys.modules[__name__]
+    
     print("=" * 60)
     print("GuardianLink Backend Server")
     print("=" * 60)
     print(f"BLE Available: {BLE_AVAILABLE}")
     print(f"Target Device: {TARGET_DEVICE_NAME}")
-    print(f"TX Power: {TX_POWER} dBm")
-    print(f"Path Loss Exponent: {PATH_LOSS_EXPONENT}")
-    print(f"Disconnect Threshold: {DISCONNECT_THRESHOLD}m")
+    print(f"TX Power: {config.tx_power} dBm")
+    print(f"Path Loss Exponent: {config.path_loss_exponent}")
+    print(f"Disconnect Threshold: {config.disconnect_threshold}m")
     print("=" * 60)
     
-    stop_event = start_background_threads()
-    
     # Flask's built-in server; for production use gunicorn
     # Using port 5001 to avoid conflict with macOS AirPlay on port 5000
-    app.run(host="0.0.0.0", port=5001, threaded=True, debug=False)
\ No newline at end of file
+    from werkzeug.serving import make_server
+    
+    # Bind before starting the recorders and the scanner, so health probes
+    # connect at once instead of being refused while they start
+    http_server = make_server("0.0.0.0", PORT, wsgi_app, threaded=True)
+    stop_event = start_background_threads()
+    print(f" * Running on http://0.0.0.0:{PORT}", flush=True)
+    http_server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Tests for auto_calibration.py: the incremental fit against a batch
+weighted least-squares fit, the fallbacks to the configured exponent,
+and when AutoCalibration publishes a new fit.
+
+Run from webapp/: python -m pytest test_auto_calibration.py
+"""
+import math
+import random
+
+import pytest
+
+from auto_calibration import (
+    APPLY_INTERVAL, MIN_SPREAD, AutoCalibration, PathLossFit,
+)
+
+
+def rssi_at(distance, tx_power, n):
+    return tx_power - 10 * n * math.log10(distance)
+
+
+def batch_fit(points):
+    """Weighted least-squares (tx_power, n) of [(rssi, distance, weight)]."""
+    w = sum(weight for _, _, weight in points)
+    xs = [(-10 * math.log10(d), rssi, weight) for rssi, d, weight in points]
+    mean_x = sum(x * weight for x, _, weight in xs) / w
+    mean_y = sum(y * weight for _, y, weight in xs) / w
+    sxx = sum(weight * (x - mean_x) ** 2 for x, _, weight in xs)
+    sxy = sum(weight * (x - mean_x) * (y - mean_y) for x, y, weight in xs)
+    n = sxy / sxx
+    return mean_y - n * mean_x, n
+
+
+def test_exact_points_recover_the_parameters():
+    fit = PathLossFit()
+    for distance in (0.5, 1, 2, 4, 8, 16):
+        fit.add(rssi_at(distance, -58.0, 2.7), distance)
+    tx_power, n = fit.solve(default_n=3.5)
+    assert tx_power == pytest.approx(-58.0)
+    assert n == pytest.approx(2.7)
+
+
+def test_incremental_fit_matches_batch_least_squares():
+    rng = random.Random(11)
+    fit = PathLossFit()
+    points = []
+    for _ in range(300):
+        distance = rng.uniform(0.5, 25)
+        point = (rssi_at(distance, -62.0, 3.1) + rng.gauss(0, 3), distance, rng.choice((0.2, 1.0)))
+        points.append(point)
+        fit.add(*point)
+        if len(points) in (10, 100, 300):
+            assert fit.solve(3.5) == pytest.approx(batch_fit(points), rel=1e-9)
+    assert fit.count == 300
+    tx_power, n = fit.solve(3.5)
+    assert tx_power == pytest.approx(-62.0, abs=1.0)
+    assert n == pytest.approx(3.1, abs=0.2)
+
+
+def test_narrow_spread_fits_tx_power_only():
+    fit = PathLossFit()
+    # 10 log10(3 / 2) = 1.8 dB apart: below MIN_SPREAD
+    fit.add(rssi_at(2.0, -55.0, 2.0), 2.0)
+    fit.add(rssi_at(3.0, -55.0, 2.0), 3.0)
+    assert fit.spread() < MIN_SPREAD
+    tx_power, n = fit.solve(default_n=2.0)
+    assert (tx_power, n) == (pytest.approx(-55.0), 2.0)
+    # With the wrong exponent, tx_power absorbs the difference at the mean distance
+    tx_power, n = fit.solve(default_n=3.5)
+    assert n == 3.5
+    assert rssi_at(math.sqrt(6.0), tx_power, n) == pytest.approx(rssi_at(math.sqrt(6.0), -55.0, 2.0))
+
+
+def test_implausible_slope_keeps_the_default_exponent():
+    fit = PathLossFit()
+    for distance in (1, 4, 16):
+        fit.add(rssi_at(distance, -60.0, 9.0), distance)
+    assert fit.spread() >= MIN_SPREAD
+    assert fit.solve(default_n=3.0)[1] == 3.0
+
+
+def test_needs_min_weight_and_positive_distances():
+    fit = PathLossFit()
+    assert fit.solve(3.5) is None
+    fit.add(-60, 1.0, weight=0.5)
+    assert fit.solve(3.5) is None
+    fit.add(-60, 1.0, weight=0.5)
+    assert fit.solve(3.5) == (pytest.approx(-60.0), 3.5)
+    for distance in (0, -1.0):
+        with pytest.raises(ValueError):
+            fit.add(-60, distance)
+
+
+def test_publishes_on_interval_and_tolerance():
+    cal = AutoCalibration()
+    assert cal.update("a", 3.5, now=0.0) is None  # no points yet
+    cal.add("a", -60.0, 1.0)
+    assert cal.update("a", 3.5, now=0.0) == (-60.0, 3.5)
+    assert cal.published["a"] == (-60.0, 3.5)
+
+    cal.add("a", -63.0, 1.0)  # mean now -61.5 dB: past the tolerance
+    assert cal.update("a", 3.5, now=APPLY_INTERVAL / 2) is None
+    assert cal.update("a", 3.5, now=APPLY_INTERVAL / 2, force=True) == (-61.5, 3.5)
+
+    cal.add("a", -61.4, 1.0)  # within tolerance of the published fit
+    assert cal.update("a", 3.5, now=100.0) is None
+    assert cal.describe("a") == {"points": 3, "weight": 3.0, "spread_db": 0.0,
+                                 "tx_power": -61.5, "path_loss_exponent": 3.5}
+
+
+def test_reset_and_save_load(tmp_path):
+    cal = AutoCalibration()
+    for distance in (1, 3, 9):
+        cal.add("a", rssi_at(distance, -59.0, 2.5), distance)
+    cal.add("b", -70.0, 2.0, weight=0.3)
+    cal.update("a", 3.5, now=0.0)
+    path = tmp_path / "profiles.json"
+    cal.save(path)
+
+    loaded = AutoCalibration()
+    assert loaded.load(path) == 2
+    assert not loaded.dirty
+    assert loaded.published == {"a": (-59.0, 2.5)}
+    assert loaded.fits["a"].to_list() == pytest.approx(cal.fits["a"].to_list())
+    assert loaded.describe("b")["tx_power"] is None
+
+    assert loaded.reset("a") and loaded.dirty
+    assert not loaded.reset("a")
+    assert loaded.describe("a") is None
+    assert AutoCalibration().load(tmp_path / "missing.json") == 0
@@ -0,0 +1,87 @@
+"""
+Tests for batch_ingest.py: the JSON-array and NDJSON readers, with bodies
+split across chunks, malformed elements and commas out of place.
+
+Run from webapp/: python -m pytest test_batch_ingest.py
+"""
+import io
+
+import pytest
+
+from batch_ingest import iter_json_array, iter_ndjson, peek_stream
+
+
+def json_array(body, chunk_size=3):
+    return list(iter_json_array(io.BytesIO(body.encode()), chunk_size=chunk_size))
+
+
+def ndjson(body):
+    return list(iter_ndjson(io.BytesIO(body.encode())))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64 * 1024])
+def test_json_array_elements_split_across_chunks(chunk_size):
+    body = ' [ {"device_id": "a", "rssi": -60} ,\n{"device_id": "b", "name": "café"} ] '
+    assert json_array(body, chunk_size) == [
+        ({"device_id": "a", "rssi": -60}, None),
+        ({"device_id": "b", "name": "café"}, None),
+    ]
+
+
+def test_json_array_empty():
+    assert json_array("[]") == []
+    assert json_array(" [ \n ] ") == []
+
+
+def test_json_array_non_object_element_is_skipped():
+    assert json_array('[1, {"a": 1}]') == [(None, "expected object"), ({"a": 1}, None)]
+
+
+@pytest.mark.parametrize("body, records", [
+    ('[,{"a": 1}]', 0),
+    ('[{"a": 1},,{"b": 2}]', 1),
+    ('[{"a": 1},]', 1),
+    ('[,]', 0),
+    ('[{"a": 1} {"b": 2}]', 1),
+])
+def test_json_array_stray_comma_is_a_parse_error(body, records):
+    result = json_array(body)
+    assert result[:records] == [({"a": 1}, None)][:records]
+    assert result[records:] == [(None, "invalid json")]
+
+
+@pytest.mark.parametrize("body, error", [
+    ('{"a": 1}', "expected array"),
+    ("", "unterminated array"),
+    ('[{"a": 1}', "unterminated array"),
+    ('[{"a": 1}, {"b": ', "invalid json"),
+])
+def test_json_array_malformed_body_ends_iteration(body, error):
+    assert json_array(body)[-1] == (None, error)
+
+
+def test_ndjson_bad_lines_do_not_stop_parsing():
+    body = '{"a": 1}\n\nnot json\n[1]\r\n{"b": 2}'
+    assert ndjson(body) == [
+        ({"a": 1}, None),
+        (None, "invalid json"),
+        (None, "expected object"),
+        ({"b": 2}, None),
+    ]
+
+
+def test_ndjson_lines_split_across_chunks(monkeypatch):
+    monkeypatch.setattr("batch_ingest.CHUNK_SIZE", 4)
+    body = "".join(f'{{"seq": {i}}}\n' for i in range(5))
+    assert ndjson(body) == [({"seq": i}, None) for i in range(5)]
+
+
+def test_peek_stream_keeps_the_whole_body():
+    first, stream = peek_stream(io.BytesIO(b'  \n[{"a": 1}]'), chunk_size=2)
+    assert first == b""  # only whitespace in the first chunk
+    assert stream.read(1) == b" "
+    assert stream.read() == b' \n[{"a": 1}]'
+
+    first, stream = peek_stream(io.BytesIO(b'\n{"a": 1}\n'))
+    assert first == b"{"
+    assert ndjson(stream.read().decode()) == [({"a": 1}, None)]
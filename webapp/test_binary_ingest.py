@@ -0,0 +1,76 @@
+"""
+Tests for binary_ingest.py: encode/decode round trips of version 1
+records, optional fields, and buffers with a truncated tail or an unknown
+version byte.
+
+Run from webapp/: python -m pytest test_binary_ingest.py
+"""
+import pytest
+
+from binary_ingest import (
+    RECORD_V1, decode_records, encode_record, encode_records, iter_records,
+)
+
+
+def test_round_trip_all_fields():
+    record = encode_record("GL-0001", rssi=-67, lat=37.7749295, lng=-122.4194155,
+                           fall=True, yaw=1.571, steps=1234, ts=1700000000.25)
+    assert len(record) == RECORD_V1.size == 44
+    assert decode_records(record) == [{
+        "device_id": "GL-0001",
+        "ts": 1700000000.25,
+        "fall": True,
+        "rssi": -67,
+        "lat": 37.7749295,
+        "lng": -122.4194155,
+        "yaw": 1.571,
+        "steps": 1234,
+    }]
+
+
+def test_fields_left_out_are_not_decoded():
+    # Same shape as a JSON /ingest object with only these keys
+    assert decode_records(encode_record("a", rssi=-50, ts=12.5)) == [
+        {"device_id": "a", "ts": 12.5, "rssi": -50}]
+    # A location needs both coordinates
+    assert decode_records(encode_record("a", lat=1.0, ts=0)) == [{"device_id": "a", "ts": 0.0}]
+    # Zero is a value, not an absent field
+    assert decode_records(encode_record("a", rssi=0, yaw=0.0, steps=0, ts=0)) == [
+        {"device_id": "a", "ts": 0.0, "rssi": 0, "yaw": 0.0, "steps": 0}]
+
+
+def test_sixteen_byte_device_id():
+    assert decode_records(encode_record("x" * 16, ts=0))[0]["device_id"] == "x" * 16
+    with pytest.raises(ValueError):
+        encode_record("x" * 17)
+
+
+def test_concatenated_records_decode_in_order():
+    samples = [{"device_id": f"dev{i}", "rssi": -40 - i, "ts": float(i)} for i in range(50)]
+    assert decode_records(encode_records(samples)) == samples
+
+
+def test_truncated_tail_stops_after_the_complete_records():
+    buf = encode_records([{"device_id": "a", "ts": 1}, {"device_id": "b", "ts": 2}])
+    assert list(iter_records(buf[:-1])) == [
+        ({"device_id": "a", "ts": 1.0}, None),
+        (None, "truncated record"),
+    ]
+    with pytest.raises(ValueError, match="truncated"):
+        decode_records(buf[:10])
+
+
+def test_unknown_version_stops_iteration():
+    buf = encode_record("a", ts=1) + bytes([9]) + encode_record("b", ts=2)[1:]
+    assert list(iter_records(buf)) == [
+        ({"device_id": "a", "ts": 1.0}, None),
+        (None, "unsupported record version 9"),
+    ]
+
+
+def test_accepts_any_buffer():
+    buf = encode_record("a", rssi=-1, ts=3)
+    expected = [{"device_id": "a", "ts": 3.0, "rssi": -1}]
+    assert decode_records(bytearray(buf)) == expected
+    assert decode_records(memoryview(buf)) == expected
+    assert decode_records(b"") == []
@@ -0,0 +1,115 @@
+"""
+Tests for ble_backend.py: BleScanner driven by a FakeAdvertisementSource,
+as the server runs it with BLE_BACKEND=fake.
+
+Run from webapp/: python -m pytest test_ble_backend.py
+"""
+import threading
+
+import pytest
+
+from ble_backend import AdvertisementSource, BleScanner, FakeAdvertisementSource
+
+ADVERTISEMENTS = [
+    ("AA:00", "GuardianLink-1", -50),
+    ("BB:00", "Headphones", -40),
+    ("CC:00", "guardianlink", -70),
+    ("DD:00", None, -80),
+]
+
+
+def start_scanner(scanner):
+    """Run the scanner on its own thread, as server.ble_scanner_loop does."""
+    stop = threading.Event()
+    thread = threading.Thread(target=scanner.run_forever, args=(stop,), daemon=True)
+    thread.start()
+    return stop, thread
+
+
+def collect(expected, **scanner_args):
+    """(samples, scanner) once `expected` samples have arrived or after 5 s."""
+    samples = []
+    done = threading.Event()
+
+    def on_sample(rssi, address, name):
+        samples.append((rssi, address, name))
+        if len(samples) >= expected:
+            done.set()
+
+    source = FakeAdvertisementSource(ADVERTISEMENTS, interval=0.001)
+    scanner = BleScanner(source, on_sample, tick_interval=0.01, **scanner_args)
+    stop, thread = start_scanner(scanner)
+    done.wait(5)
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    return samples, scanner
+
+
+def test_source_interface_is_abstract():
+    with pytest.raises(TypeError):
+        AdvertisementSource()
+
+
+def test_forwards_every_advertisement_in_order():
+    samples, _ = collect(4)
+    assert samples == [(rssi, address, name) for address, name, rssi in ADVERTISEMENTS]
+
+
+def test_name_filter_is_case_insensitive():
+    samples, _ = collect(2, name_filter="GuardianLink")
+    assert samples == [(-50, "AA:00", "GuardianLink-1"), (-70, "CC:00", "guardianlink")]
+
+
+def test_ticks_run_on_the_scanner_loop_and_stop_stops_the_source():
+    ticks = []
+    source = FakeAdvertisementSource(ADVERTISEMENTS, interval=0.001, repeat=True)
+    scanner = BleScanner(source, lambda *sample: None, tick_interval=0.01,
+                         on_tick=lambda: ticks.append(threading.current_thread()))
+    stop, thread = start_scanner(scanner)
+    while len(ticks) < 3 and thread.is_alive():
+        thread.join(0.01)
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert set(ticks) == {thread}
+    assert source._task is None  # stop() cancelled the replay
+
+
+def test_sample_errors_do_not_stop_the_scan():
+    samples = []
+
+    def on_sample(rssi, address, name):
+        samples.append(address)
+        if address == "AA:00":
+            raise ValueError("bad sample")
+
+    source = FakeAdvertisementSource(ADVERTISEMENTS, interval=0.001)
+    scanner = BleScanner(source, on_sample, tick_interval=0.01)
+    stop, thread = start_scanner(scanner)
+    while len(samples) < 4 and thread.is_alive():
+        thread.join(0.01)
+    stop.set()
+    thread.join(5)
+    assert samples == ["AA:00", "BB:00", "CC:00", "DD:00"]
+
+
+def test_inject_from_another_thread():
+    received = threading.Event()
+    samples = []
+
+    def on_sample(rssi, address, name):
+        samples.append((rssi, address, name))
+        received.set()
+
+    source = FakeAdvertisementSource()
+    scanner = BleScanner(source, on_sample, name_filter="guardian", tick_interval=0.01)
+    stop, thread = start_scanner(scanner)
+    while scanner.loop is None or source._callback is None:
+        thread.join(0.01)
+    source.inject("EE:00", "Other", -30)
+    source.inject("FF:00", "GuardianLink", -45)
+    assert received.wait(5)
+    stop.set()
+    thread.join(5)
+    assert samples == [(-45, "FF:00", "GuardianLink")]
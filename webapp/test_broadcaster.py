@@ -0,0 +1,135 @@
+"""
+Tests for broadcaster.py: a slow subscriber whose status ring overflows
+(compaction, dropped deltas, status_snapshot resync) and Last-Event-ID
+replay after an alert-backlog disconnect.
+
+Run from webapp/: python -m pytest test_broadcaster.py
+"""
+import json
+
+from broadcaster import KEEPALIVE_FRAME, EventBroadcaster
+
+
+def parse(frame):
+    """(event id or None, payload) of one SSE frame."""
+    event_id = None
+    for line in frame.decode().splitlines():
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            payload = json.loads(line[6:])
+    return event_id, payload
+
+
+def drain(sub):
+    """Everything a subscriber has queued, as (event id, payload) pairs."""
+    frames = sub.frames(keepalive=0)
+    assert next(frames) == KEEPALIVE_FRAME  # opening comment
+    received = []
+    for frame in frames:
+        if frame == KEEPALIVE_FRAME:
+            return received
+        received.append(parse(frame))
+    return received
+
+
+def status(device, **fields):
+    return {"type": "status_update", "device": device, "ts": 0.0, **fields}
+
+
+def alert(device):
+    return {"type": "fall_detected", "device": device, "ts": 0.0}
+
+
+def test_overflow_with_one_device_is_compacted():
+    hub = EventBroadcaster(buffer_size=4)
+    sub = hub.subscribe()
+    for rssi in range(-60, -50):
+        hub.publish_status(status("a", rssi=rssi, zone="near" if rssi < -55 else "immediate"))
+
+    assert sub.dropped == 0
+    received = drain(sub)
+    # Deltas merged per device, each at the id of the newest it covers
+    assert [event_id for event_id, _ in received] == [7, 8, 9, 10]
+    assert received[0][1] == status("a", rssi=-54, zone="immediate")
+    merged = {}
+    for _, delta in received:
+        merged.update(delta)
+    assert merged == status("a", rssi=-51, zone="immediate")
+
+
+def test_slow_subscriber_drops_deltas_and_resyncs():
+    hub = EventBroadcaster(buffer_size=4)
+    sub = hub.subscribe()
+    devices = [f"dev{i}" for i in range(10)]
+    for rssi, device in enumerate(devices):
+        hub.publish_status(status(device, rssi=-rssi))
+    hub.publish(alert("dev0"))
+
+    assert sub.dropped > 0
+    assert hub.dropped_total() == sub.dropped
+    received = drain(sub)
+    ids = [event_id for event_id, _ in received]
+
+    # The ring keeps the newest deltas, and alerts are never dropped
+    assert ids[:-1] == [7, 8, 9, 10, 11]
+    assert received[-2] == (11, alert("dev0"))
+    # Then one status_snapshot, without an id, with every device
+    snapshot_id, snapshot = received[-1]
+    assert snapshot_id is None
+    assert snapshot["type"] == "status_snapshot"
+    assert sorted(snapshot["devices"]) == devices
+    assert snapshot["devices"]["dev3"] == {"rssi": -3}
+
+    # Live deltas continue after the ids the snapshot covers
+    hub.publish_status(status("dev3", rssi=-40))
+    assert drain(sub) == [(12, status("dev3", rssi=-40))]
+
+
+def test_alert_backlog_disconnect_resumes_from_last_event_id():
+    # As in server.py, the replay buffer is as long as the backlog limit
+    hub = EventBroadcaster(replay_size=4, max_backlog=4)
+    sub = hub.subscribe()
+    hub.publish(alert("a"))
+    assert [event_id for event_id, _ in drain(sub)] == [1]
+    for device in "bcd":
+        hub.publish(alert(device))
+    assert not sub.overflowed
+    hub.publish(alert("e"))
+
+    assert sub.overflowed
+    assert hub.overflow_total() == 1
+    hub.unsubscribe(sub)
+    assert hub.overflow_total() == 1
+
+    # EventSource reconnects with the id of the last frame it received
+    resumed = hub.subscribe(last_event_id=1)
+    assert drain(resumed) == [(2, alert("b")), (3, alert("c")), (4, alert("d")), (5, alert("e"))]
+    # The replayed alerts do not count towards its own backlog
+    assert not resumed.overflowed
+    hub.publish(alert("f"))
+    assert drain(resumed) == [(6, alert("f"))]
+
+
+def test_resume_from_id_outside_replay_buffer_gets_snapshot_and_alerts():
+    hub = EventBroadcaster(replay_size=3)
+    watcher = hub.subscribe()  # status deltas are only published to listeners
+    hub.publish_status(status("a", rssi=-50))      # 1
+    hub.publish(alert("a"))                        # 2
+    hub.publish_status(status("a", rssi=-60))      # 3
+    hub.publish(alert("b"))                        # 4
+    hub.publish_status(status("b", rssi=-70))      # 5
+    assert len(drain(watcher)) == 5
+
+    # Id 1 has left the 3-frame buffer: snapshot, then buffered alerts only
+    resumed = drain(hub.subscribe(last_event_id=1))
+    assert resumed[0][0] is None
+    assert resumed[0][1]["devices"] == {"a": {"rssi": -60}, "b": {"rssi": -70}}
+    assert resumed[1:] == [(4, alert("b"))]
+
+    # Still in the buffer: exactly the frames after it
+    assert [event_id for event_id, _ in drain(hub.subscribe(last_event_id=3))] == [4, 5]
+    # Ahead of the server (it restarted): snapshot plus every buffered alert
+    restarted = drain(hub.subscribe(last_event_id=99))
+    assert restarted[0][1]["type"] == "status_snapshot"
+    assert restarted[1:] == [(4, alert("b"))]
@@ -0,0 +1,105 @@
+"""
+Tests for calibration.py: the lookup tables against the path-loss formula
+and the zone thresholds, the fallback outside the table, zone threshold
+validation and which profile a device is converted with.
+
+Run from webapp/: python -m pytest test_calibration.py
+"""
+import math
+
+import pytest
+
+from calibration import (
+    RSSI_MAX, RSSI_MIN, RSSI_STEP, TABLE_SIZE, ZONES, Calibration, CalibrationProfile,
+    FittedProfile, check_zone_thresholds, path_loss_distance, profile, zone_of,
+)
+
+THRESHOLDS = (-60.0, -70.0, -80.0)
+
+
+def test_formula():
+    assert path_loss_distance(-60, -60, 3.5) == 1.0
+    assert path_loss_distance(-95, -60, 3.5) == 10.0
+    assert path_loss_distance(-80, -60, 2.0) == 10.0
+    assert path_loss_distance(0, -60, 3.5) == -1.0
+
+
+@pytest.mark.parametrize("tx_power, n", [(-60, 3.5), (-52.5, 2.0), (-70, 4.2)])
+def test_table_matches_the_formula_at_every_step(tx_power, n):
+    table = CalibrationProfile(tx_power, n, THRESHOLDS)
+    for i in range(TABLE_SIZE):
+        rssi = round(RSSI_MIN + i * RSSI_STEP, 1)
+        assert table.lookup(rssi) == (path_loss_distance(rssi, tx_power, n),
+                                      zone_of(rssi, THRESHOLDS))
+
+
+@pytest.mark.parametrize("tx_power, n", [(-60, 3.5), (-52.5, 2.0)])
+def test_table_between_steps_is_within_rounding_of_the_formula(tx_power, n):
+    table = CalibrationProfile(tx_power, n, THRESHOLDS)
+    fitted = FittedProfile(tx_power, n, THRESHOLDS)
+    # Half a step of RSSI (0.33% at n = 3.5), plus the formula's rounding
+    bound = math.pow(10, RSSI_STEP / 2 / (10 * n)) - 1
+    rssi = -110.0
+    while rssi < -30.0:
+        exact = fitted.distance(rssi)
+        assert abs(table.distance(rssi) - exact) <= bound * exact + 0.01
+        rssi += 0.037
+
+
+def test_zone_boundaries():
+    table = CalibrationProfile(-60, 3.5, THRESHOLDS)
+    names = [zone for zone, _ in ZONES]
+    # A device has to be above a threshold to be in its zone
+    assert [table.zone(rssi)[0] for rssi in (-59.9, -60.0, -70.0, -79.9, -80.0, -100)] == [
+        names[0], names[1], names[2], names[2], names[3], names[3]]
+    assert table.zone(-60.0) is table.lookup(-60.0)[1] is ZONES[1]
+
+
+def test_outside_the_table_falls_back_to_the_formula():
+    table = CalibrationProfile(-60, 3.5, THRESHOLDS)
+    for rssi in (RSSI_MIN - 3, RSSI_MAX + 0.5, RSSI_MAX + 4):
+        assert table.lookup(rssi) == (path_loss_distance(rssi, -60, 3.5),
+                                      zone_of(rssi, THRESHOLDS))
+    assert table.distance(RSSI_MAX) == -1.0
+
+
+def test_profiles_with_equal_parameters_share_tables():
+    assert profile(-60.0, 3.5) is profile(-60.0, 3.5)
+    assert profile(-60.0, 3.5) is not profile(-60.0, 3.0)
+
+
+def test_zone_thresholds():
+    assert check_zone_thresholds([-50, -60, -70]) == (-50.0, -60.0, -70.0)
+    assert check_zone_thresholds({"very_close": -50, "near": -60, "far": -70}) == (
+        -50.0, -60.0, -70.0)
+    for bad in ([-50, -60], [-60, -50, -70], [-50, -50, -70], {"near": -60, "far": -70}):
+        with pytest.raises(ValueError):
+            check_zone_thresholds(bad)
+    with pytest.raises(ValueError):
+        CalibrationProfile(-60, 0)
+
+
+def test_override_wins_over_fitted_profile():
+    cal = Calibration.build(-60, 3.5, THRESHOLDS, device_params={"a": (-55, 2.5)},
+                            fitted_params={"a": (-50, 2.0), "b": (-65, 3.0)})
+    assert cal.profile("a").params() == {"tx_power": -55.0, "path_loss_exponent": 2.5}
+    assert isinstance(cal.profile("b"), FittedProfile)
+    assert cal.profile("c") is cal.default
+
+    # A new fit for an overridden device is kept, but not used
+    assert cal.set_fitted("a", -58, 3.2) is cal.devices["a"]
+    assert cal.profile("c") is cal.default
+    assert cal.set_fitted("c", -58, 3.2) is cal.profile("c")
+    cal.drop_fitted("c")
+    cal.drop_fitted("a")
+    assert cal.profile("c") is cal.default
+    assert cal.profile("a") is cal.devices["a"]
+
+
+def test_rebuild_keeps_fitted_profiles_unless_thresholds_change():
+    cal = Calibration.build(-60, 3.5, THRESHOLDS)
+    cal.set_fitted("a", -58, 3.2)
+    same = Calibration.build(-61, 3.0, THRESHOLDS, previous=cal)
+    assert same.profile("a") is cal.profile("a")
+    changed = Calibration.build(-61, 3.0, (-50, -60, -70), previous=cal)
+    assert changed.profile("a") is changed.default
@@ -0,0 +1,156 @@
+"""
+Tests for geofence.py: circle and polygon containment, the grid index
+against a brute-force scan, hysteresis on enter/exit transitions, and
+zone (de)serialization.
+
+Run from webapp/: python -m pytest test_geofence.py
+"""
+import math
+import random
+
+import pytest
+
+from geofence import (
+    METERS_PER_DEGREE, CircleZone, GeofenceEngine, PolygonZone, zone_from_dict,
+)
+
+LAT, LNG = 37.7749, -122.4194
+
+
+def offset(lat, lng, north=0.0, east=0.0):
+    """(lat, lng) moved `north` and `east` meters."""
+    return (lat + north / METERS_PER_DEGREE,
+            lng + east / (METERS_PER_DEGREE * math.cos(math.radians(lat))))
+
+
+def square(center_lat, center_lng, half):
+    """Square polygon `half` meters from its center to each edge."""
+    return [offset(center_lat, center_lng, north, east)
+            for north, east in ((-half, -half), (-half, half), (half, half), (half, -half))]
+
+
+def test_circle_contains():
+    zone = CircleZone("c", "home", LAT, LNG, 100)
+    assert zone.contains(*offset(LAT, LNG, north=99))
+    assert zone.contains(*offset(LAT, LNG, east=-99))
+    assert not zone.contains(*offset(LAT, LNG, north=71, east=71))
+    assert zone.contains(*offset(LAT, LNG, north=71, east=71), margin=1.0)
+    assert not zone.contains(*offset(LAT, LNG, east=106), margin=5.0)
+
+
+def test_polygon_contains_and_margin():
+    zone = PolygonZone("p", "school", square(LAT, LNG, 50))
+    assert zone.contains(LAT, LNG)
+    assert zone.contains(*offset(LAT, LNG, north=49, east=-49))
+    assert not zone.contains(*offset(LAT, LNG, north=52))
+    assert zone.contains(*offset(LAT, LNG, north=52), margin=5.0)
+    # Past a corner the margin is the distance to the vertex, not to either edge
+    assert not zone.contains(*offset(LAT, LNG, north=54, east=54), margin=5.0)
+
+
+def test_concave_polygon():
+    # An L shape: the notch at the north-east is outside
+    points = [offset(LAT, LNG, north, east) for north, east in
+              ((0, 0), (0, 200), (100, 200), (100, 100), (200, 100), (200, 0))]
+    zone = PolygonZone("l", "", points)
+    assert zone.contains(*offset(LAT, LNG, 50, 150))
+    assert zone.contains(*offset(LAT, LNG, 150, 50))
+    assert not zone.contains(*offset(LAT, LNG, 150, 150))
+
+
+def test_grid_lookup_matches_brute_force():
+    rng = random.Random(3)
+    engine = GeofenceEngine(cell_deg=0.002, hysteresis=0.0)
+    zones = []
+    for _ in range(40):
+        lat, lng = offset(LAT, LNG, rng.uniform(-3000, 3000), rng.uniform(-3000, 3000))
+        if rng.random() < 0.5:
+            zones.append(CircleZone(None, "", lat, lng, rng.uniform(20, 600)))
+        else:
+            zones.append(PolygonZone(None, "", square(lat, lng, rng.uniform(20, 600))))
+    # Larger than MAX_ZONE_CELLS cells: kept out of the grid
+    zones.append(CircleZone(None, "city", LAT, LNG, 50000))
+    engine.extend(zones)
+    assert [zone.name for zone in engine._large] == ["city"]
+
+    for i in range(500):
+        lat, lng = offset(LAT, LNG, rng.uniform(-3500, 3500), rng.uniform(-3500, 3500))
+        device = f"dev{i}"
+        engine.update(device, lat, lng)
+        assert engine.inside(device) == sorted(z.id for z in zones if z.contains(lat, lng))
+
+
+def test_zone_spanning_cells_is_found_from_each_cell():
+    engine = GeofenceEngine(cell_deg=0.001)
+    zone = engine.add(CircleZone(None, "", 0.0005, 0.0005, 150))
+    assert sum(zone in cell for cell in engine._grid.values()) == 9
+    for lat, lng in ((-0.0004, 0.0005), (0.0014, 0.0005), (0.0005, -0.0004)):
+        assert engine.update(f"{lat},{lng}", lat, lng) == [("geofence_enter", zone)]
+
+
+def test_hysteresis_on_exit_only():
+    engine = GeofenceEngine(hysteresis=5.0)
+    zone = engine.add(CircleZone(None, "", LAT, LNG, 100))
+    assert zone.id == zone.name == "zone-1"
+
+    assert engine.update("a", *offset(LAT, LNG, east=103)) == []  # no margin to get in
+    assert engine.update("a", *offset(LAT, LNG, east=99)) == [("geofence_enter", zone)]
+    assert engine.update("a", *offset(LAT, LNG, east=90)) == []
+    assert engine.update("a", *offset(LAT, LNG, east=104)) == []  # jitter on the edge
+    assert engine.inside("a") == [zone.id]
+    assert engine.update("a", *offset(LAT, LNG, east=106)) == [("geofence_exit", zone)]
+    assert engine.update("a", *offset(LAT, LNG, east=103)) == []
+    assert engine.inside("a") == []
+
+
+def test_exit_is_reported_after_leaving_the_zones_grid_cells():
+    engine = GeofenceEngine(cell_deg=0.001)
+    zone = engine.add(CircleZone(None, "", LAT, LNG, 30))
+    engine.update("a", LAT, LNG)
+    assert engine.update("a", *offset(LAT, LNG, north=5000)) == [("geofence_exit", zone)]
+
+
+def test_remove_forgets_without_exit_and_occupancy():
+    engine = GeofenceEngine()
+    home = engine.add(CircleZone(None, "home", LAT, LNG, 100))
+    park = engine.add(CircleZone(None, "park", LAT, LNG, 300))
+    transitions = engine.update("a", LAT, LNG)
+    assert sorted(zone.id for _, zone in transitions) == [home.id, park.id]
+    engine.update("b", *offset(LAT, LNG, north=200))
+    assert engine.occupancy() == {home.id: ["a"], park.id: ["a", "b"]}
+
+    assert engine.remove(home.id)
+    assert not engine.remove(home.id)
+    assert engine.inside("a") == [park.id]
+    assert engine.update("a", *offset(LAT, LNG, north=1000)) == [("geofence_exit", park)]
+
+
+def test_zone_from_dict_and_save_load(tmp_path):
+    circle = zone_from_dict({"name": "home", "lat": LAT, "lng": LNG, "radius": 100})
+    polygon = zone_from_dict({"id": "p1", "type": "polygon",
+                              "points": [list(p) for p in square(LAT, LNG, 50)]})
+    assert isinstance(circle, CircleZone) and isinstance(polygon, PolygonZone)
+
+    engine = GeofenceEngine()
+    engine.extend([circle, polygon])
+    path = tmp_path / "geofences.json"
+    engine.save(path)
+    loaded = GeofenceEngine()
+    assert loaded.load(path) == 2
+    assert [zone.to_dict() for zone in loaded.zones()] == [circle.to_dict(), polygon.to_dict()]
+    assert GeofenceEngine().load(tmp_path / "missing.json") == 0
+
+
+@pytest.mark.parametrize("data", [
+    [1, 2],
+    "zone",
+    {"type": "circle", "lat": LAT, "lng": LNG},
+    {"type": "circle", "lat": LAT, "lng": LNG, "radius": 0},
+    {"type": "circle", "lat": 91, "lng": LNG, "radius": 10},
+    {"type": "polygon", "points": [[0, 0], [0, 1]]},
+    {"type": "polygon", "points": 5},
+    {"type": "hexagon"},
+])
+def test_zone_from_dict_rejects_invalid_zones(data):
+    with pytest.raises(ValueError):
+        zone_from_dict(data)
@@ -0,0 +1,99 @@
+"""
+Tests for rssi_filters.py: the moving average and EMA against their
+formulas, the Kalman filter's convergence, smoothing and recalibration,
+and make_filter's validation.
+
+Run from webapp/: python -m pytest test_rssi_filters.py
+"""
+import random
+import statistics
+
+import pytest
+
+from rssi_filters import EmaFilter, KalmanFilter, MovingAverageFilter, make_filter
+
+SAMPLES = [-60, -62, -70, -55, -58, -65, -61, -59]
+
+
+def test_moving_average_is_the_mean_of_the_last_window():
+    f = MovingAverageFilter(window=3)
+    assert f.value is None
+    for i, rssi in enumerate(SAMPLES):
+        window = SAMPLES[max(0, i - 2):i + 1]
+        assert f.update(rssi) == pytest.approx(sum(window) / len(window))
+    assert f.value == pytest.approx(sum(SAMPLES[-3:]) / 3)
+
+
+def test_ema_follows_its_formula():
+    f = EmaFilter(alpha=0.25)
+    assert f.update(SAMPLES[0]) == SAMPLES[0]
+    expected = float(SAMPLES[0])
+    for rssi in SAMPLES[1:]:
+        expected += 0.25 * (rssi - expected)
+        assert f.update(rssi) == pytest.approx(expected)
+    # alpha = 1 is no smoothing at all
+    f = EmaFilter(alpha=1.0)
+    assert [f.update(rssi) for rssi in SAMPLES] == SAMPLES
+
+
+def test_kalman_starts_at_the_first_sample_and_holds_a_constant():
+    f = KalmanFilter(tx_power=-59, n=2.7)
+    assert f.update(-70) == pytest.approx(-70)
+    for _ in range(20):
+        value = f.update(-70)
+    assert value == pytest.approx(-70)
+
+
+def test_kalman_smooths_noise_and_follows_a_step():
+    rng = random.Random(7)
+    f = KalmanFilter(q=0.002, r=16.0)
+    raw = [-65 + rng.gauss(0, 4) for _ in range(400)]
+    out = [f.update(rssi) for rssi in raw]
+    settled = out[100:]
+    assert statistics.pstdev(settled) < statistics.pstdev(raw[100:]) / 2
+    assert statistics.fmean(settled) == pytest.approx(-65, abs=1.0)
+
+    # A real move 10 dB away is tracked within a few dozen samples
+    moved = [f.update(-75 + rng.gauss(0, 4)) for _ in range(100)]
+    assert statistics.fmean(moved[40:]) == pytest.approx(-75, abs=1.5)
+
+
+def test_kalman_recalibration_keeps_the_estimate():
+    f = KalmanFilter(tx_power=-60, n=3.5)
+    for rssi in SAMPLES:
+        f.update(rssi)
+    before = f.value
+    f.set_calibration(-55, 2.0)
+    assert f.tx_power == -55 and f.n == 2.0
+    # The same RSSI-equivalent, re-expressed in the new log-distance units
+    assert f.tx_power - 10.0 * f.n * f._x == pytest.approx(before)
+    assert f.update(before) == pytest.approx(before)
+
+
+@pytest.mark.parametrize("name, cls", [
+    ("moving_average", MovingAverageFilter), ("ema", EmaFilter), ("kalman", KalmanFilter),
+])
+def test_make_filter(name, cls):
+    f = make_filter(name, -60, 3.5)
+    assert isinstance(f, cls)
+    assert type(f).name == name
+    assert f.update(-60) == pytest.approx(-60)
+
+
+@pytest.mark.parametrize("name, params", [
+    ("median", {}),
+    ("moving_average", {"window": 0}),
+    ("ema", {"alpha": 0}),
+    ("ema", {"alpha": 1.5}),
+    ("kalman", {"q": 0}),
+    ("kalman", {"r": -1}),
+    ("kalman", {"gain": 1}),
+])
+def test_make_filter_rejects_bad_names_and_params(name, params):
+    with pytest.raises(ValueError):
+        make_filter(name, -60, 3.5, **params)
+
+
+def test_params_rebuild_an_equal_filter():
+    for f in (MovingAverageFilter(window=5), EmaFilter(alpha=0.4), KalmanFilter(q=0.01, r=9.0)):
+        assert make_filter(type(f).name, -60, 3.5, **f.params()).params() == f.params()
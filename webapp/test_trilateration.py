@@ -0,0 +1,104 @@
+"""
+Tests for trilateration.py: the Gauss-Newton fix from exact and noisy
+distances, the degenerate cases that must not produce a fix, and the
+observation window's replace, evict and expire rules.
+
+Run from webapp/: python -m pytest test_trilateration.py
+"""
+import math
+import random
+
+import pytest
+
+from trilateration import METERS_PER_DEGREE, ObservationWindow, solve
+
+LAT, LNG = 51.5007, -0.1246
+
+
+def offset(north=0.0, east=0.0):
+    """(lat, lng) `north` and `east` meters from (LAT, LNG)."""
+    return (LAT + north / METERS_PER_DEGREE,
+            LNG + east / (METERS_PER_DEGREE * math.cos(math.radians(LAT))))
+
+
+def meters_between(a, b):
+    dy = (a[0] - b[0]) * METERS_PER_DEGREE
+    dx = (a[1] - b[1]) * METERS_PER_DEGREE * math.cos(math.radians(LAT))
+    return math.hypot(dx, dy)
+
+
+def observe(window, observers, target, noise=None, ts=100.0):
+    for i, (north, east) in enumerate(observers):
+        position = offset(north, east)
+        distance = meters_between(position, target)
+        if noise is not None:
+            distance *= noise()
+        window.add(f"obs{i}", *position, distance, ts)
+
+
+@pytest.mark.parametrize("observers, target", [
+    ([(0, 0), (0, 30), (30, 0)], (12, 9)),
+    ([(0, 0), (0, 30), (30, 0), (30, 30)], (25, -10)),   # outside the observers
+    ([(-40, 0), (40, 5), (0, 60), (10, -50), (-5, 1)], (3, 4)),
+])
+def test_exact_distances_give_the_exact_position(observers, target):
+    window = ObservationWindow()
+    observe(window, observers, offset(*target))
+    fix = solve(window, now=100.0)
+    assert fix.observers == len(observers)
+    assert meters_between((fix.lat, fix.lng), offset(*target)) < 0.2  # 6-decimal rounding
+    # The distance model's error, not the (zero) residuals
+    assert fix.accuracy > 0
+
+
+def test_noisy_distances_stay_within_the_reported_accuracy():
+    rng = random.Random(5)
+    observers = [(0, 0), (0, 40), (40, 0), (40, 40), (20, -20)]
+    errors = []
+    within = 0
+    for _ in range(200):
+        window = ObservationWindow()
+        target = offset(rng.uniform(5, 35), rng.uniform(5, 35))
+        observe(window, observers, target, noise=lambda: math.exp(rng.gauss(0, 0.1)))
+        fix = solve(window, now=100.0)
+        error = meters_between((fix.lat, fix.lng), target)
+        errors.append(error)
+        within += error <= 2 * fix.accuracy
+    assert sorted(errors)[len(errors) // 2] < 3.0
+    assert within >= 0.9 * len(errors)
+
+
+def test_too_few_or_collinear_observers_give_no_fix():
+    window = ObservationWindow()
+    observe(window, [(0, 0), (0, 30)], offset(10, 10))
+    assert solve(window, now=100.0) is None
+    assert solve(window, now=100.0, min_observers=2) is None  # mirror ambiguity
+
+    window = ObservationWindow()
+    observe(window, [(0, 0), (0, 10), (0, 20), (0, 30)], offset(10, 10))
+    assert solve(window, now=100.0) is None
+
+
+def test_stale_observations_are_expired_before_solving():
+    window = ObservationWindow()
+    observe(window, [(0, 0), (0, 30), (30, 0)], offset(10, 10), ts=100.0)
+    window.add("late", *offset(50, 50), 10.0, ts=107.0)
+    assert solve(window, now=109.0) is not None
+    assert solve(window, now=111.0) is None
+    assert [o["observer"] for o in window.observations()] == ["late"]
+
+
+def test_window_replaces_per_observer_and_evicts_the_stalest():
+    window = ObservationWindow(size=3)
+    window.add("a", 1.0, 2.0, 5.0, ts=10.0)
+    window.add("b", 1.0, 2.0, 6.0, ts=11.0)
+    window.add("a", 1.5, 2.5, 7.0, ts=12.0)
+    assert len(window) == 2
+    assert window.observations()[0] == {"observer": "a", "lat": 1.5, "lng": 2.5,
+                                        "distance": 7.0, "ts": 12.0}
+    window.add("c", 0.0, 0.0, 1.0, ts=13.0)
+    window.add("d", 0.0, 0.0, 1.0, ts=14.0)   # full: "b" is the stalest
+    assert sorted(o["observer"] for o in window.observations()) == ["a", "c", "d"]
+
+    window.expire(13.5)
+    assert [o["observer"] for o in window.observations()] == ["d"]
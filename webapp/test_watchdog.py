@@ -0,0 +1,106 @@
+"""
+Tests for watchdog.TimerWheel: firing at the deadline, cascades across
+the level-0 and level-1 boundaries, the horizon clamp, re-arm and cancel.
+
+Run from webapp/: python -m pytest test_watchdog.py
+"""
+import pytest
+
+from watchdog import LEVEL0_BITS, LEVEL_BITS, TimerWheel
+
+LEVEL1 = 1 << LEVEL0_BITS                  # first tick held by level 1
+LEVEL2 = 1 << (LEVEL0_BITS + LEVEL_BITS)   # first tick held by level 2
+
+
+def fire_ticks(wheel, until):
+    """{key: tick it fired on}, advancing one tick at a time up to `until`."""
+    fired = {}
+    for tick in range(wheel._tick, until + 1):
+        for key in wheel.advance(tick * wheel.resolution):
+            fired[key] = tick
+    return fired
+
+
+def test_fires_on_the_first_tick_at_or_after_the_deadline():
+    wheel = TimerWheel(resolution=0.25)
+    wheel.schedule("exact", 2.5)
+    wheel.schedule("between", 2.6)
+    assert wheel.advance(2.49) == []
+    assert wheel.advance(2.5) == ["exact"]
+    assert wheel.advance(2.74) == []
+    assert wheel.advance(2.75) == ["between"]
+    assert len(wheel) == 0
+
+
+def test_fires_in_deadline_order_and_past_deadlines_at_once():
+    wheel = TimerWheel(resolution=1.0, now=100.0)
+    for key, when in (("c", 130.0), ("a", 110.0), ("b", 120.0)):
+        wheel.schedule(key, when)
+    wheel.schedule("late", 50.0)
+    assert wheel.advance(100.0) == ["late"]
+    assert wheel.advance(200.0) == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("start", [0, 1000])
+def test_cascades_across_level_boundaries(start):
+    wheel = TimerWheel(resolution=1.0, now=float(start))
+    deadlines = {
+        "level0 last": start + LEVEL1 - 1,
+        "level1 first": start + LEVEL1,
+        "level1 second": start + LEVEL1 + 1,
+        "level1 mid": start + 3 * LEVEL1 + 17,
+        "level1 last": start + LEVEL2 - 1,
+        "level2 first": start + LEVEL2,
+        "level2 later": start + LEVEL2 + LEVEL1 + 5,
+    }
+    for key, tick in deadlines.items():
+        wheel.schedule(key, float(tick))
+
+    assert fire_ticks(wheel, start + LEVEL2 + 2 * LEVEL1) == deadlines
+    assert len(wheel) == 0
+
+
+def test_deadline_beyond_the_horizon_is_clamped():
+    wheel = TimerWheel(resolution=1.0)
+    horizon = wheel._span - 1
+    wheel.schedule("far", 10.0 * wheel._span)
+    wheel.schedule("near", 5.0)
+    assert "far" in wheel
+    assert wheel._where["far"]["far"] == horizon
+    assert wheel.advance(LEVEL2 * 2.0) == ["near"]
+    assert "far" in wheel
+
+
+def test_rearm_moves_the_timer():
+    wheel = TimerWheel(resolution=1.0)
+    wheel.schedule("a", 5.0)
+    wheel.schedule("a", 20.0)        # later, same level
+    wheel.schedule("b", 1000.0)
+    wheel.schedule("b", 3.0)         # from level 1 down to level 0
+    wheel.schedule("c", 3.0)
+    wheel.schedule("c", LEVEL2 + 7.0)  # from level 0 up to level 2
+    assert len(wheel) == 3
+    assert fire_ticks(wheel, LEVEL2 + 10) == {"b": 3, "a": 20, "c": LEVEL2 + 7}
+
+
+def test_rearm_after_firing():
+    wheel = TimerWheel(resolution=1.0)
+    wheel.schedule("a", 2.0)
+    assert wheel.advance(2.0) == ["a"]
+    assert "a" not in wheel
+    wheel.schedule("a", 300.0)
+    assert fire_ticks(wheel, 400) == {"a": 300}
+
+
+def test_cancel():
+    wheel = TimerWheel(resolution=1.0)
+    wheel.schedule("a", 5.0)
+    wheel.schedule("b", 5.0)
+    wheel.schedule("far", 5000.0)
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    assert not wheel.cancel("never armed")
+    assert wheel.cancel("far")
+    assert "a" not in wheel and len(wheel) == 1
+    assert fire_ticks(wheel, 6000) == {"b": 5}
+    assert not wheel.cancel("b")
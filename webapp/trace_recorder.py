@@ -0,0 +1,74 @@
+"""
+GuardianLink trace recorder
+Appends every raw input sample (/ingest, BLE, simulator) to an NDJSON file
+so it can be replayed later with loadgen.py
+
+Each line is the sample as received plus two fields:
+  "t":   server receive time (epoch seconds)
+  "src": "ingest", "ble" or "simulator"
+
+Like the history store, recording only appends to a deque; a background
+thread does the file I/O.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+FLUSH_INTERVAL = 0.5
+
+
+class TraceRecorder:
+    """Buffered NDJSON trace writer; inactive until start() is called."""
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+
+    def record(self, source, sample, ts=None):
+        """Queue one sample dict; no-op while the recorder is stopped."""
+        if not self._running:
+            return
+        self._pending.append((time.time() if ts is None else ts, source, sample))
+
+    def _writer_loop(self):
+        pending = self._pending
+        with open(self.path, "a", buffering=1024 * 1024) as f:
+            while True:
+                self._wake.wait(FLUSH_INTERVAL)
+                self._wake.clear()
+                stopping = not self._running
+                while pending:
+                    ts, source, sample = pending.popleft()
+                    line = dict(sample, t=ts, src=source)
+                    f.write(json.dumps(line, default=str))
+                    f.write("\n")
+                f.flush()
+                if stopping:
+                    return
+
+
+def read_trace(path):
+    """Yield trace records (dicts) from an NDJSON trace file, in file order."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
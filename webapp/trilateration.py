@@ -0,0 +1,211 @@
+"""
+GuardianLink trilateration
+Fuses the RSSI distances that several observers (parent phones, fixed
+gateways) measure to one bracelet into a position with an uncertainty
+radius
+
+Each device keeps the latest observation per observer in a fixed-size
+ObservationWindow. Its arrays are allocated once, so adding a sample or
+solving allocates nothing per observer. solve() runs weighted Gauss-Newton
+least squares in a local tangent plane around the observers. With two
+unknowns the normal equations (J^T W J) dp = J^T W r form a 2x2 system.
+It is accumulated in scalars and solved in closed form, so one iteration
+costs O(observers) float operations.
+
+Weights are 1 / sigma_i^2 with sigma_i proportional to the measured
+distance. Log-normal shadowing makes the error of an RSSI distance grow
+linearly with range, so the nearest observers dominate the fix.
+"""
+import math
+from array import array
+from typing import NamedTuple
+
+EARTH_RADIUS = 6371000  # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Observers remembered per device; the stalest is replaced when full
+MAX_OBSERVERS = 8
+
+# Seconds an observation stays in the window
+DEFAULT_WINDOW = 10.0
+
+# Observers needed for an unambiguous 2-D fix
+MIN_OBSERVERS = 3
+
+# Relative 1-sigma error of one RSSI distance: ln(10) / (10 n) * sigma_dB,
+# ~0.26 for a path-loss exponent of 3.5 and 4 dB of shadowing
+DISTANCE_SIGMA = 0.25
+
+# Distances below this (meters) are weighted as if they were this far
+MIN_DISTANCE = 1.0
+
+# Gauss-Newton stops once a step is below this fraction of the 1-sigma
+# radius; refining further moves the fix by less than its own noise
+MAX_ITERATIONS = 10
+CONVERGED = 0.05
+
+
+class Fix(NamedTuple):
+    """Trilaterated position; `accuracy` is the 1-sigma radius in meters."""
+    lat: float
+    lng: float
+    accuracy: float
+    observers: int
+
+
+class ObservationWindow:
+    """
+    Latest (lat, lng, distance, ts) per observer for one device, in
+    preallocated arrays. The same arrays hold solve()'s projected
+    coordinates and weights.
+    """
+
+    __slots__ = ("_ids", "_obs", "_xyw", "_count")
+
+    def __init__(self, size=MAX_OBSERVERS):
+        self._ids = [None] * size
+        self._obs = array("d", bytes(8 * 4 * size))  # lat, lng, distance, ts
+        self._xyw = array("d", bytes(8 * 3 * size))  # x, y, weight (solve scratch)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, observer, lat, lng, distance, ts):
+        """Record an observer's latest position and distance to the device."""
+        ids = self._ids
+        count = self._count
+        try:
+            slot = ids.index(observer, 0, count)
+        except ValueError:
+            if count < len(ids):
+                slot = count
+                self._count = count + 1
+            else:
+                obs = self._obs
+                slot = min(range(count), key=lambda i: obs[4 * i + 3])
+            ids[slot] = observer
+        base = 4 * slot
+        obs = self._obs
+        obs[base] = lat
+        obs[base + 1] = lng
+        obs[base + 2] = distance
+        obs[base + 3] = ts
+
+    def expire(self, cutoff):
+        """Drop observations older than `cutoff` (epoch seconds)."""
+        ids = self._ids
+        obs = self._obs
+        i = 0
+        while i < self._count:
+            if obs[4 * i + 3] >= cutoff:
+                i += 1
+                continue
+            last = self._count - 1
+            ids[i] = ids[last]
+            ids[last] = None
+            obs[4 * i:4 * i + 4] = obs[4 * last:4 * last + 4]
+            self._count = last
+
+    def observations(self):
+        """The current observations as dicts (for the API)."""
+        obs = self._obs
+        return [{"observer": self._ids[i], "lat": obs[4 * i], "lng": obs[4 * i + 1],
+                 "distance": obs[4 * i + 2], "ts": obs[4 * i + 3]}
+                for i in range(self._count)]
+
+
+def solve(window, now, max_age=DEFAULT_WINDOW, min_observers=MIN_OBSERVERS):
+    """
+    Weighted least-squares position from a device's observation window.
+
+    Returns:
+        Fix, or None with fewer than `min_observers` fresh observations or
+        when they are (nearly) collinear
+    """
+    window.expire(now - max_age)
+    n = window._count
+    if n < min_observers:
+        return None
+    obs = window._obs
+    xyw = window._xyw
+
+    # Local tangent plane centered on the observers
+    lat0 = sum(obs[4 * i] for i in range(n)) / n
+    lng0 = sum(obs[4 * i + 1] for i in range(n)) / n
+    kx = METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    ky = METERS_PER_DEGREE
+    for i in range(n):
+        distance = max(obs[4 * i + 2], MIN_DISTANCE)
+        sigma = DISTANCE_SIGMA * distance
+        xyw[3 * i] = (obs[4 * i + 1] - lng0) * kx
+        xyw[3 * i + 1] = (obs[4 * i] - lat0) * ky
+        xyw[3 * i + 2] = 1.0 / (sigma * sigma)
+
+    x, y = _initial_guess(obs, xyw, n)
+    a11 = a12 = a22 = 0.0
+    for _ in range(MAX_ITERATIONS):
+        a11 = a12 = a22 = b1 = b2 = 0.0
+        for i in range(n):
+            dx = x - xyw[3 * i]
+            dy = y - xyw[3 * i + 1]
+            r = math.sqrt(dx * dx + dy * dy) or 1e-6
+            jx, jy = dx / r, dy / r
+            w = xyw[3 * i + 2]
+            e = obs[4 * i + 2] - r
+            a11 += w * jx * jx
+            a12 += w * jx * jy
+            a22 += w * jy * jy
+            b1 += w * jx * e
+            b2 += w * jy * e
+        det = a11 * a22 - a12 * a12
+        if det <= 1e-12 * (a11 + a22) ** 2:
+            return None  # observers in a line: mirror ambiguity
+        step_x = (a22 * b1 - a12 * b2) / det
+        step_y = (a11 * b2 - a12 * b1) / det
+        x += step_x
+        y += step_y
+        if (step_x * step_x + step_y * step_y) * det < CONVERGED * CONVERGED * (a11 + a22):
+            break
+
+    # Covariance (J^T W J)^-1, scaled up when the residuals are larger than
+    # the distance model expects
+    chi2 = 0.0
+    for i in range(n):
+        dx = x - xyw[3 * i]
+        dy = y - xyw[3 * i + 1]
+        e = obs[4 * i + 2] - math.sqrt(dx * dx + dy * dy)
+        chi2 += xyw[3 * i + 2] * e * e
+    scale = max(1.0, chi2 / (n - 2)) if n > 2 else 1.0
+    accuracy = math.sqrt(scale * (a11 + a22) / det)
+
+    return Fix(round(lat0 + y / ky, 6), round(lng0 + x / kx, 6), round(accuracy, 1), n)
+
+
+def _initial_guess(obs, xyw, n):
+    """
+    Linearized solution: subtracting the last observer's circle equation
+    from the others leaves a linear system in (x, y). Falls back to the
+    weighted centroid of the observers when that system is singular.
+    """
+    xr, yr = xyw[3 * (n - 1)], xyw[3 * (n - 1) + 1]
+    dr = obs[4 * (n - 1) + 2]
+    a11 = a12 = a22 = b1 = b2 = 0.0
+    for i in range(n - 1):
+        xi, yi = xyw[3 * i], xyw[3 * i + 1]
+        di = obs[4 * i + 2]
+        ax = 2.0 * (xr - xi)
+        ay = 2.0 * (yr - yi)
+        c = di * di - dr * dr - xi * xi - yi * yi + xr * xr + yr * yr
+        w = xyw[3 * i + 2]
+        a11 += w * ax * ax
+        a12 += w * ax * ay
+        a22 += w * ay * ay
+        b1 += w * ax * c
+        b2 += w * ay * c
+    det = a11 * a22 - a12 * a12
+    if det > 1e-12 * (a11 + a22) ** 2:
+        return (a22 * b1 - a12 * b2) / det, (a11 * b2 - a12 * b1) / det
+    total = sum(xyw[3 * i + 2] for i in range(n))
+    return (sum(xyw[3 * i] * xyw[3 * i + 2] for i in range(n)) / total,
+            sum(xyw[3 * i + 1] * xyw[3 * i + 2] for i in range(n)) / total)
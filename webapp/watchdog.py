@@ -0,0 +1,184 @@
+"""
+GuardianLink last-seen watchdog
+Notices devices that stopped sending samples, from any source, without
+scanning the fleet
+
+TimerWheel is a hierarchical timing wheel (Varghese & Lauck, as in the
+Linux kernel's timer lists). Level 0 has 256 slots of one tick each. Every
+level above has 64 slots, each spanning a whole rotation of the level
+below. A timer goes into the lowest level whose range covers its
+deadline. When a level's rotation completes, the next slot of the level
+above is "cascaded": its timers are redistributed into lower levels.
+Scheduling and cancelling are O(1). A tick costs O(1) plus the timers
+that fire (and, once per rotation, those cascaded), whatever the number
+of timers.
+
+Watchdog keeps one timer per device and moves it to now + timeout on
+every sample (a cancel and an insert, both O(1)). A timer that fires
+therefore always means a lost device, and a tick only touches those:
+devices that keep reporting cost nothing per tick, however many there
+are.
+"""
+import math
+
+# Slots per level: 2^8 at level 0, 2^6 above (4 levels cover 2^26 ticks)
+LEVEL0_BITS = 8
+LEVEL_BITS = 6
+LEVELS = 4
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel of keyed one-shot timers.
+
+    Args:
+        resolution: seconds per tick; timers fire on the first tick at or
+            after their deadline, never before it
+        now: time of tick 0's start, on the caller's clock
+    """
+
+    def __init__(self, resolution=0.25, now=0.0):
+        self.resolution = resolution
+        self._tick = math.floor(now / resolution)  # next tick to process
+        self._shifts = [0] + [LEVEL0_BITS + LEVEL_BITS * i for i in range(LEVELS - 1)]
+        self._wheels = [[{} for _ in range(1 << LEVEL0_BITS)]] + [
+            [{} for _ in range(1 << LEVEL_BITS)] for _ in range(LEVELS - 1)]
+        self._level0 = self._wheels[0]
+        self._span = 1 << (LEVEL0_BITS + LEVEL_BITS * (LEVELS - 1))
+        self._where = {}  # key -> the slot dict holding its timer
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, when):
+        """Arm (or re-arm) `key`'s timer for time `when`."""
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+        expires = math.ceil(when / self.resolution)
+        delta = expires - self._tick
+        if 0 <= delta < 1 << LEVEL0_BITS:
+            # Common case (deadline within one level-0 rotation) inlined
+            slot = self._level0[expires & ((1 << LEVEL0_BITS) - 1)]
+            slot[key] = expires
+            self._where[key] = slot
+        else:
+            self._insert(key, expires)
+
+    def cancel(self, key):
+        """Disarm `key`'s timer; False if it had none."""
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def _insert(self, key, expires):
+        delta = expires - self._tick
+        if delta < 0:
+            expires, delta = self._tick, 0
+        elif delta >= self._span:
+            # Beyond the wheel's horizon (2^26 ticks, ~194 days at 0.25 s):
+            # fires at the horizon instead
+            expires, delta = self._tick + self._span - 1, self._span - 1
+        level = 0
+        while level < LEVELS - 1 and delta >= 1 << self._shifts[level + 1]:
+            level += 1
+        wheel = self._wheels[level]
+        slot = wheel[(expires >> self._shifts[level]) & (len(wheel) - 1)]
+        slot[key] = expires
+        self._where[key] = slot
+
+    def _cascade(self, level):
+        """Move the current slot of `level` down; True if it wrapped too."""
+        wheel = self._wheels[level]
+        index = (self._tick >> self._shifts[level]) & (len(wheel) - 1)
+        slot = wheel[index]
+        if slot:
+            timers = list(slot.items())
+            slot.clear()
+            for key, expires in timers:
+                self._insert(key, expires)
+        return index == 0
+
+    def advance(self, now):
+        """
+        Process every tick up to `now` and return the keys whose timers
+        fired, in deadline order. Their timers are disarmed.
+        """
+        fired = []
+        target = math.floor(now / self.resolution)
+        level0 = self._level0
+        mask = len(level0) - 1
+        while self._tick <= target:
+            index = self._tick & mask
+            if index == 0:
+                level = 1
+                while level < LEVELS and self._cascade(level):
+                    level += 1
+            slot = level0[index]
+            if slot:
+                fired.extend(slot)
+                for key in slot:
+                    del self._where[key]
+                slot.clear()
+            self._tick += 1
+        return fired
+
+
+class Watchdog:
+    """
+    Last-seen tracking for many keys with one timeout. Not thread-safe;
+    the server calls it under its state lock.
+
+    Args:
+        timeout: seconds of silence before a key is lost
+        resolution: tick length; a loss is reported up to this late
+        now: start time on the caller's (monotonic) clock
+    """
+
+    def __init__(self, timeout, resolution=0.25, now=0.0):
+        self.timeout = timeout
+        self._wheel = TimerWheel(resolution, now)
+        self._last_seen = {}
+        self.lost = set()
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def seen(self, key, now):
+        """
+        Record a sample for `key`. Returns the seconds it was silent if it
+        had been lost (it has now recovered), else None.
+        """
+        if key in self.lost:
+            self.lost.discard(key)
+            silent = now - self._last_seen[key]
+        else:
+            silent = None
+        self._last_seen[key] = now
+        self._wheel.schedule(key, now + self.timeout)
+        return silent
+
+    def expire(self, now):
+        """
+        Advance to `now`; returns [(key, seconds silent)] for the keys that
+        just became lost. Each is reported once until it is seen again.
+        """
+        lost = []
+        for key in self._wheel.advance(now):
+            self.lost.add(key)
+            lost.append((key, now - self._last_seen[key]))
+        return lost
+
+    def set_timeout(self, timeout):
+        """Change the timeout; a device's timer picks it up at its next sample."""
+        self.timeout = timeout
+
+    def forget(self, key):
+        self._wheel.cancel(key)
+        self._last_seen.pop(key, None)
+        self.lost.discard(key)